@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+显示解码基准测试
+对比原来的全尺寸解码 + LANCZOS 与 draft解码 + 各种滤波器的每张耗时(ms)
+
+用法: python benchmarks/bench_display_decoder.py [--count 40] [--width 4000] [--height 3000]
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from display_decoder import DisplayDecoder, lanczos_decoder
+from synthetic import make_corpus
+
+
+def time_decoder(decoder, paths, repeat=3):
+    """返回最快一轮的平均每张耗时(ms)"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            decoder(path)
+        elapsed = (time.perf_counter() - start) / len(paths) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Display decoder benchmark")
+    parser.add_argument('--count', type=int, default=40)
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Generating {args.count} synthetic {args.width}x{args.height} JPEGs...")
+        paths = make_corpus(tmp, args.count, args.width, args.height)
+
+        decoders = [('full decode + lanczos (current)', lanczos_decoder)]
+        for resample in ('lanczos', 'bicubic', 'bilinear', 'nearest'):
+            decoders.append((f'draft + {resample}', DisplayDecoder(resample=resample)))
+
+        baseline = None
+        for name, decoder in decoders:
+            ms = time_decoder(decoder, paths)
+            baseline = baseline or ms
+            print(f"  {name:34s} {ms:8.2f} ms/image  ({baseline / ms:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
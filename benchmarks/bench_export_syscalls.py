@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导出元数据扫描的系统调用计数
+对比原来导出时的三次目录遍历 + 每文件多次stat，与现在一次scandir生成的元数据表
+
+用法: python benchmarks/bench_export_syscalls.py [--dir-files 31773] [--task-size 10000] [--labeled 6000]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import dir_index
+from synthetic import synthetic_names
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.jpe', '.png', '.bmp', '.gif', '.tiff'}
+
+
+class _CountingEntry:
+    """包装DirEntry，统计需要系统调用的stat()"""
+
+    def __init__(self, entry, counter):
+        self._entry = entry
+        self._counter = counter
+        self.name = entry.name
+        self.path = entry.path
+
+    def is_file(self):
+        return self._entry.is_file()
+
+    def is_dir(self):
+        return self._entry.is_dir()
+
+    def stat(self):
+        self._counter.counts['stat'] += 1
+        return self._entry.stat()
+
+
+class _CountingScandir:
+    def __init__(self, iterator, counter):
+        self._iterator = iterator
+        self._counter = counter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._iterator.close()
+
+    def __iter__(self):
+        for entry in self._iterator:
+            yield _CountingEntry(entry, self._counter)
+
+
+class SyscallCounter:
+    """在Python层统计 stat / listdir / scandir 调用次数"""
+
+    def __enter__(self):
+        self.counts = {'stat': 0, 'listdir': 0, 'scandir': 0}
+        self._originals = (os.stat, os.listdir, os.scandir)
+        real_stat, real_listdir, real_scandir = self._originals
+
+        def stat(*args, **kwargs):
+            self.counts['stat'] += 1
+            return real_stat(*args, **kwargs)
+
+        def listdir(*args, **kwargs):
+            self.counts['listdir'] += 1
+            return real_listdir(*args, **kwargs)
+
+        def scandir(*args, **kwargs):
+            self.counts['scandir'] += 1
+            return _CountingScandir(real_scandir(*args, **kwargs), self)
+
+        os.stat, os.listdir, os.scandir = stat, listdir, scandir
+        return self
+
+    def __exit__(self, *exc):
+        os.stat, os.listdir, os.scandir = self._originals
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+def legacy_export_scan(images_dir, task_image_names, labeled_files):
+    """原来 export_results + generate_report 中的文件系统访问（不含实际复制）"""
+    labeling_data = []
+    for filename in labeled_files:
+        path = images_dir / filename
+        if path.exists():
+            labeling_data.append((filename, path.stat().st_size,
+                                  datetime.fromtimestamp(path.stat().st_mtime)))
+
+    for filename in labeled_files:
+        (images_dir / filename).exists()
+
+    # export_results 中找未标注文件，generate_report 中统计未标注数量
+    for _ in range(2):
+        for file_path in images_dir.iterdir():
+            if file_path.is_file() and file_path.suffix.lower() in IMAGE_EXTENSIONS:
+                if file_path.name in task_image_names and file_path.name not in labeled_files:
+                    pass
+
+    # generate_report 中列出未标注文件
+    for file_path in images_dir.iterdir():
+        if file_path.is_file() and file_path.suffix.lower() in IMAGE_EXTENSIONS:
+            if file_path.name in task_image_names and file_path.name not in labeled_files:
+                file_path.stat().st_size
+                file_path.stat().st_mtime
+    return labeling_data
+
+
+def single_pass_export_scan(images_dir, task_image_names, labeled_files):
+    """现在的方式：一次scandir生成元数据表"""
+    return dir_index.scan_file_table(images_dir, task_image_names | labeled_files.keys())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export metadata syscall benchmark")
+    parser.add_argument('--dir-files', type=int, default=31773, help="Files in the images directory")
+    parser.add_argument('--task-size', type=int, default=10000)
+    parser.add_argument('--labeled', type=int, default=6000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        images_dir = Path(tmp)
+        names = synthetic_names(args.dir_files)
+        for name in names:
+            (images_dir / name).touch()
+
+        task_image_names = set(names[:args.task_size])
+        labeled_files = {name: 'highQuality' for name in names[:args.labeled]}
+
+        for label, scan in (('before (3x iterdir + per-file stat)', legacy_export_scan),
+                            ('after  (single scandir table)', single_pass_export_scan)):
+            dir_index.invalidate()
+            start = time.perf_counter()
+            with SyscallCounter() as counter:
+                scan(images_dir, task_image_names, labeled_files)
+            elapsed = (time.perf_counter() - start) * 1000
+            detail = ', '.join(f"{k}={v}" for k, v in counter.counts.items())
+            print(f"  {label:38s} {counter.total:8d} calls ({detail})  {elapsed:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+标注流程基准测试
+在临时项目目录中生成合成JPEG图片集，无界面（virtual_tk）驱动 TaskSplitter.generate_tasks、
+ImageLabeler 的任务加载、重建待标注队列、模拟按键标注（逐次和连续快速按键）、undo_last_label 和 export_results，
+并直接用 LabelSession（不经过界面）标注第二个任务，报告各阶段的吞吐量和峰值内存，并与保存的基准结果比较（变慢或内存增长超过容差时退出码为1）。
+整个流程默认跑3次，每个阶段取最快的一次以减小机器负载造成的波动。
+
+用法:
+    python benchmarks/bench_labeler.py [--images 2000] [--width 1600] [--height 1200]
+                                       [--task-size 1000] [--keypresses 300] [--undo 50]
+    python benchmarks/bench_labeler.py --save-baseline          # 保存为新的基准
+    python benchmarks/bench_labeler.py --tolerance 0.5          # 与基准比较的容差（默认0.4）
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import shutil
+import resource
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+import task_splitter
+import image_labeler
+from label_session import LabelSession
+from virtual_tk import install, VirtualRoot, VirtualEvent
+from synthetic import make_corpus
+
+DEFAULT_BASELINE = BENCH_DIR / "baseline_labeler.json"
+
+# 与基准比较时只比较这些配置相同的结果
+CONFIG_KEYS = ('images', 'width', 'height', 'task_size', 'keypresses', 'undo')
+
+
+def peak_rss_mb():
+    """进程到目前为止的峰值常驻内存 (MB)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform != 'darwin' else peak / (1024 * 1024)
+
+
+class Recorder:
+    """记录每个阶段的耗时、操作数和阶段结束时的峰值内存"""
+
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, ops, func, repeat=1):
+        """执行 func repeat 次，取最快一次的耗时（可重复的短阶段多跑几次以减小波动）"""
+        seconds = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+        self.results[name] = {
+            'seconds': round(seconds, 4),
+            'ops': ops,
+            'ops_per_sec': round(ops / seconds, 1) if seconds > 0 else None,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+        print(f"  {name:16s} {ops:7d} ops {seconds * 1000:10.1f} ms "
+              f"{self.results[name]['ops_per_sec']:10.1f} ops/s   peak RSS {self.results[name]['peak_rss_mb']:.0f} MB")
+
+
+def run_benchmarks(args, project_dir):
+    """在 project_dir 中跑完整流程，返回 (各阶段结果, 热路径耗时百分位)"""
+    messagebox = install(task_splitter, image_labeler)
+    recorder = Recorder()
+
+    print(f"Generating {args.images} synthetic {args.width}x{args.height} JPEGs...")
+    make_corpus(project_dir / "images", args.images, args.width, args.height)
+
+    # 任务分割（TaskSplitter 启动时扫描目录，generate_tasks 按顺序写出任务文件）；
+    # 计时的几次写到临时任务目录，最后一次不计时，写到项目的 tasks 目录供后面的阶段使用
+    split_runs = iter(range(args.repeat + 1))
+
+    def split(tasks_dir=None):
+        splitter = task_splitter.TaskSplitter(VirtualRoot(), project_dir=project_dir)
+        splitter.tasks_dir = tasks_dir or project_dir / f"tasks_split_{next(split_runs)}"
+        splitter.task_size.set(args.task_size)
+        splitter.shuffle_seed.set(42)
+        splitter.generate_tasks()
+    recorder.run('split', args.images, split, repeat=args.repeat)
+    split(project_dir / "tasks")
+
+    # 启动标注工具并加载第一个任务（后台线程 + ui_queue，由 VirtualRoot 驱动）
+    root = VirtualRoot()
+    app = None
+
+    def load_task():
+        nonlocal app
+        app = image_labeler.ImageLabeler(root, metrics=True, project_dir=project_dir)
+        root.run_until(lambda: app.current_task is not None and app.current_image_path is not None)
+    recorder.run('load_task', args.task_size, load_task)
+
+    recorder.run('get_task_images', args.task_size, app.session.rebuild_queue, repeat=args.repeat)
+    app.session.go_to(0)
+
+    # 模拟按键：每次标注后显示下一张图片（解码/缩放走预取和磁盘预览缓存），最后等最新的图片显示出来
+    keys = ('h', 'l', 's')
+    keypresses = min(args.keypresses, len(app.image_files) // 2)
+
+    def press(key):
+        app.handle_keypress(VirtualEvent(key))
+        app.handle_key_release(VirtualEvent(key))
+
+    def displayed():
+        return app.current_image_path == app.session.current_path and not app.dirty and not app.pending_commands
+
+    def label():
+        for i in range(keypresses):
+            press(keys[i % len(keys)])
+            root.run_idle()
+        root.run_until(displayed)
+    recorder.run('label_keypress', keypresses, label)
+
+    # 连续快速按键（每10次按键之间才空闲一次）：显示只跟上最新的位置，中间的图片不解码不显示
+    burst = min(keypresses, len(app.image_files) - app.current_image_index - 1)
+
+    def label_burst():
+        for i in range(burst):
+            press(keys[i % len(keys)])
+            if i % 10 == 9:
+                root.run_idle()
+        root.run_until(displayed)
+    recorder.run('label_burst', burst, label_burst)
+
+    undo_count = min(args.undo, keypresses + burst)
+
+    def undo():
+        for _ in range(undo_count):
+            app.undo_last_label()
+            root.run_idle()
+    recorder.run('undo', undo_count, undo)
+
+    app.export_strategy.set('hardlink')
+    recorder.run('export', args.task_size, app.export_results)
+
+    print("\nHot path latency (ms):")
+    app.on_close()  # --metrics 时关闭时打印各阶段耗时
+    errors = messagebox.errors()
+    if errors:
+        raise RuntimeError(f"Error dialogs during benchmark: {errors}")
+
+    # 无界面的标注核心：在下一个任务上逐张标注（不解码、不显示），测量标注和进度写盘本身的吞吐量
+    tasks = sorted(path.name for path in (project_dir / "tasks").glob("task_*.json"))
+    if len(tasks) > 1:
+        session = LabelSession(project_dir)
+        session.load_task(tasks[1])
+        count = len(session.image_files)
+
+        def session_label():
+            for i in range(count):
+                session.label(keys[i % len(keys)], advance=True)
+        recorder.run('session_label', count, session_label)
+        session.close()
+    return recorder.results, app.metrics.snapshot()
+
+
+def best_of(run_results):
+    """多次运行中每个阶段最快的一次；峰值内存随进程只增不减，取最小值即第一次运行的值"""
+    best = {}
+    for results in run_results:
+        for name, entry in results.items():
+            current = best.get(name)
+            if current is None:
+                best[name] = dict(entry)
+                continue
+            if (entry['ops_per_sec'] or 0) > (current['ops_per_sec'] or 0):
+                current.update(seconds=entry['seconds'], ops_per_sec=entry['ops_per_sec'])
+            current['peak_rss_mb'] = min(current['peak_rss_mb'], entry['peak_rss_mb'])
+    return best
+
+
+def compare(results, baseline, tolerance):
+    """与基准比较，返回回归列表"""
+    regressions = []
+    for name, base in baseline['results'].items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if base.get('ops_per_sec') and current['ops_per_sec'] < base['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: {current['ops_per_sec']} ops/s, baseline {base['ops_per_sec']} ops/s")
+        if current['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {current['peak_rss_mb']} MB, baseline {base['peak_rss_mb']} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Labeler and splitter hot path benchmark")
+    parser.add_argument('--images', type=int, default=2000)
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--task-size', type=int, default=1000)
+    parser.add_argument('--keypresses', type=int, default=300)
+    parser.add_argument('--undo', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20, help="Runs of the split and get_task_images stages (fastest is reported)")
+    parser.add_argument('--runs', type=int, default=3, help="Full runs; the fastest run of each stage is reported")
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.4, help="Allowed slowdown / memory growth ratio")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    parser.add_argument('--keep', action='store_true', help="Keep the temporary project directory")
+    args = parser.parse_args()
+    if args.task_size > args.images:
+        parser.error("--task-size must not exceed --images")
+
+    config = {key: getattr(args, key) for key in CONFIG_KEYS}
+    runs = []
+    for run in range(args.runs):
+        print(f"Run {run + 1}/{args.runs}")
+        tmp = tempfile.mkdtemp(prefix="bench_labeler_")
+        try:
+            runs.append(run_benchmarks(args, Path(tmp)))
+        finally:
+            if args.keep:
+                print(f"Project directory kept: {tmp}")
+            else:
+                shutil.rmtree(tmp, ignore_errors=True)
+    results = best_of(result for result, _ in runs)
+    stages = runs[-1][1]
+    if args.runs > 1:
+        print("\nBest of runs:")
+        for name, entry in results.items():
+            print(f"  {name:16s} {entry['ops_per_sec']:10.1f} ops/s   peak RSS {entry['peak_rss_mb']:.0f} MB")
+
+    report = {'config': config, 'python': sys.version.split()[0], 'cpus': os.cpu_count(),
+              'results': results, 'stages': stages}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved: {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"\nNo baseline at {baseline_path} (run with --save-baseline)")
+        return 0
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('config') != config:
+        print(f"\nBaseline was recorded with a different configuration {baseline.get('config')}, not compared")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nRegressions against {baseline_path.name} (tolerance {args.tolerance:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nNo regressions against {baseline_path.name} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
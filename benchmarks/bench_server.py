@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Web标注服务负载测试
+在临时项目目录中生成合成JPEG图片集并分割任务，在本进程中启动 label_server，
+由若干个模拟标注者（每个一个线程、一个保持连接的HTTP连接、各自一个任务）按
+领取队列 -> 取图片 -> 提交标注 的顺序标注，最后用 If-None-Match 重新验证一张图片。
+报告总吞吐量、各请求的 p50/p95/p99 和服务器图片缓存的命中情况。
+
+用法:
+    python benchmarks/bench_server.py [--clients 4] [--images 2000] [--task-size 500]
+                                      [--labels 300] [--width 1600] [--height 1200] [--think-ms 0]
+"""
+
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+import http.client
+from pathlib import Path
+from urllib.parse import quote
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+import task_splitter
+from label_server import LabelServer
+from latency_metrics import LatencyMetrics
+from synthetic import make_corpus
+
+LABELS = ('highQuality', 'lowQuality', 'skip')
+
+
+class ServerThread:
+    """在后台线程的事件循环中运行 LabelServer"""
+
+    def __init__(self, server):
+        self.server = server
+        self.address = None
+        self._ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._task = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+
+        def ready(address):
+            self.address = address
+            self._ready.set()
+        self._task = self._loop.create_task(self.server.serve('127.0.0.1', 0, ready=ready))
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+
+    def start(self):
+        self._thread.start()
+        if not self._ready.wait(60):
+            raise TimeoutError("server did not start")
+        return self.address
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._task.cancel)
+        self._thread.join(60)
+
+
+class Client:
+    """一个模拟标注者（保持连接的HTTP客户端）"""
+
+    def __init__(self, address, annotator, metrics):
+        self.connection = http.client.HTTPConnection(*address, timeout=120)
+        self.annotator = annotator
+        self.metrics = metrics
+
+    def call(self, stage, method, path, payload=None, headers=None):
+        headers = dict(headers or {}, **{'X-Annotator': self.annotator})
+        body = None
+        if payload is not None:
+            body = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        with self.metrics.stage(stage):
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path}: {response.status} {data[:200]!r}")
+        return response, data
+
+    def run(self, task, labels, think):
+        """标注 labels 张图片，返回实际标注数"""
+        self.call('task', 'POST', '/api/task', {'task': task})
+        done = 0
+        while done < labels:
+            _, data = self.call('queue', 'GET', '/api/queue?limit=100')
+            names = json.loads(data)['images']
+            if not names:
+                break
+            for name in names[:labels - done]:
+                response, _ = self.call('image', 'GET', f"/img/{quote(name)}")
+                etag = response.getheader('ETag')
+                if think:
+                    time.sleep(think)
+                self.call('label', 'POST', '/api/labels', {'labels': [{'image': name, 'label': LABELS[done % 3]}]})
+                done += 1
+
+        # 浏览器缓存重新验证：应返回304且没有图片数据
+        response, data = self.call('revalidate', 'GET', f"/img/{quote(name)}", headers={'If-None-Match': etag})
+        if response.status != 304 or data:
+            raise RuntimeError(f"Revalidation returned {response.status} with {len(data)} bytes")
+        self.connection.close()
+        return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the web labeling server")
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--images', type=int, default=2000)
+    parser.add_argument('--task-size', type=int, default=500)
+    parser.add_argument('--labels', type=int, default=300, help="Images labeled by each client")
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--think-ms', type=float, default=0, help="Pause between seeing an image and labeling it")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    parser.add_argument('--keep', action='store_true', help="Keep the temporary project directory")
+    args = parser.parse_args()
+    if args.clients * args.task_size > args.images:
+        parser.error("--clients x --task-size must not exceed --images (one task per client)")
+
+    project_dir = Path(tempfile.mkdtemp(prefix="bench_server_"))
+    try:
+        print(f"Generating {args.images} synthetic {args.width}x{args.height} JPEGs...")
+        make_corpus(project_dir / "images", args.images, args.width, args.height)
+        task_splitter.run_cli(['split', '--images-dir', str(project_dir / "images"),
+                               '--tasks-dir', str(project_dir / "tasks"),
+                               '--task-size', str(args.task_size), '--seed', '42'])
+        tasks = sorted(path.name for path in (project_dir / "tasks").glob("task_*.json"))
+
+        server = LabelServer(project_dir, metrics=LatencyMetrics(enabled=True))
+        server_thread = ServerThread(server)
+        address = server_thread.start()
+        client_metrics = LatencyMetrics(enabled=True)
+        clients = [Client(address, f"bench{i}", client_metrics) for i in range(args.clients)]
+        counts = [0] * args.clients
+        errors = []
+
+        def run(i):
+            try:
+                counts[i] = clients[i].run(tasks[i], args.labels, args.think_ms / 1000)
+            except Exception as e:
+                errors.append(f"client {i}: {e}")
+
+        print(f"{args.clients} clients labeling {args.labels} images each...")
+        started = time.perf_counter()
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        image_stats = server.images.stats()
+        server_thread.stop()
+        if errors:
+            raise RuntimeError("; ".join(errors))
+
+        # 停止服务时缓冲的标注已写入各任务的进度文件
+        saved = 0
+        for task in tasks[:args.clients]:
+            task_id = json.loads((project_dir / "tasks" / task).read_text(encoding='utf-8'))['task_id']
+            progress = json.loads((project_dir / "progress" / f"task_progress_{task_id}.json").read_text(encoding='utf-8'))
+            saved += len(progress['labeled_files'])
+
+        total = sum(counts)
+        print(f"\nLabeled {total} images in {elapsed:.2f} s: {total / elapsed:.1f} labels/s "
+              f"({saved} saved to progress files)")
+        print(f"Server image cache: {image_stats}")
+        print("\nClient request latency (ms):")
+        print(client_metrics.format())
+        print("\nServer handling latency (ms):")
+        print(server.metrics.format())
+        if saved != total:
+            print(f"\nError: {total} labels posted but {saved} saved")
+            return 1
+
+        if args.output:
+            report = {'config': vars(args), 'labels_per_sec': round(total / elapsed, 1), 'images': image_stats,
+                      'client': client_metrics.snapshot(), 'server': server.metrics.snapshot()}
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        return 0
+    finally:
+        if args.keep:
+            print(f"Project directory kept: {project_dir}")
+        else:
+            shutil.rmtree(project_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成测试数据
+生成与真实数据命名一致（<UUID>_<n>_ac001001.jpg）的JPEG图片集
+"""
+
+import random
+import uuid
+from pathlib import Path
+from PIL import Image
+
+
+def synthetic_names(count, seed=0, frames_per_capture=4):
+    """生成与真实数据相同格式的文件名"""
+    rng = random.Random(seed)
+    names = []
+    while len(names) < count:
+        capture = uuid.UUID(int=rng.getrandbits(128)).hex.upper()
+        capture = f"{capture[:8]}-{capture[8:12]}-{capture[12:16]}-{capture[16:20]}-{capture[20:]}"
+        for frame in range(1, frames_per_capture + 1):
+            names.append(f"{capture}_{frame}_ac001001.jpg")
+    return names[:count]
+
+
+def synthetic_image(width, height, seed=0):
+    """生成带渐变和噪声的RGB图片（压缩后大小接近真实照片）"""
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    bands = []
+    for _ in range(3):
+        noise = Image.effect_noise((width, height), rng.uniform(20, 60))
+        bands.append(Image.blend(gradient, noise, rng.uniform(0.2, 0.6)))
+    return Image.merge('RGB', bands)
+
+
+def make_corpus(directory, count, width=4000, height=3000, seed=0, quality=90, distinct=8):
+    """在directory中生成count张JPEG；只渲染distinct张不同内容以节省生成时间"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    names = synthetic_names(count, seed)
+
+    templates = []
+    for i in range(min(distinct, count)):
+        path = directory / names[i]
+        synthetic_image(width, height, seed + i).save(path, 'JPEG', quality=quality)
+        templates.append(path.read_bytes())
+
+    for i, name in enumerate(names[len(templates):], len(templates)):
+        (directory / name).write_bytes(templates[i % len(templates)])
+
+    return [directory / name for name in names]
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+无界面运行 Tk 程序的替身
+把模块中的 tk / ttk / messagebox / filedialog / ImageTk 换成不画任何东西的对象，
+root.after / after_idle 的回调由 VirtualRoot.pump() 在当前线程中执行，
+这样基准测试可以直接驱动 TaskSplitter、ImageLabeler 的真实代码。
+
+注意：ImageTk.PhotoImage 只保存图片引用，PhotoImage 转换和实际绘制的耗时不计入。
+"""
+
+import heapq
+import itertools
+import time
+
+
+class VirtualWidget:
+    """接受任何参数、任何方法调用的控件；记录选项以便 cget / get 读取"""
+
+    def __init__(self, *args, **options):
+        self._options = dict(options)
+        self._value = ''
+
+    def configure(self, **options):
+        self._options.update(options)
+
+    config = configure
+
+    def cget(self, key):
+        return self._options.get(key)
+
+    def __setitem__(self, key, value):
+        self._options[key] = value
+
+    def __getitem__(self, key):
+        return self._options.get(key)
+
+    # Combobox / Entry
+    def get(self, *args):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+
+    # Treeview
+    def insert(self, *args, **kwargs):
+        return ''
+
+    def get_children(self, *args):
+        return ()
+
+    def winfo_toplevel(self):
+        return self
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
+
+
+class VirtualVar:
+    """tk.StringVar / IntVar / BooleanVar / DoubleVar"""
+
+    def __init__(self, master=None, value=None, name=None):
+        self._value = value
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+
+
+class VirtualRoot(VirtualWidget):
+    """主窗口：after / after_idle 回调进入队列，由 pump() 执行"""
+
+    def __init__(self):
+        super().__init__()
+        self._timers = []  # (到期时间, 序号, 回调)
+        self._idle = []
+        self._counter = itertools.count()
+        self._cancelled = set()
+        self.destroyed = False
+
+    def after(self, ms, func=None, *args):
+        if func is None:
+            time.sleep(ms / 1000)
+            return None
+        timer_id = next(self._counter)
+        heapq.heappush(self._timers, (time.monotonic() + ms / 1000, timer_id, lambda: func(*args)))
+        return timer_id
+
+    def after_idle(self, func, *args):
+        timer_id = next(self._counter)
+        self._idle.append((timer_id, lambda: func(*args)))
+        return timer_id
+
+    def after_cancel(self, timer_id):
+        self._cancelled.add(timer_id)
+
+    def destroy(self):
+        self.destroyed = True
+
+    def run_idle(self):
+        """执行所有空闲回调（回调中新加的也执行）"""
+        while self._idle:
+            idle, self._idle = self._idle, []
+            for timer_id, callback in idle:
+                if timer_id not in self._cancelled:
+                    callback()
+
+    def pump(self):
+        """执行空闲回调和所有已到期的定时回调"""
+        self.run_idle()
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, timer_id, callback = heapq.heappop(self._timers)
+            if timer_id not in self._cancelled:
+                callback()
+            self.run_idle()
+
+    def run_until(self, condition, timeout=60.0, interval=0.001):
+        """循环 pump() 直到 condition() 为真，超时抛出 TimeoutError"""
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                raise TimeoutError("condition not reached")
+            self.pump()
+            time.sleep(interval)
+
+
+class VirtualEvent:
+    """键盘事件（time 为毫秒时间戳，同一按键的按下和松开应使用不同的 time）"""
+
+    _clock = itertools.count(1)
+
+    def __init__(self, char='', keysym=None, state=0, keycode=None, time=None):
+        self.char = char
+        self.keysym = keysym or char
+        self.state = state
+        self.keycode = keycode if keycode is not None else ord(self.keysym[0].upper()) if self.keysym else 0
+        self.time = time if time is not None else next(VirtualEvent._clock)
+
+
+class _Namespace:
+    """模块替身：指定的名字返回给定对象，其余大写常量返回小写字符串，其余名字返回 VirtualWidget"""
+
+    def __init__(self, **names):
+        self.__dict__.update(names)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if name.isupper():
+            return name.lower()
+        return VirtualWidget
+
+
+class VirtualMessagebox:
+    """记录所有对话框；ask* 返回 answer"""
+
+    def __init__(self, answer=True):
+        self.answer = answer
+        self.shown = []  # (函数名, 标题, 内容)
+
+    def _show(self, kind):
+        def show(title=None, message=None, **kwargs):
+            self.shown.append((kind, title, message))
+            return self.answer if kind.startswith('ask') else 'ok'
+        return show
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self._show(name)
+
+    def errors(self):
+        return [(title, message) for kind, title, message in self.shown if kind == 'showerror']
+
+
+class _PhotoImage:
+    def __init__(self, image=None, **kwargs):
+        self.image = image
+
+
+def install(*modules, answer=True):
+    """替换模块中的 Tk 相关名字，返回记录对话框的 VirtualMessagebox"""
+    messagebox = VirtualMessagebox(answer)
+    tk = _Namespace(Tk=VirtualRoot, StringVar=VirtualVar, IntVar=VirtualVar, BooleanVar=VirtualVar,
+                    DoubleVar=VirtualVar)
+    ttk = _Namespace()
+    filedialog = _Namespace(askdirectory=lambda **kwargs: '', askopenfilename=lambda **kwargs: '')
+    image_tk = _Namespace(PhotoImage=_PhotoImage)
+    for module in modules:
+        for name, value in (('tk', tk), ('ttk', ttk), ('messagebox', messagebox),
+                            ('filedialog', filedialog), ('ImageTk', image_tk)):
+            if hasattr(module, name):
+                setattr(module, name, value)
+    return messagebox
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片目录索引
+一次 os.scandir 得到目录下全部文件名，按目录修改时间缓存，任务中的文件名在内存中解析；
+对远程目录（NFS、SMB等网络文件系统）改用线程池并行 stat；环境变量 LABELER_DIR_MODE=scan/stat/auto 可指定方式
+"""
+
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 任务图片数不超过此值时，auto模式直接并行stat，不必列出整个目录
+STAT_THRESHOLD = 256
+
+# 这些文件系统上列出整个目录很慢（逐批往返服务器），auto模式改用并行stat
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afs', '9p', 'ceph', 'glusterfs', 'lustre',
+                       'davfs', 'fuse.sshfs', 'fuse.glusterfs', 'fuse.rclone', 'fuse.s3fs', 'fuse.gcsfuse'}
+
+# 目录路径 -> (目录mtime_ns, 文件名集合)
+_listing_cache = {}
+_cache_lock = threading.Lock()
+_remote_cache = {}  # 目录路径 -> 是否在网络文件系统上
+
+
+def _mount_types():
+    """Linux：挂载点 -> 文件系统类型（读取 /proc/mounts）"""
+    mounts = {}
+    with open('/proc/mounts', 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 3:
+                # 挂载点中的空格等以八进制转义
+                mounts[re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), fields[1])] = fields[2]
+    return mounts
+
+
+def is_remote(directory):
+    """目录是否在网络文件系统上（无法判断时为False），结果按目录缓存"""
+    directory = os.path.realpath(os.fspath(directory))
+    with _cache_lock:
+        if directory in _remote_cache:
+            return _remote_cache[directory]
+
+    remote = False
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            drive = os.path.splitdrive(directory)[0]
+            remote = drive.startswith('\\\\') or (
+                bool(drive) and ctypes.windll.kernel32.GetDriveTypeW(drive + '\\') == 4)  # DRIVE_REMOTE
+        elif os.path.exists('/proc/mounts'):
+            mounts = _mount_types()
+            # 最长的挂载点前缀即目录所在的文件系统
+            path = directory
+            while path not in mounts and path != os.path.dirname(path):
+                path = os.path.dirname(path)
+            remote = mounts.get(path, '') in NETWORK_FILESYSTEMS
+    except (OSError, AttributeError, ValueError):
+        remote = False
+
+    with _cache_lock:
+        _remote_cache[directory] = remote
+    return remote
+
+
+def list_directory(directory):
+    """返回目录下的文件名集合（一次scandir，目录未变化时直接使用缓存）"""
+    directory = os.fspath(directory)
+    mtime_ns = os.stat(directory).st_mtime_ns
+
+    with _cache_lock:
+        cached = _listing_cache.get(directory)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+
+    with os.scandir(directory) as entries:
+        names = frozenset(entry.name for entry in entries if entry.is_file())
+
+    with _cache_lock:
+        _listing_cache[directory] = (mtime_ns, names)
+    return names
+
+
+def scan_file_table(directory, names):
+    """一次scandir遍历，返回names中存在的文件的 {文件名: (大小, 修改时间)}
+
+    每个需要的文件只stat一次，导出时CSV、复制和报告共用这张表。
+    顺便刷新目录列表缓存。
+    """
+    directory = os.fspath(directory)
+    wanted = names if isinstance(names, (set, frozenset, dict)) else set(names)
+    mtime_ns = os.stat(directory).st_mtime_ns
+
+    table = {}
+    all_names = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            all_names.append(entry.name)
+            if entry.name in wanted:
+                st = entry.stat()
+                table[entry.name] = (st.st_size, st.st_mtime)
+
+    with _cache_lock:
+        _listing_cache[directory] = (mtime_ns, frozenset(all_names))
+    return table
+
+
+def stat_names(directory, names, workers=32):
+    """用线程池并行检查文件是否存在，返回存在的文件名集合（适合远程目录）"""
+    directory = os.fspath(directory)
+
+    def exists(name):
+        return os.path.isfile(os.path.join(directory, name))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return {name for name, ok in zip(names, executor.map(exists, names, chunksize=64)) if ok}
+
+
+def resolve_names(directory, names, mode=None, workers=32):
+    """把任务中的文件名解析为 (存在的文件名列表, 缺失的文件名列表)，保持原顺序
+
+    mode（默认取环境变量 LABELER_DIR_MODE，未设置时为 'auto'）:
+        'scan' - 列出整个目录后在内存中匹配
+        'stat' - 线程池并行 stat 每个文件名（远程目录、或目录远大于任务时）
+        'auto' - 有新鲜的目录缓存时用 scan；网络文件系统上用 stat；本地目录任务较大时用 scan，否则用 stat
+    """
+    directory = os.fspath(directory)
+    if not os.path.isdir(directory):
+        return [], list(names)
+
+    mode = mode or os.environ.get('LABELER_DIR_MODE', 'auto')
+    if mode not in ('auto', 'scan', 'stat'):
+        raise ValueError(f"Unknown directory mode {mode!r}, expected auto, scan or stat")
+    if mode == 'auto':
+        with _cache_lock:
+            cached = _listing_cache.get(directory)
+        fresh = cached is not None and cached[0] == os.stat(directory).st_mtime_ns
+        if fresh:
+            mode = 'scan'
+        elif is_remote(directory):
+            mode = 'stat'
+        else:
+            mode = 'scan' if len(names) > STAT_THRESHOLD else 'stat'
+
+    if mode == 'stat':
+        existing = stat_names(directory, names, workers)
+    else:
+        existing = list_directory(directory)
+
+    found, missing = [], []
+    for name in names:
+        (found if name in existing else missing).append(name)
+    return found, missing
+
+
+def invalidate(directory=None):
+    """清除目录缓存（不指定目录时全部清除）"""
+    with _cache_lock:
+        if directory is None:
+            _listing_cache.clear()
+            _remote_cache.clear()
+        else:
+            _listing_cache.pop(os.fspath(directory), None)
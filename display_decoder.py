@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+显示用图片解码器
+JPEG利用draft直接按缩小比例解码（DCT域缩放），其他格式先用reduce整数倍缩小，
+最后一步缩放的滤波器可选
+"""
+
+from PIL import Image
+
+# 显示区域最大尺寸
+DISPLAY_MAX_WIDTH = 800
+DISPLAY_MAX_HEIGHT = 600
+
+# 可选的缩放滤波器（由快到慢）
+RESAMPLE_FILTERS = {
+    'nearest': Image.Resampling.NEAREST,
+    'box': Image.Resampling.BOX,
+    'bilinear': Image.Resampling.BILINEAR,
+    'hamming': Image.Resampling.HAMMING,
+    'bicubic': Image.Resampling.BICUBIC,
+    'lanczos': Image.Resampling.LANCZOS,
+}
+
+
+class DisplayDecoder:
+    """把图片解码成不超过目标尺寸的显示图
+
+    实例可直接调用：decoder(image_path) -> PIL.Image，
+    show_current_image 与预取器共用同一个解码器。
+    """
+
+    def __init__(self, max_width=DISPLAY_MAX_WIDTH, max_height=DISPLAY_MAX_HEIGHT,
+                 resample='bilinear', use_draft=True):
+        if resample not in RESAMPLE_FILTERS:
+            raise ValueError(f"Unknown resample filter: {resample}")
+        self.max_width = max_width
+        self.max_height = max_height
+        self.resample = resample
+        self.use_draft = use_draft  # False时等同于原来的全尺寸解码 + 缩放
+
+    def target_size(self, width, height):
+        """计算保持比例、不超过目标框的尺寸；不需要缩小时返回None"""
+        scale = min(self.max_width / width, self.max_height / height)
+        if scale >= 1:
+            return None
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+    def __call__(self, image_path):
+        image = Image.open(image_path)
+        size = self.target_size(*image.size)
+
+        if size is None:
+            image.load()
+            return image
+
+        if self.use_draft:
+            if image.format == 'JPEG':
+                # 以不小于目标尺寸的最近1/2、1/4、1/8比例解码
+                image.draft('RGB', size)
+            else:
+                # 非JPEG：先按整数倍reduce到不小于目标尺寸
+                factor = min(image.width // size[0], image.height // size[1])
+                if factor >= 2:
+                    image = image.reduce(factor)
+
+        if image.size == size:
+            image.load()
+            return image
+        return image.resize(size, RESAMPLE_FILTERS[self.resample])
+
+
+# 原来的解码路径：全尺寸解码后用LANCZOS缩放（用于对比）
+lanczos_decoder = DisplayDecoder(resample='lanczos', use_draft=False)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导出引擎
+用线程池把图片放入分类文件夹，默认完整复制，可选硬链接/reflink/符号链接，
+已完成的文件记录在清单中，中断后可以继续导出
+"""
+
+import os
+import json
+import errno
+import shutil
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 复制方式：copy 完整复制（默认）, hardlink 硬链接, reflink 写时复制/内核内复制, symlink 符号链接
+# 硬链接与源图片共用同一个文件，修改导出的文件会同时修改 images/ 中的原图，只在明确选择时使用
+COPY_STRATEGIES = ('copy', 'hardlink', 'reflink', 'symlink')
+
+MANIFEST_NAME = ".export_manifest.jsonl"
+COMPLETE_MARKER = ".export_complete"
+
+# Linux FICLONE ioctl（btrfs/xfs等支持写时复制的文件系统）
+FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """尽量不复制数据：先尝试FICLONE，再尝试copy_file_range，最后退回普通复制"""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            import fcntl
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            shutil.copystat(src, dst)
+            return
+        except (ImportError, OSError):
+            pass
+
+        if hasattr(os, 'copy_file_range'):
+            try:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    fdst.close()
+                    shutil.copystat(src, dst)
+                    return
+            except OSError:
+                fdst.seek(0)
+                fdst.truncate()
+
+    shutil.copy2(src, dst)
+
+
+def place_file(src, dst, strategy):
+    """按指定方式把src放到dst；硬链接/reflink不可用时（如跨设备）退回完整复制"""
+    if os.path.lexists(dst):
+        os.unlink(dst)
+
+    if strategy == 'hardlink':
+        try:
+            os.link(src, dst)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+        shutil.copy2(src, dst)
+    elif strategy == 'reflink':
+        _reflink(src, dst)
+    elif strategy == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+    elif strategy == 'copy':
+        shutil.copy2(src, dst)
+    else:
+        raise ValueError(f"Unknown copy strategy: {strategy}")
+
+
+class ExportResult:
+    """导出结果统计"""
+
+    def __init__(self):
+        self.done = 0  # 本次新导出的文件数
+        self.resumed = 0  # 上次已完成、本次跳过的文件数
+        self.moved = 0  # 上次已导出、之后重新标注过的文件：移到新的分类文件夹
+        self.removed = 0  # 上次已导出、已不属于本次导出的文件：删除
+        self.errors = []  # (目标相对路径, 错误信息)
+
+    @property
+    def total(self):
+        return self.done + self.resumed + self.moved
+
+
+class ExportEngine:
+    """可续传的并行导出
+
+    清单每行一条：{"dst": 目标相对路径, "src": 源文件} 已导出，{"dst": ..., "removed": true} 已删除。
+    """
+
+    def __init__(self, output_dir, strategy='copy', workers=8, manifest_flush_every=200):
+        if strategy not in COPY_STRATEGIES:
+            raise ValueError(f"Unknown copy strategy: {strategy}")
+        self.output_dir = Path(output_dir)
+        self.strategy = strategy
+        self.workers = workers
+        self.manifest_flush_every = manifest_flush_every
+        self.manifest_path = self.output_dir / MANIFEST_NAME
+
+    def completed_entries(self):
+        """读取清单中已完成的导出 {目标相对路径: 源文件路径}（旧清单中没有源文件时为None）"""
+        done = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        if entry.get('removed'):
+                            done.pop(entry['dst'], None)
+                        else:
+                            done[entry['dst']] = entry.get('src')
+                    except (ValueError, KeyError, AttributeError):
+                        # 中断时最后一行可能不完整，该文件会被重新导出
+                        continue
+        return done
+
+    @staticmethod
+    def _write_entry(manifest, rel_dst, src=None, removed=False):
+        entry = {'dst': rel_dst, 'removed': True} if removed else {'dst': rel_dst, 'src': str(src)}
+        manifest.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def run(self, jobs):
+        """执行导出
+
+        jobs: 可迭代的 (源文件路径, 目标相对路径)，如 (images/a.jpg, "highQuality/a.jpg")
+        返回 ExportResult，单个文件失败不会中断整个导出
+
+        继续上次中断的导出时，清单中已不在 jobs 里的文件（期间重新标注、放在旧分类文件夹中的）
+        移到同一源文件的新目标位置，没有对应新目标的删除。
+        """
+        result = ExportResult()
+        done = self.completed_entries()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        jobs = [(src, str(rel_dst)) for src, rel_dst in jobs]
+        wanted = {rel_dst for _, rel_dst in jobs}
+        stale = [rel_dst for rel_dst in done if rel_dst not in wanted]
+        stale_by_src = {done[rel_dst]: rel_dst for rel_dst in stale if done[rel_dst] is not None}
+
+        with open(self.manifest_path, 'a', encoding='utf-8') as manifest:
+            pending = []
+            created_dirs = set()
+            for src, rel_dst in jobs:
+                if rel_dst in done:
+                    result.resumed += 1
+                    continue
+                parent = os.path.dirname(rel_dst)
+                if parent not in created_dirs:
+                    (self.output_dir / parent).mkdir(parents=True, exist_ok=True)
+                    created_dirs.add(parent)
+                old = stale_by_src.pop(str(src), None)
+                if old is not None:
+                    try:
+                        os.replace(self.output_dir / old, self.output_dir / rel_dst)
+                    except OSError:
+                        stale_by_src[str(src)] = old  # 按新文件导出，旧文件在下面删除
+                    else:
+                        self._write_entry(manifest, old, removed=True)
+                        self._write_entry(manifest, rel_dst, src)
+                        done.pop(old)
+                        result.moved += 1
+                        continue
+                pending.append((src, rel_dst))
+
+            for rel_dst in stale:
+                if rel_dst not in done:
+                    continue  # 已移走
+                try:
+                    os.unlink(self.output_dir / rel_dst)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    result.errors.append((rel_dst, f"failed to remove stale file: {e}"))
+                    continue
+                self._write_entry(manifest, rel_dst, removed=True)
+                result.removed += 1
+            manifest.flush()
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(place_file, src, self.output_dir / rel_dst, self.strategy): (src, rel_dst)
+                           for src, rel_dst in pending}
+                for future in as_completed(futures):
+                    src, rel_dst = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        result.errors.append((rel_dst, str(e)))
+                        continue
+                    self._write_entry(manifest, rel_dst, src)
+                    result.done += 1
+                    if result.done % self.manifest_flush_every == 0:
+                        manifest.flush()
+
+        return result
+
+    def mark_complete(self):
+        """标记导出已全部完成（之后不再视为可续传）"""
+        (self.output_dir / COMPLETE_MARKER).touch()
+
+    @staticmethod
+    def find_incomplete(parent_dir, prefix):
+        """查找以prefix开头、有清单但未完成的最新导出目录，没有则返回None"""
+        parent_dir = Path(parent_dir)
+        if not parent_dir.exists():
+            return None
+        candidates = [d for d in parent_dir.iterdir()
+                      if d.is_dir() and d.name.startswith(prefix)
+                      and (d / MANIFEST_NAME).exists() and not (d / COMPLETE_MARKER).exists()]
+        return max(candidates, key=lambda d: d.name) if candidates else None
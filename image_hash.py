@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+感知哈希（近似重复图片检测）
+对缩小后的灰度图用NumPy批量计算 aHash / dHash / pHash（各64位），多进程遍历图片目录，
+结果按 文件名 + 大小 + 修改时间 缓存在磁盘上，未变化的图片不重复计算；
+多索引哈希（把64位分成若干段，至少有一段完全相同）实现快速的汉明距离查询，可扩展到百万级图片
+
+计算哈希（需要 numpy）:
+    python image_hash.py build --images-dir images [--index image_hashes.npz] [--workers N]
+查看近似重复的分组:
+    python image_hash.py clusters [--index image_hashes.npz] [--radius 6] [--kind phash]
+"""
+
+import os
+import sys
+import argparse
+from pathlib import Path
+from collections import Counter
+from PIL import Image
+from npz_index import NpzIndex
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HASH_KINDS = ('ahash', 'dhash', 'phash')
+DEFAULT_RADIUS = 6  # 汉明距离不超过此值视为近似重复
+_SIZE = 32  # pHash 的输入尺寸
+
+_POPCOUNT8 = None
+_DCT = None
+
+
+def numpy_available():
+    """是否安装了 numpy"""
+    return np is not None
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Perceptual hashing requires numpy (pip install numpy)")
+
+
+def _dct_matrix(n):
+    """DCT-II 变换矩阵（不归一化，只比较大小）"""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+
+
+def _pack_bits(bits):
+    """(k, 64) 布尔数组 -> (k,) uint64"""
+    return np.packbits(bits.astype(np.uint8), axis=1).view('>u8').astype(np.uint64).ravel()
+
+
+def _load_small(path):
+    """读取为 32x32 灰度数组；JPEG用draft按缩小比例解码"""
+    with Image.open(path) as image:
+        image.draft('L', (_SIZE * 2, _SIZE * 2))
+        image = image.convert('L')
+        small = image.resize((_SIZE, _SIZE), Image.BILINEAR)
+        dsmall = image.resize((9, 8), Image.BILINEAR)
+    return np.asarray(small, dtype=np.float32), np.asarray(dsmall, dtype=np.float32)
+
+
+def hash_arrays(small, dsmall):
+    """对一批缩小的图片计算哈希
+
+    small: (k, 32, 32) 灰度，dsmall: (k, 8, 9) 灰度
+    返回 {'ahash': (k,) uint64, 'dhash': ..., 'phash': ...}
+    """
+    global _DCT
+    _require_numpy()
+    if _DCT is None:
+        _DCT = _dct_matrix(_SIZE).astype(np.float32)
+    k = small.shape[0]
+
+    # aHash：8x8 块均值与整体均值比较
+    blocks = small.reshape(k, 8, _SIZE // 8, 8, _SIZE // 8).mean(axis=(2, 4)).reshape(k, 64)
+    ahash = _pack_bits(blocks > blocks.mean(axis=1, keepdims=True))
+
+    # dHash：相邻像素的水平梯度符号
+    dhash = _pack_bits((dsmall[:, :, 1:] > dsmall[:, :, :-1]).reshape(k, 64))
+
+    # pHash：二维DCT的左上角 8x8 低频系数与其中位数比较
+    low = np.einsum('ij,kjl,ml->kim', _DCT[:8], small, _DCT[:8]).reshape(k, 64)
+    phash = _pack_bits(low > np.median(low, axis=1, keepdims=True))
+
+    return {'ahash': ahash, 'dhash': dhash, 'phash': phash}
+
+
+def _hash_chunk(paths):
+    """工作进程：一批图片 -> (成功的下标列表, 哈希字典, 错误列表)"""
+    smalls, dsmalls, ok, errors = [], [], [], []
+    for i, path in enumerate(paths):
+        try:
+            small, dsmall = _load_small(path)
+        except Exception as e:
+            errors.append(f"{os.path.basename(path)}: {e}")
+            continue
+        smalls.append(small)
+        dsmalls.append(dsmall)
+        ok.append(i)
+    if not ok:
+        return ok, None, errors
+    return ok, hash_arrays(np.stack(smalls), np.stack(dsmalls)), errors
+
+
+def popcount64(values):
+    """uint64 数组中每个元素的置1位数"""
+    global _POPCOUNT8
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    if _POPCOUNT8 is None:
+        _POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return _POPCOUNT8[values.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+class HashIndex(NpzIndex):
+    """持久化的哈希表：文件名、大小、修改时间和三种哈希（npz文件）"""
+
+    COLUMNS = HASH_KINDS
+    DTYPE = 'uint64'
+    REQUIRES = "Perceptual hashing requires numpy (pip install numpy)"
+
+    @property
+    def hashes(self):
+        """{哈希种类: (n,) uint64}"""
+        return self.columns
+
+
+def build_index(images_dir, index_path, workers=None, chunk_size=64, progress=None):
+    """计算目录中新增或变化的图片的哈希并写回索引，返回 (索引, 新计算数, 错误列表)"""
+    return HashIndex.build(images_dir, index_path, _hash_chunk, workers, chunk_size, progress)
+
+
+class MultiIndexHash:
+    """多索引哈希：64位哈希分成 radius+1 段，距离不超过radius的两个哈希至少有一段完全相同
+
+    每段建一个 段值 -> 下标数组 的分组，查询时只比较候选的完整汉明距离。
+    """
+
+    def __init__(self, hashes, radius=DEFAULT_RADIUS):
+        _require_numpy()
+        if not 0 <= radius < 16:
+            raise ValueError("radius must be between 0 and 15")
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.radius = radius
+        segments = radius + 1
+        bits = 64 // segments
+        # 前 segments-1 段各 bits 位，最后一段包含剩下的位
+        self._segments = [(s * bits, bits if s < segments - 1 else 64 - s * bits) for s in range(segments)]
+        self._tables = []
+        for shift, width in self._segments:
+            keys = self._segment(self.hashes, shift, width)
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            self._tables.append((sorted_keys, order))
+
+    @staticmethod
+    def _segment(values, shift, width):
+        return (values >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+
+    def query(self, value):
+        """与 value 的汉明距离不超过radius的下标（升序）"""
+        value = np.uint64(value)
+        candidates = []
+        for (shift, width), (sorted_keys, order) in zip(self._segments, self._tables):
+            key = self._segment(value, shift, width)
+            lo = np.searchsorted(sorted_keys, key, 'left')
+            hi = np.searchsorted(sorted_keys, key, 'right')
+            candidates.append(order[lo:hi])
+        candidates = np.unique(np.concatenate(candidates))
+        distances = popcount64(self.hashes[candidates] ^ value)
+        return candidates[distances <= self.radius]
+
+    def pairs(self, small_group=64, block=1024):
+        """所有距离不超过radius的下标对 (i, j)，i < j（同一对可能出现多次）
+
+        每段按段值排序后，同一分组内两两比较：小分组按位置偏移对全部元素一次性向量化比较，
+        大分组（大量相同的段值）按块比较。图片数达到百万级时 radius 宜取较小值（如3，每段16位），
+        分组更小，比较次数大致与图片数成正比。
+        """
+        for sorted_keys, order in self._tables:
+            values = self.hashes[order]
+            count = len(order)
+            if count < 2:
+                continue
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_keys)) + 1))
+            lengths = np.diff(np.concatenate((starts, [count])))
+
+            # 大分组中的位置不参与偏移比较
+            in_large = np.repeat(lengths > small_group, lengths)
+            for offset in range(1, min(small_group, int(lengths.max()))):
+                same = (sorted_keys[offset:] == sorted_keys[:-offset]) & ~in_large[offset:]
+                candidates = np.flatnonzero(same)
+                if not len(candidates):
+                    continue
+                distances = popcount64(values[candidates] ^ values[candidates + offset])
+                hits = candidates[distances <= self.radius]
+                for i, j in zip(order[hits], order[hits + offset]):
+                    yield (int(i), int(j)) if i < j else (int(j), int(i))
+
+            for start, length in zip(starts[lengths > small_group], lengths[lengths > small_group]):
+                group = np.sort(order[start:start + length])
+                group_values = self.hashes[group]
+                for row in range(0, length - 1, block):
+                    xor = group_values[row:row + block, None] ^ group_values[None, row:]
+                    close = popcount64(xor.ravel()).reshape(xor.shape) <= self.radius
+                    a, b = np.nonzero(np.triu(close, 1))
+                    for i, j in zip(group[row + a], group[row + b]):
+                        yield int(i), int(j)
+
+
+def cluster_names(index, radius=DEFAULT_RADIUS, kind='phash'):
+    """把近似重复的图片分组：返回 {文件名: 组代表文件名}（只包含有重复的图片）"""
+    parent = list(range(len(index)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in MultiIndexHash(index.hashes[kind], radius).pairs():
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    roots = [find(i) for i in range(len(index))]
+    sizes = Counter(roots)
+    return {index.names[i]: index.names[root] for i, root in enumerate(roots) if sizes[root] > 1}
+
+
+def load_duplicate_groups(index_path, names=None, radius=DEFAULT_RADIUS, kind='phash'):
+    """读取哈希索引并分组：返回 {文件名: 组代表文件名}；names 不为None时只考虑这些图片"""
+    index = HashIndex.load(index_path)
+    if names is not None:
+        index = index.subset(names)
+    return cluster_names(index, radius, kind)
+
+
+def main(argv=None):
+    """命令行入口"""
+    project_dir = Path(__file__).parent
+    parser = argparse.ArgumentParser(description="Perceptual hash tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="Hash new or changed images in a directory")
+    build_parser.add_argument('--images-dir', default=str(project_dir / "images"))
+    build_parser.add_argument('--index', default=str(project_dir / "image_hashes.npz"))
+    build_parser.add_argument('--workers', type=int, default=None, help="Default: all CPU cores")
+
+    clusters_parser = subparsers.add_parser('clusters', help="List groups of near-duplicate images")
+    clusters_parser.add_argument('--index', default=str(project_dir / "image_hashes.npz"))
+    clusters_parser.add_argument('--radius', type=int, default=DEFAULT_RADIUS)
+    clusters_parser.add_argument('--kind', choices=HASH_KINDS, default='phash')
+    clusters_parser.add_argument('--limit', type=int, default=20, help="Groups to print")
+
+    args = parser.parse_args(argv)
+    if np is None:
+        print("Perceptual hashing requires numpy (pip install numpy)")
+        return 1
+
+    if args.command == 'build':
+        def progress(done, total):
+            if done % 5000 < 64:
+                print(f"  {min(done, total)}/{total}")
+
+        index, computed, errors = build_index(args.images_dir, args.index, args.workers, progress=progress)
+        print(f"Done: {len(index)} images in {args.index}, {computed} hashed, {len(errors)} failed")
+        for error in errors[:20]:
+            print(f"  {error}")
+    elif args.command == 'clusters':
+        index = HashIndex.load(args.index)
+        groups = {}
+        for name, representative in cluster_names(index, args.radius, args.kind).items():
+            groups.setdefault(representative, []).append(name)
+        print(f"{len(groups)} groups, {sum(len(g) for g in groups.values())} images with near-duplicates")
+        for members in sorted(groups.values(), key=len, reverse=True)[:args.limit]:
+            print(f"  {len(members):4d}: {', '.join(sorted(members)[:4])}{' ...' if len(members) > 4 else ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,220 +1,537 @@
- #!/usr/bin/env python3
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
 图片标注工具
 用于标注图片是highQuality还是lowQuality，并将图片移动到对应文件夹
+
+标注核心（任务加载、队列、标注、撤销、进度、导出）在 label_session.py 中，与界面无关；
+本窗口只负责显示和输入，通过订阅 LabelSession 的事件刷新界面。
 """
 
-import os
-import shutil
-import json
-import csv
+import time
+import argparse
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from PIL import Image, ImageTk
-import threading
+from PIL import ImageTk
 from pathlib import Path
-from collections import deque
 from datetime import datetime
+from collections import deque
+from image_prefetcher import ImagePrefetcher
+from display_decoder import DisplayDecoder
+from preview_cache import PreviewCache
+from label_state import LABEL_TYPES
+from phase_timer import PhaseTimer
+from latency_metrics import LatencyMetrics
+from image_hash import numpy_available
+from image_quality import QUEUE_ORDERS, AUTO_LOW_THRESHOLD, AUTO_HIGH_THRESHOLD
+from export_engine import COPY_STRATEGIES
+from report_writer import parquet_available
+from label_session import LabelSession
 
 class ImageLabeler:
-    def __init__(self, root):
+    def __init__(self, root, profile_startup=False, queue_spec=None, label_db=None, queue_order='name',
+                 auto_low=AUTO_LOW_THRESHOLD, auto_high=AUTO_HIGH_THRESHOLD, grid_size=(3, 4),
+                 metrics=False, metrics_dump=None, project_dir=None):
         self.root = root
+        self.startup_timer = PhaseTimer(enabled=profile_startup)  # --profile-startup 启动耗时报告
+        # --metrics 各阶段耗时的滚动百分位（F3 显示浮层），--metrics-dump 定期写入JSONL；未启用时几乎没有开销
+        self.metrics = LatencyMetrics(enabled=metrics or bool(metrics_dump), dump_path=metrics_dump)
+        self.metrics_overlay = None
         self.root.title("Image Labeling Tool - High Quality/Low Quality")
         self.root.geometry("1200x800")
         self.root.configure(bg='#f0f0f0')
         
-        # 设置项目路径
-        self.project_dir = Path(__file__).parent
-        self.images_dir = self.project_dir / "images"  # 默认图片目录
-        self.highQuality_dir = self.project_dir / "highQuality"
-        self.lowQuality_dir = self.project_dir / "lowQuality"
-        self.tasks_dir = self.project_dir / "tasks"
-        self.progress_dir = self.project_dir / "progress"
-        self.progress_file = self.progress_dir / "labeling_progress.json"
+        # 设置项目路径（默认为程序所在目录；基准测试等可指定其他目录）
+        self.project_dir = Path(project_dir) if project_dir else Path(__file__).parent
+        
+        # 标注会话：任务、队列、标注状态、撤销、进度存储、租约和导出都由它负责，界面订阅其事件；
+        # 进度日志在会话的写盘线程中写入，按键处理不等待fsync
+        self.session = LabelSession(self.project_dir, queue_spec=queue_spec, label_db=label_db,
+                                    queue_order=queue_order, auto_low=auto_low, auto_high=auto_high,
+                                    metrics=self.metrics, background_writes=True)
+        self.session.on('task_loaded', self.on_task_loaded)
+        self.session.on('position', self.on_position)
+        self.session.on('labels_changed', self.on_labels_changed)
+        self.session.on('queue_changed', lambda event, data: self.update_progress_display())
+        self.session.on('index_changed', self.on_index_changed)
+        self.session.on('lease_lost', self.on_lease_lost)
         
         # 注意：不再在启动时创建文件夹，只在导出时创建
         
         # 初始化变量
-        self.current_image_path = None
-        self.current_image_index = 0
-        self.image_files = []
-        self.labeled_files = {}  # 改为字典，保存文件名和标签的映射
+        self.current_image_path = None  # 当前显示的图片（显示可能落后于会话的当前位置）
+        
+        # 按键：标注键按住不放时的自动重复不算新的按键
+        self.keys_down = set()  # 按下未松开的键（keycode）
+        self.key_release_times = {}  # keycode -> 最近一次松开的时间戳
         
-        # 任务相关变量
-        self.current_task = None
+        # 界面刷新合并到空闲时进行：待刷新的部分（'image' 当前图片或网格页，'stats' 统计和任务信息）
+        self.dirty = set()
+        self.render_retry = None  # 当前图片仍在解码时稍后重试的定时器
+        self.keypress_times = []  # 等待显示的按键时间（--metrics 的 keypress_to_display）
+        # 显示落后于会话位置时到达的命令 [(命令, 是否针对显示的图片)]，显示追上后按顺序执行
+        self.pending_commands = deque()
+        
+        # 任务选择
         self.task_files = []
-        self.task_progress_file = None
+        self.task_display_names = {}  # 下拉框显示名 -> 任务文件名
+        self.batch_status_tree = None  # 批次进度面板（打开时）
+        self.task_load_generation = 0  # 后台加载任务时只应用最后一次选择
+        
+        # 工作队列模式（--queue）：后台领取下一块时不重复领取
+        self.queue_fetching = False
+        
+        # 后台线程的结果通过队列交给主线程处理
+        self.ui_queue = queue.Queue()
+        
+        # 显示用解码器（JPEG按缩小比例解码，最后一步滤波器可选）
+        self.display_decoder = DisplayDecoder(resample='bilinear')
+        
+        # 磁盘预览图缓存：命中时只读小尺寸预览图，未命中才解码原图
+        self.preview_cache = PreviewCache(self.project_dir / "preview_cache", self.display_decoder)
+        
+        # 后台预取后续图片（预取数量和缓存字节预算可调）
+        self.prefetcher = ImagePrefetcher(self.metrics.wrap('decode', self.preview_cache),
+                                          lookahead=8, max_bytes=256 * 1024 * 1024)
+        
+        # 网格模式：一页显示 行x列 张缩略图，整页标注（除去例外）；缩略图由预览图缩小，预取当前页和后两页
+        self.grid_mode = False
+        self.grid_rows, self.grid_cols = grid_size
+        self.grid_page_size = self.grid_rows * self.grid_cols
+        self.thumbnail_size = min(1120 // self.grid_cols, 540 // self.grid_rows) - 12
+        self.grid_cursor = 0  # 当前页中选中的格子
+        self.grid_exceptions = set()  # 当前页中不参与整页标注的格子
+        self.grid_page_start = None  # 当前显示的页的起始位置
+        self.grid_page_shown = []  # 当前显示的页的图片（显示时更新）
+        self.grid_cells = []
+        self.thumbnail_prefetcher = ImagePrefetcher(self.metrics.wrap('thumbnail_decode', self.make_thumbnail),
+                                                    lookahead=3 * self.grid_page_size,
+                                                    max_bytes=64 * 1024 * 1024, workers=4)
         
-        # 撤销功能
-        self.undo_stack = deque(maxlen=10)  # 最多保存10次操作
+        self.startup_timer.mark("init")
         
         # 创建界面
         self.create_widgets()
+        self.startup_timer.mark("create_widgets")
         
-        # 加载可用任务（在界面创建完成后）
-        self.load_available_tasks()
+        # 先用缓存的任务索引填充下拉框，窗口立即可用；任务目录同步和任务加载在后台进行
+        self.task_index.load()
+        self.update_task_combobox()
+        self.startup_timer.mark("cached_task_index")
+        self.root.after(50, self.process_ui_queue)
+        self.root.after_idle(self.start_queue_session if self.session.queue_session else self.load_available_tasks)
+        self.root.after_idle(lambda: self.startup_timer.mark("window_ready", since=self.startup_timer.start))
         
-        # 如果没有选择任务，显示提示
-        if not self.task_files:
-            self.show_no_task_message()
+        # 定期将进度日志写盘，关闭窗口前压缩为快照
+        self.root.after(1000, self.flush_task_progress)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        if self.metrics.enabled:
+            self.root.after(1000, self.update_metrics)
     
-    def load_progress(self):
-        """加载已标注的图片记录"""
-        self.labeled_files = {}
-        
-        # 从进度文件读取已处理的文件信息
-        if self.progress_file.exists():
+    # 界面读取的会话状态（只读，修改请通过 self.session 的方法）
+    
+    @property
+    def images_dir(self):
+        return self.session.images_dir
+    
+    @property
+    def task_index(self):
+        return self.session.task_index
+    
+    @property
+    def current_task(self):
+        return self.session.current_task
+    
+    @property
+    def label_state(self):
+        return self.session.label_state
+    
+    @property
+    def labeled_files(self):
+        return self.session.labeled_files
+    
+    @property
+    def image_files(self):
+        return self.session.image_files
+    
+    @property
+    def current_image_index(self):
+        return self.session.current_index
+    
+    @property
+    def review_mode(self):
+        return self.session.review_mode
+    
+    def run_in_background(self, work, on_done):
+        """在后台线程执行 work()，完成后在主线程调用 on_done(result, error)"""
+        def runner():
             try:
-                with open(self.progress_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if 'labeled_files' in data:
-                        if isinstance(data['labeled_files'], dict):
-                            # 从JSON文件中读取所有标注记录
-                            self.labeled_files = data['labeled_files'].copy()
-                            print(f"Loaded {len(self.labeled_files)} labeled records from progress file")
+                result, error = work(), None
             except Exception as e:
-                print(f"Failed to load progress file: {e}")
-        else:
-            print("Progress file does not exist, starting with empty labeled files")
+                result, error = None, e
+            self.ui_queue.put((on_done, result, error))
+        
+        threading.Thread(target=runner, daemon=True).start()
     
-    def save_progress(self):
-        """保存标注进度"""
+    def process_ui_queue(self):
+        """在主线程处理后台线程的结果"""
         try:
-            data = {
-                'labeled_files': self.labeled_files
-            }
-            with open(self.progress_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"保存进度文件失败: {e}")
+            while True:
+                on_done, result, error = self.ui_queue.get_nowait()
+                on_done(result, error)
+        except queue.Empty:
+            pass
+        self.root.after(50, self.process_ui_queue)
+    
+    def update_task_combobox(self):
+        """用任务索引更新任务选择下拉框（显示各任务进度）"""
+        self.task_files = [self.session.tasks_dir / name for name in self.task_index.filenames()]
+        self.task_display_names = {self.task_index.display_name(f.name): f.name for f in self.task_files}
+        self.task_combobox['values'] = list(self.task_display_names)
+        if self.current_task and self.current_task.get('filename'):
+            self.task_combobox.set(self.task_index.display_name(self.current_task['filename']))
     
     def load_available_tasks(self):
-        """加载可用的任务文件"""
-        self.task_files = []
-        if self.tasks_dir.exists():
-            for file_path in self.tasks_dir.glob("*.json"):
-                if file_path.name.startswith("task_"):
-                    self.task_files.append(file_path)
-        
-        # 更新任务选择下拉框
-        if hasattr(self, 'task_combobox'):
-            task_names = [f.name for f in self.task_files]
-            self.task_combobox['values'] = task_names
-            if task_names:
+        """在后台同步任务目录和任务索引，然后加载第一个任务"""
+        self.update_status("Scanning task files...")
+        started = self.startup_timer.start
+        
+        def on_done(result, error):
+            self.startup_timer.mark("task_index_refresh", since=started)
+            if error:
+                print(f"Failed to refresh task index: {error}")
+            self.update_task_combobox()
+            if self.task_files:
                 # 自动选择第一个任务并加载
-                self.task_combobox.set(task_names[0])
-                self.load_task(task_names[0])
-                print(f"启动时自动加载任务: {task_names[0]}")
+                task_name = self.task_files[0].name
+                self.task_combobox.set(self.task_index.display_name(task_name))
+                self.load_task(task_name)
+                print(f"启动时自动加载任务: {task_name}")
             else:
                 print("没有找到可用的任务文件")
-        else:
-            print("任务选择下拉框尚未创建")
+                self.show_no_task_message()
+                self.report_startup_timing()
+        
+        self.run_in_background(self.task_index.refresh, on_done)
+    
+    def start_queue_session(self):
+        """工作队列模式：进度保存在本队列专用的进度文件中，然后领取第一块图片"""
+        self.session.start_queue()
+        self.task_combobox.configure(state='disabled')
+        self.update_task_info()
+        
+        def on_scores(result, error):
+            if error:
+                print(f"Failed to load quality scores: {error}")
+            self.session.quality_scores = result
+            self.fetch_queue_chunk()
+        
+        # 队列中的图片事先未知，读取全部评分（之后每块按评分排序）
+        self.run_in_background(self.session.load_quality_scores, on_scores)
+    
+    def fetch_queue_chunk(self):
+        """在后台从队列领取下一块图片，追加到待标注队列末尾"""
+        queue_session = self.session.queue_session
+        if self.queue_fetching or queue_session.exhausted:
+            return
+        self.queue_fetching = True
+        self.set_loading(True, "Fetching images from the work queue...")
+        
+        def on_done(result, error):
+            self.queue_fetching = False
+            self.set_loading(False)
+            waiting = self.current_image_index >= len(self.image_files)
+            if error:
+                self.update_status(f"Failed to fetch images from the work queue: {error}")
+                if waiting:
+                    self.root.after(5000, self.fetch_queue_chunk)
+                return
+            
+            self.session.add_queue_chunk(result)
+            if waiting and not self.review_mode:
+                self.session.go_to(self.current_image_index)
+        
+        self.run_in_background(queue_session.fetch, on_done)
     
     def load_task(self, task_filename):
-        """加载指定的任务"""
+        """在后台加载指定的任务，完成后切换过去"""
         if not task_filename:
             return
         
-        task_path = self.tasks_dir / task_filename
+        task_path = self.session.tasks_dir / task_filename
         if not task_path.exists():
             messagebox.showerror("错误", f"任务文件不存在: {task_filename}")
             return
         
-        try:
-            with open(task_path, 'r', encoding='utf-8') as f:
-                task_data = json.load(f)
-            
-            self.current_task = task_data
-            self.current_task['filename'] = task_filename
-            
-            # 设置任务进度文件
-            task_id = task_data.get('task_id', task_filename.replace('.json', ''))
-            self.task_progress_file = self.progress_dir / f"task_progress_{task_id}.json"
-            
-            # 加载任务进度
-            self.load_task_progress()
-            
-            # 获取任务中的图片
-            self.get_task_images()
-            
-            # 显示第一张图片
-            if self.image_files:
-                self.current_image_index = 0
-                self.show_current_image()
-            else:
-                self.show_completion_message()
-            
-            # 更新界面显示
-            self.update_progress_display()
-            self.update_stats_display()
-            self.update_task_info()
-            
-            self.update_status(f"已加载任务: {task_data.get('task_name', task_filename)}")
-            
-        except Exception as e:
-            messagebox.showerror("错误", f"加载任务失败: {e}")
-    
-    def load_task_progress(self):
-        """加载任务进度"""
-        self.labeled_files = {}
+        self.task_load_generation += 1
+        generation = self.task_load_generation
+        self.set_loading(True, f"Loading task {task_filename}...")
         
-        if self.task_progress_file and self.task_progress_file.exists():
+        def on_done(result, error):
+            if generation != self.task_load_generation:
+                # 加载期间又选择了其他任务
+                if result:
+                    self.session.discard_loaded(result)
+                return
+            self.set_loading(False)
+            if error:
+                messagebox.showerror("错误", f"加载任务失败: {error}")
+                return
             try:
-                with open(self.task_progress_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if 'labeled_files' in data:
-                        self.labeled_files = data['labeled_files'].copy()
-                        print(f"Loaded {len(self.labeled_files)} labeled records from task progress file")
-                        
-                        # 统计各类型标注数量
-                        highQuality_count = sum(1 for label in self.labeled_files.values() if label == 'highQuality')
-                        lowQuality_count = sum(1 for label in self.labeled_files.values() if label == 'lowQuality')
-                        skip_count = sum(1 for label in self.labeled_files.values() if label == 'skip')
-                        print(f"  Labeled statistics: highQuality={highQuality_count}, lowQuality={lowQuality_count}, skip={skip_count}")
+                if result['lease_holder'] is not None and not self.take_over_lease(task_filename, result):
+                    self.session.discard_loaded(result)
+                    self.update_task_combobox()
+                    self.update_status(f"Task {task_filename} is being labeled by "
+                                       f"{result['lease_holder'].get('annotator', 'unknown')}")
+                    return
+                with self.metrics.stage('task_load.apply'):
+                    self.apply_loaded_task(task_filename, result)
             except Exception as e:
-                print(f"Failed to load task progress file: {e}")
-        else:
-            print(f"Task progress file does not exist: {self.task_progress_file}")
+                messagebox.showerror("错误", f"加载任务失败: {e}")
+        
+        # 后台线程不访问界面变量：图片目录和队列顺序在这里取好
+        images_dir, order = self.images_dir, self.queue_order.get()
+        read_task = self.metrics.wrap('task_load.read', self.session.read_task)
+        self.run_in_background(lambda: read_task(task_path, images_dir, order, self.startup_timer), on_done)
     
-    def save_task_progress(self):
-        """保存任务进度"""
-        if not self.task_progress_file:
-            return
+    def take_over_lease(self, task_filename, loaded):
+        """任务租约被他人持有时询问是否接管，接管后重新读取对方已保存的进度"""
+        holder = loaded['lease_holder']
+        expires = datetime.fromtimestamp(holder.get('expires', 0)).strftime('%Y-%m-%d %H:%M:%S')
+        if not messagebox.askyesno(
+                "Task in use",
+                f"{task_filename} is being labeled by {holder.get('annotator', 'unknown')} "
+                f"(lease valid until {expires}).\n\n"
+                f"Labeling the same task at the same time overwrites each other's progress. "
+                f"Take over the task anyway?"):
+            return False
         
-        try:
-            data = {
-                'task_id': self.current_task.get('task_id') if self.current_task else None,
-                'labeled_files': self.labeled_files,
-                'last_updated': datetime.now().isoformat()
-            }
-            with open(self.task_progress_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Failed to save task progress file: {e}")
+        self.session.take_over(loaded)
+        return True
     
-    def get_task_images(self):
-        """获取任务中的图片"""
-        if not self.current_task:
+    def apply_loaded_task(self, task_filename, loaded):
+        """主线程：切换到后台加载好的任务（丢弃旧任务的预取），然后在后台对新任务的近似重复图片分组"""
+        self.prefetcher.cancel()
+        self.thumbnail_prefetcher.cancel()
+        self.session.apply_loaded_task(task_filename, loaded)
+        self.session.load_task_duplicates(background=self.run_in_background)
+    
+    def on_task_loaded(self, event, data):
+        """会话切换到新任务：显示第一张图片并刷新界面"""
+        self.current_image_path = None
+        self.pending_commands.clear()  # 针对旧任务图片的命令
+        self.grid_page_start = None
+        self.grid_page_shown = []
+        self.update_task_combobox()
+        self.update_status(f"已加载任务: {data['task_name']}")
+        self.dirty.update(('image', 'stats'))
+        self.render()
+    
+    def on_position(self, event, data):
+        """会话的当前位置变化：工作队列剩余不多时领取下一块，在空闲时显示最新位置的图片"""
+        if self.session.needs_queue_chunk():
+            self.fetch_queue_chunk()
+        self.request_render('image')
+    
+    def on_labels_changed(self, event, data):
+        """标注变化（标注、批量标注、撤销、重做）：在空闲时刷新统计"""
+        self.request_render('stats')
+    
+    def request_render(self, *parts):
+        """合并界面刷新：多次位置和标注变化只在界面空闲时按最新状态刷新一次"""
+        if not self.dirty:
+            self.root.after_idle(self.render)
+        self.dirty.update(parts)
+    
+    def render(self):
+        """刷新待刷新的部分"""
+        parts, self.dirty = self.dirty, set()
+        self.update_progress_display()
+        if 'stats' in parts:
+            self.update_stats_display()
+            self.update_task_info()
+        if 'image' in parts:
+            if self.render_retry is not None:
+                self.root.after_cancel(self.render_retry)
+                self.render_retry = None
+            self.show_current_image()
+        self.run_pending_commands()
+
+    def display_current(self):
+        """显示的图片就是会话的当前图片；网格模式下显示的页就是从会话当前位置开始的一页"""
+        if self.grid_mode:
+            return (self.grid_page_start == self.current_image_index
+                    and bool(self.grid_page_shown) and self.grid_page_shown == self.grid_page())
+        return self.current_image_path is not None and self.current_image_path == self.session.current_path
+
+    def run_command(self, command, needs_display=True):
+        """执行一条按键命令
+
+        needs_display: 命令针对显示的图片或网格页（标注、跳过、网格中的选择）；显示还落后于会话位置时排队，
+        等这张图片显示后再执行，不会标到用户没看到的图片上。前面有排队的命令时（如撤销）也排在后面，保持按键顺序。
+        """
+        if self.pending_commands or (needs_display and not self.display_current()):
+            self.pending_commands.append((command, needs_display))
+            return
+        command()
+
+    def run_pending_commands(self):
+        """显示追上会话位置后按顺序执行排队的命令；标注后位置改变，之后的命令等下一张显示后再执行"""
+        while self.pending_commands:
+            command, needs_display = self.pending_commands[0]
+            if needs_display and not self.display_current():
+                if self.session.current_path is not None:
+                    return
+                # 队列已到末尾，没有可标注的图片
+                self.pending_commands.clear()
+                return
+            self.pending_commands.popleft()
+            command()
+    
+    def frame_shown(self):
+        """新的一帧已显示：记录从按键到显示的耗时（被跳过的图片的按键也计到这一帧），第一次显示时报告启动耗时"""
+        if self.keypress_times:
+            now = time.perf_counter()
+            for started in self.keypress_times:
+                self.metrics.record('keypress_to_display', now - started)
+            self.keypress_times = []
+        if not getattr(self, '_startup_reported', False):
+            self.startup_timer.mark("first_image", since=self.startup_timer.start)
+            self.report_startup_timing()
+    
+    def on_index_changed(self, event, data):
+        """任务索引中的计数已写盘：刷新下拉框和批次进度面板"""
+        self.update_task_combobox()
+        self.update_batch_status()
+    
+    def on_lease_lost(self, event, data):
+        """任务被他人接管"""
+        messagebox.showwarning(
+            "Task taken over",
+            f"{data['holder'].get('annotator', 'Another annotator')} has taken over this task.\n\n"
+            f"Your progress is now saved to {data['side_file'].name}; merge it with progress_merge.py.")
+    
+    def on_queue_order_changed(self, event=None):
+        """按新的顺序重新排列待标注队列"""
+        order = self.queue_order.get()
+        if order != 'name' and self.session.quality_scores is None:
+            messagebox.showwarning("Warning", "No quality scores found.\n\n"
+                                   "Run: python image_quality.py build --images-dir <image directory>")
+            self.queue_order.set(self.session.queue_order)
+            return
+        self.prefetcher.cancel()
+        self.session.set_queue_order(order)
+    
+    def auto_label_task(self):
+        """把当前任务中分数极端的未标注图片批量预标注，然后逐张复核"""
+        if not self.current_task or self.review_mode:
+            return
+        if self.session.quality_scores is None:
+            messagebox.showwarning("Warning", "No quality scores found.\n\n"
+                                   "Run: python image_quality.py build --images-dir <image directory>")
+            return
+        candidates = self.session.auto_label_candidates()
+        if not candidates:
+            messagebox.showinfo("Auto-label", "No unlabeled images with extreme quality scores")
             return
         
-        # 获取任务中的图片文件名列表
-        task_image_names = self.current_task.get('images', [])
-        
-        # 从images目录中找到对应的图片文件
-        self.image_files = []
-        for image_name in task_image_names:
-            image_path = self.images_dir / image_name
-            if image_path.exists():
-                self.image_files.append(image_path)
-            else:
-                print(f"警告: 任务中的图片文件不存在: {image_name}")
+        low, high = self.session.auto_thresholds
+        low_count = sum(1 for label in candidates.values() if label == 'lowQuality')
+        rules = [f"score < {low}: {low_count} images -> lowQuality"]
+        if high is not None:
+            rules.append(f"score > {high}: {len(candidates) - low_count} images -> highQuality")
+        if not messagebox.askyesno("Auto-label", "\n".join(rules) + "\n\nApply these labels and review them now?"):
+            return
         
-        # 过滤掉已标注的图片（只显示未标注的图片）
-        self.image_files = [img for img in self.image_files if img.name not in self.labeled_files]
-        self.image_files.sort()  # 按文件名排序
+        self.session.apply_auto_labels(candidates)
+        self.start_review()
     
+    def start_review(self):
+        """复核模式：逐张显示尚未复核、且标签仍是预标注结果的图片"""
+        if not self.current_task:
+            return
+        if not self.session.pending_reviews():
+            messagebox.showinfo("Review auto-labels", "No auto-labels left to review")
+            return
+        self.set_grid_mode(False, show=False)
+        self.prefetcher.cancel()
+        self.session.start_review()
+    
+    def end_review(self):
+        """结束复核，回到待标注队列"""
+        self.prefetcher.cancel()
+        self.session.end_review()
+    
+    def keep_auto_label(self):
+        """复核模式：保留当前显示图片的预标注并看下一张"""
+        if self.review_mode:
+            self.run_command(self._keep_displayed)
 
+    def _keep_displayed(self):
+        if self.review_mode:
+            self.session.mark_reviewed(self.current_image_path.name)
+            self.next_image()
+    
+    def toggle_metrics_overlay(self):
+        """显示/隐藏耗时统计浮层（需要 --metrics）"""
+        if not self.metrics.enabled:
+            return
+        if self.metrics_overlay is None:
+            self.metrics_overlay = tk.Label(self.image_frame, justify=tk.LEFT, anchor='nw', font=('Courier', 8),
+                                            bg='black', fg='#7CFC00')
+            self.metrics_overlay.place(relx=1.0, rely=0.0, anchor='ne')
+            self.update_metrics_overlay()
+        else:
+            self.metrics_overlay.destroy()
+            self.metrics_overlay = None
+    
+    def update_metrics_overlay(self):
+        """刷新耗时统计浮层的内容"""
+        if self.metrics_overlay is not None:
+            self.metrics_overlay.configure(text=self.metrics.format())
+    
+    def update_metrics(self):
+        """每秒刷新浮层，并按间隔写出JSONL统计"""
+        self.update_metrics_overlay()
+        try:
+            self.metrics.maybe_dump()
+        except OSError as e:
+            print(f"Failed to write metrics: {e}")
+        self.root.after(1000, self.update_metrics)
+    
+    def set_loading(self, loading, message=None):
+        """显示/隐藏加载进度条"""
+        if loading:
+            self.loading_bar.grid()
+            self.loading_bar.start(15)
+        else:
+            self.loading_bar.stop()
+            self.loading_bar.grid_remove()
+        if message:
+            self.update_status(message)
+    
+    def report_startup_timing(self):
+        """启动完成后打印一次分阶段耗时（--profile-startup）"""
+        if self.startup_timer.enabled and not getattr(self, '_startup_reported', False):
+            self._startup_reported = True
+            print(self.startup_timer.report())
+    
+    def flush_task_progress(self):
+        """定期将进度日志写盘、续期租约、与工作队列同步（网络同步在后台线程）"""
+        self.session.flush(background=self.run_in_background)
+        self.root.after(1000, self.flush_task_progress)
+    
+    def on_close(self):
+        """关闭窗口"""
+        self.session.close()
+        self.prefetcher.shutdown()
+        self.thumbnail_prefetcher.shutdown()
+        if self.metrics.enabled:
+            self.metrics.maybe_dump(force=True)
+            print(self.metrics.format())
+        self.root.destroy()
     
     def create_widgets(self):
         """创建界面组件"""
@@ -246,6 +563,14 @@ class ImageLabeler:
         refresh_button = ttk.Button(task_frame, text="Refresh task list", command=self.load_available_tasks)
         refresh_button.grid(row=0, column=2, padx=(0, 10))
         
+        batch_status_button = ttk.Button(task_frame, text="Batch status", command=self.show_batch_status)
+        batch_status_button.grid(row=0, column=3, padx=(0, 10))
+        
+        # 后台加载任务时显示的进度条
+        self.loading_bar = ttk.Progressbar(task_frame, mode='indeterminate', length=120)
+        self.loading_bar.grid(row=0, column=4, padx=(0, 10))
+        self.loading_bar.grid_remove()
+        
         # 图片目录选择行
         ttk.Label(task_frame, text="Image directory:").grid(row=1, column=0, sticky=tk.W)
         self.images_dir_label = ttk.Label(task_frame, text=str(self.images_dir), 
@@ -260,6 +585,42 @@ class ImageLabeler:
         self.task_info_label = ttk.Label(task_frame, text="", font=('Arial', 9))
         self.task_info_label.grid(row=2, column=0, columnspan=3, pady=(5, 0), sticky=tk.W)
         
+        # 导出方式（硬链接最快且几乎不占空间，跨磁盘时自动退回复制）
+        ttk.Label(task_frame, text="Export mode:").grid(row=3, column=0, sticky=tk.W, pady=(5, 0))
+        self.export_strategy = tk.StringVar(value='copy')
+        export_strategy_combobox = ttk.Combobox(task_frame, width=12, state="readonly",
+                                                values=COPY_STRATEGIES, textvariable=self.export_strategy)
+        export_strategy_combobox.grid(row=3, column=1, padx=(10, 10), pady=(5, 0), sticky=tk.W)
+        
+        # 可选的Parquet列式输出（需要安装pyarrow）
+        self.export_parquet = tk.BooleanVar(value=False)
+        parquet_check = ttk.Checkbutton(task_frame, text="Also export Parquet", variable=self.export_parquet,
+                                        state='normal' if parquet_available() else 'disabled')
+        parquet_check.grid(row=3, column=2, padx=(0, 10), pady=(5, 0), sticky=tk.W)
+        
+        # 标注时一并标注同组的近似重复图片（需要 image_hash.py build 生成的哈希索引）
+        self.propagate_duplicates = tk.BooleanVar(value=False)
+        propagate_check = ttk.Checkbutton(task_frame, text="Apply label to near-duplicates",
+                                          variable=self.propagate_duplicates,
+                                          command=self.on_propagate_duplicates_changed,
+                                          state='normal' if numpy_available() else 'disabled')
+        propagate_check.grid(row=3, column=3, columnspan=2, padx=(0, 10), pady=(5, 0), sticky=tk.W)
+        
+        # 待标注队列的顺序和质量预标注（需要 image_quality.py build 生成的评分索引）
+        ttk.Label(task_frame, text="Queue order:").grid(row=4, column=0, sticky=tk.W, pady=(5, 0))
+        self.queue_order = tk.StringVar(value=self.session.queue_order)
+        queue_order_combobox = ttk.Combobox(task_frame, width=12, state="readonly",
+                                            values=QUEUE_ORDERS, textvariable=self.queue_order)
+        queue_order_combobox.grid(row=4, column=1, padx=(10, 10), pady=(5, 0), sticky=tk.W)
+        queue_order_combobox.bind('<<ComboboxSelected>>', self.on_queue_order_changed)
+        
+        auto_label_button = ttk.Button(task_frame, text="Auto-label extremes", command=self.auto_label_task,
+                                       state='normal' if numpy_available() else 'disabled')
+        auto_label_button.grid(row=4, column=2, padx=(0, 10), pady=(5, 0))
+        
+        review_button = ttk.Button(task_frame, text="Review auto-labels", command=self.start_review)
+        review_button.grid(row=4, column=3, padx=(0, 10), pady=(5, 0))
+        
         # 进度信息
         self.progress_label = ttk.Label(main_frame, text="", font=('Arial', 10))
         self.progress_label.grid(row=2, column=0, columnspan=3, pady=(0, 10))
@@ -277,6 +638,19 @@ class ImageLabeler:
         self.image_label = ttk.Label(self.image_frame, text="等待加载图片...")
         self.image_label.grid(row=0, column=0, padx=10, pady=10)
         
+        # 网格模式的缩略图格子（进入网格模式时显示）
+        self.grid_frame = ttk.Frame(self.image_frame)
+        self.grid_frame.grid(row=0, column=0, padx=10, pady=10)
+        # 空白占位图：格子没有缩略图时保持大小（有图片时 width/height 以像素计）
+        self.blank_thumbnail = tk.PhotoImage(width=self.thumbnail_size, height=self.thumbnail_size)
+        for i in range(self.grid_page_size):
+            cell = tk.Label(self.grid_frame, image=self.blank_thumbnail, compound='top', font=('Arial', 8),
+                            bd=0, highlightthickness=3, width=self.thumbnail_size, height=self.thumbnail_size + 30)
+            cell.grid(row=i // self.grid_cols, column=i % self.grid_cols, padx=2, pady=2)
+            cell.bind('<Button-1>', lambda event, i=i: self.click_grid_cell(i))
+            self.grid_cells.append(cell)
+        self.grid_frame.grid_remove()
+        
         # 按钮区域
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=5, column=0, columnspan=3, pady=20)
@@ -300,10 +674,20 @@ class ImageLabeler:
                                     command=self.undo_last_label)
         self.undo_button.grid(row=0, column=3, padx=10)
         
+        # 重做按钮
+        self.redo_button = ttk.Button(button_frame, text="↪️ Redo (Ctrl+Y)", 
+                                    command=self.redo_last_label)
+        self.redo_button.grid(row=0, column=4, padx=10)
+        
         # 导出按钮
         self.export_button = ttk.Button(button_frame, text="📊 Export Results", 
-                                      command=self.export_results)
-        self.export_button.grid(row=0, column=4, padx=10)
+                                      command=self.metrics.wrap('export', self.export_results))
+        self.export_button.grid(row=0, column=5, padx=10)
+        
+        # 网格模式开关
+        self.grid_button = ttk.Button(button_frame, text="▦ Grid (G)",
+                                      command=lambda: self.set_grid_mode(not self.grid_mode))
+        self.grid_button.grid(row=0, column=6, padx=10)
         
         # 状态栏
         self.status_label = ttk.Label(main_frame, text="", font=('Arial', 9))
@@ -311,24 +695,81 @@ class ImageLabeler:
         
         # 键盘快捷键
         self.root.bind('<Key>', self.handle_keypress)
+        self.root.bind('<KeyRelease>', self.handle_key_release)
+        self.root.bind('<FocusOut>', lambda event: self.keys_down.clear())
+        self.root.bind('<Control-z>', lambda event: self.undo_last_label())
+        self.root.bind('<Control-y>', lambda event: self.redo_last_label())
+        self.root.bind('<Return>', lambda event: None if self.is_key_repeat(event) else self.keep_auto_label())
         
         # 更新进度显示
         self.update_progress_display()
         self.update_stats_display()
     
+    def show_batch_status(self):
+        """批次进度面板：各批次和任务的完成数与各标签数量（只读任务索引）"""
+        if self.batch_status_tree is not None:
+            self.batch_status_tree.winfo_toplevel().lift()
+            self.update_batch_status()
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title("Batch status")
+        window.geometry("760x320")
+        window.columnconfigure(0, weight=1)
+        window.rowconfigure(0, weight=1)
+        
+        columns = ('done', 'percent') + LABEL_TYPES
+        tree = ttk.Treeview(window, columns=columns)
+        tree.heading('#0', text="Batch / task")
+        tree.column('#0', width=260)
+        tree.heading('done', text="Done")
+        tree.column('done', width=110, anchor=tk.E)
+        tree.heading('percent', text="%")
+        tree.column('percent', width=60, anchor=tk.E)
+        for label in LABEL_TYPES:
+            tree.heading(label, text=label)
+            tree.column(label, width=90, anchor=tk.E)
+        tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=10, pady=10)
+        
+        def on_close():
+            self.batch_status_tree = None
+            window.destroy()
+        
+        window.protocol("WM_DELETE_WINDOW", on_close)
+        self.batch_status_tree = tree
+        self.update_batch_status()
+    
+    def update_batch_status(self):
+        """用任务索引重新填充批次进度面板（面板未打开时什么都不做）"""
+        tree = self.batch_status_tree
+        if tree is None:
+            return
+        
+        def values(totals):
+            total = totals['total_images']
+            percent = totals['completed'] / total * 100 if total else 0.0
+            return ((f"{totals['completed']}/{total}", f"{percent:.1f}%")
+                    + tuple(totals[label] for label in LABEL_TYPES))
+        
+        tree.delete(*tree.get_children())
+        for batch_id, task_filenames in self.task_index.batch_groups():
+            batch_item = tree.insert('', tk.END, text=f"Batch {batch_id}", open=True,
+                                     values=values(self.task_index.summary(task_filenames)))
+            for task_filename in task_filenames:
+                tree.insert(batch_item, tk.END, text=task_filename,
+                            values=values(self.task_index.summary([task_filename])))
+    
     def on_task_selected(self, event):
         """任务选择事件处理"""
         selected_task = self.task_combobox.get()
         if selected_task:
-            self.load_task(selected_task)
+            self.load_task(self.task_display_names.get(selected_task, selected_task))
     
     def show_no_task_message(self):
         """显示无任务消息"""
         self.image_label.configure(text="📁 No available task files\n\nPlease put task files(.json) into tasks folder", 
                                  font=('Arial', 14))
-        self.highQuality_button.configure(state='disabled')
-        self.lowQuality_button.configure(state='disabled')
-        self.skip_button.configure(state='disabled')
+        self.set_label_buttons_state('disabled')
         self.update_status("等待任务文件")
     
     def select_images_directory(self):
@@ -339,27 +780,24 @@ class ImageLabeler:
         )
         
         if directory:
-            self.images_dir = Path(directory)
-            self.images_dir_label.configure(text=str(self.images_dir))
-            self.update_status(f"Selected image directory: {self.images_dir}")
+            self.images_dir_label.configure(text=directory)
+            self.update_status(f"Selected image directory: {directory}")
+            self.prefetcher.cancel()
+            self.thumbnail_prefetcher.cancel()
             
-            # 如果当前有任务，重新加载任务图片
-            if self.current_task:
-                self.get_task_images()
-                if self.image_files:
-                    self.current_image_index = 0
-                    self.show_current_image()
-                else:
-                    self.show_completion_message()
-                self.update_progress_display()
-                self.update_stats_display()
+            # 如果当前有任务，会话重新建立待标注队列并回到第一张
+            self.session.set_images_dir(directory)
+    
+    def on_propagate_duplicates_changed(self):
+        """“Apply label to near-duplicates”开关"""
+        self.session.propagate_duplicates = self.propagate_duplicates.get()
     
     def update_task_info(self):
         """更新任务信息显示"""
         if self.current_task:
             task_name = self.current_task.get('task_name', 'unknown task')
             total_images = self.current_task.get('total_images', 0)
-            completed = len(self.labeled_files)
+            completed = self.label_state.total
             remaining = total_images - completed
             
             info_text = f"Task Name:\t{task_name} \nTotal Images:\t{total_images} \nCompleted:\t\t{completed} \nRemaining:\t\t{remaining}"
@@ -367,9 +805,41 @@ class ImageLabeler:
         else:
             self.task_info_label.configure(text="")
     
+    def is_key_repeat(self, event):
+        """按住不放产生的自动重复：X11 上是时间戳与上次松开相同的按下，Windows/macOS 上是没有松开的再次按下"""
+        repeat = event.keycode in self.keys_down or self.key_release_times.get(event.keycode) == event.time
+        self.keys_down.add(event.keycode)
+        return repeat
+    
+    def handle_key_release(self, event):
+        """记录松开的键"""
+        self.keys_down.discard(event.keycode)
+        self.key_release_times[event.keycode] = event.time
+    
     def handle_keypress(self, event):
-        """处理键盘快捷键"""
-        if event.char.lower() == 'h':
+        """处理键盘快捷键
+
+        标注键（H/L/S、G）忽略自动重复，每次按键成为针对当前显示图片的命令：
+        内存中的标注状态和位置马上更新，写盘在写盘线程中进行，显示合并到空闲时进行；
+        显示还没跟上时命令排队，显示到对应图片后再执行。
+        """
+        started = time.perf_counter()
+        if self.is_key_repeat(event) and event.char.lower() in ('h', 'l', 's', 'g'):
+            return
+        self._dispatch_key(event)
+        if self.metrics.enabled and 'image' in self.dirty:
+            # 按键到新图片显示的耗时，在显示时记录
+            self.keypress_times.append(started)
+    
+    def _dispatch_key(self, event):
+        """handle_keypress 的按键分发"""
+        if event.keysym == 'F3':
+            self.toggle_metrics_overlay()
+        elif event.char == 'g' and not self.review_mode:
+            self.run_command(lambda: self.set_grid_mode(not self.grid_mode), needs_display=False)
+        elif self.grid_mode:
+            self.handle_grid_keypress(event)
+        elif event.char.lower() == 'h':
             self.label_image("highQuality")
         elif event.char.lower() == 'l':
             self.label_image("lowQuality")
@@ -380,41 +850,50 @@ class ImageLabeler:
             self.undo_last_label()
     
     def show_current_image(self):
-        """显示当前图片"""
+        """显示当前图片；图片还在后台解码时不阻塞界面，稍后再显示（期间的标注命令排队）"""
         if not self.image_files or self.current_image_index >= len(self.image_files):
             self.show_completion_message()
             return
         
-        self.current_image_path = self.image_files[self.current_image_index]
+        if self.grid_mode:
+            self.show_grid_page()
+            return
+        
+        # 当前图片排在预取的最前面，已跳过的图片尚未开始的解码取消
+        index = self.current_image_index
+        path = self.image_files[index]
+        self.prefetcher.prefetch(self.image_files[index:index + self.prefetcher.lookahead], drop_others=True)
+        if not self.prefetcher.ready(path):
+            self.render_retry = self.root.after(10, lambda: self.request_render('image'))
+            return
+        self.current_image_path = path
         
         try:
-            # 加载并调整图片大小
-            image = Image.open(self.current_image_path)
-            
-            # 计算合适的显示大小
-            max_width = 800
-            max_height = 600
+            # 取已解码缩放好的图片（通常已由后台预取完成）
+            with self.metrics.stage('show.load'):
+                image = self.prefetcher.load(self.current_image_path)
             
-            # 获取原始尺寸
-            width, height = image.size
-            
-            # 计算缩放比例
-            scale = min(max_width / width, max_height / height)
-            
-            if scale < 1:
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # 转换为PhotoImage
-            photo = ImageTk.PhotoImage(image)
+            # 转换为PhotoImage（必须在主线程）
+            with self.metrics.stage('show.photoimage'):
+                photo = ImageTk.PhotoImage(image)
             
             # 更新图片显示
-            self.image_label.configure(image=photo, text="")
-            self.image_label.image = photo  # 保持引用
+            with self.metrics.stage('show.configure'):
+                self.set_label_buttons_state('normal')
+                self.image_label.configure(image=photo, text="")
+                self.image_label.image = photo  # 保持引用
+            self.frame_shown()
             
             # 更新状态
-            self.update_status(f"Current Image: {self.current_image_path.name}")
+            name = self.current_image_path.name
+            if self.review_mode:
+                entry = self.session.auto_labeled[name]
+                self.update_status(f"Review {name}: auto-labeled {self.label_state.get(name)} "
+                                   f"(score {entry['score']:.3f}) - Enter keeps it, H/L/S changes it")
+            else:
+                duplicates = self.session.unlabeled_duplicates(name)
+                self.update_status(f"Current Image: {name}"
+                                   + (f" ({len(duplicates)} unlabeled near-duplicates)" if duplicates else ""))
             
         except Exception as e:
             self.image_label.configure(text=f"Failed to load image: {e}")
@@ -422,6 +901,29 @@ class ImageLabeler:
     
     def show_completion_message(self):
         """显示完成消息"""
+        if self.review_mode:
+            # 预标注复核完成，回到待标注队列
+            self.end_review()
+            return
+        
+        if self.session.queue_session and not self.session.queue_session.exhausted:
+            # 工作队列中还有图片：等待下一块领取完成
+            self.image_label.configure(image='', text="Fetching more images from the work queue...",
+                                       font=('Arial', 14))
+            self.set_label_buttons_state('disabled')
+            self.current_image_path = None
+            self.fetch_queue_chunk()
+            return
+        
+        if self.grid_mode:
+            # 网格页都翻完了：回到单张模式标注留作例外的图片
+            self.set_grid_mode(False, show=False)
+            first = self.session.next_unlabeled_index(0)
+            if first < len(self.image_files):
+                self.session.go_to(first)
+                self.update_status("Label the images left out of grid pages")
+                return
+        
         if self.current_task:
             task_name = self.current_task.get('task_name', 'current task')
             self.image_label.configure(text=f"🎉 Task '{task_name}' is completed!\n\nAll images are labeled.", 
@@ -430,91 +932,249 @@ class ImageLabeler:
             self.image_label.configure(text="🎉 All images are labeled!\n\nYou can close the program or restart to check new images.", 
                                      font=('Arial', 14))
         
-        self.highQuality_button.configure(state='disabled')
-        self.lowQuality_button.configure(state='disabled')
-        self.skip_button.configure(state='disabled')
+        self.set_label_buttons_state('disabled')
+        self.current_image_path = None
         self.update_status("Labeling completed")
+        self.frame_shown()
+    
+    def set_label_buttons_state(self, state):
+        """启用/禁用标注按钮"""
+        self.highQuality_button.configure(state=state)
+        self.lowQuality_button.configure(state=state)
+        self.skip_button.configure(state=state)
     
     def label_image(self, label_type):
-        """标注图片"""
-        if not self.current_image_path:
+        """标注命令：针对当前显示的图片，内存中立即生效并前进到下一张（显示在空闲时更新）"""
+        if self.grid_mode:
+            self.run_command(lambda: self.label_grid_page(label_type))
             return
-        
+        self.run_command(lambda: self._label_displayed(label_type))
+
+    def _label_displayed(self, label_type):
+        target = self.current_image_path
         try:
-            # 记录操作用于撤销
-            undo_info = {
-                'action': 'label',
-                'original_path': str(self.current_image_path),
-                'label_type': label_type,
-                'filename': self.current_image_path.name
-            }
-            
-            # 记录已标注（不移动文件）
-            self.labeled_files[self.current_image_path.name] = label_type
-            self.save_task_progress()
-            
-            # 添加到撤销栈
-            self.undo_stack.append(undo_info)
-            
-            # 显示成功消息
-            self.update_status(f"已标注为 {label_type}: {self.current_image_path.name}")
-            
-            # 移动到下一张图片
-            self.next_image()
+            with self.metrics.stage('label_image'):
+                result = self.session.label(label_type, filename=target.name)
+                if result is None:
+                    return
+                filename, propagated = result
+                
+                # 显示成功消息
+                self.update_status(f"已标注为 {label_type}: {filename}"
+                                   + (f" (+{len(propagated)} near-duplicates)" if propagated else ""))
+                
+                # 移动到下一张图片
+                self.next_image()
             
         except Exception as e:
             messagebox.showerror("错误", f"标注失败: {e}")
     
     def skip_image(self):
         """跳过当前图片"""
-        if self.current_image_path:
-            # 记录跳过
-            self.labeled_files[self.current_image_path.name] = 'skip'
-            self.save_task_progress()
-            self.update_status(f"Skipped image: {self.current_image_path.name}")
+        if self.grid_mode:
+            self.run_command(lambda: self.label_grid_page('skip'))
+            return
+        self.run_command(self._skip_displayed)
+
+    def _skip_displayed(self):
+        target = self.current_image_path
+        if self.session.label('skip', filename=target.name):
+            self.update_status(f"Skipped image: {target.name}")
             self.next_image()
     
     def undo_last_label(self):
-        """撤销最后一次标注"""
-        if not self.undo_stack:
+        """撤销最后一次标注，回到该图片原来的位置（排在尚未执行的标注命令之后）"""
+        self.run_command(self._undo, needs_display=False)
+
+    def _undo(self):
+        try:
+            action = self.session.undo()
+        except Exception as e:
+            messagebox.showerror("错误", f"撤销操作失败: {e}")
+            return
+        if action is None:
             messagebox.showinfo("提示", "没有可撤销的操作")
             return
-        
+        self.update_status(f"Undone: {action.filename}")
+    
+    def redo_last_label(self):
+        """重做最近一次撤销的标注（网格模式下翻到下一页）"""
+        self.run_command(self._redo, needs_display=False)
+
+    def _redo(self):
         try:
-            # 获取最后一次操作
-            last_action = self.undo_stack.pop()
-            
-            if last_action['action'] == 'label':
-                # 从已标注列表中移除
-                if last_action['filename'] in self.labeled_files:
-                    del self.labeled_files[last_action['filename']]
-                self.save_task_progress()
-                
-                # 重新获取图片列表
-                self.get_task_images()
-                self.current_image_index = 0
-                self.update_progress_display()
-                self.update_stats_display()
-                
-                if self.image_files:
-                    self.show_current_image()
-                
-                self.update_status(f"Undone: {last_action['filename']}")
-            
+            action = self.session.redo(stride=self.grid_page_size if self.grid_mode else None)
         except Exception as e:
-            messagebox.showerror("错误", f"撤销操作失败: {e}")
+            messagebox.showerror("错误", f"重做操作失败: {e}")
+            return
+        if action is None:
+            messagebox.showinfo("提示", "没有可重做的操作")
+            return
+        self.update_status(f"Redone: {action.filename} -> {action.label}")
+    
+    def make_thumbnail(self, image_path):
+        """网格缩略图：由显示用预览图（磁盘缓存）再缩小"""
+        image = self.preview_cache(image_path).copy()
+        image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+        return image
+    
+    def set_grid_mode(self, enabled, show=True):
+        """切换网格模式/单张模式；show=False 时只切换界面，不重新显示"""
+        if enabled == self.grid_mode or (enabled and self.review_mode):
+            return
+        self.grid_mode = enabled
+        self.grid_page_start = None
+        self.grid_page_shown = []
+        self.current_image_path = None  # 新模式显示出来之前不接受针对显示内容的命令
+        self.root.focus_set()  # 空格键不要触发获得焦点的按钮
+        if enabled:
+            self.image_label.grid_remove()
+            self.grid_frame.grid()
+            self.prefetcher.cancel()
+        else:
+            self.grid_frame.grid_remove()
+            self.image_label.grid()
+            self.thumbnail_prefetcher.cancel()
+        if show and self.current_task:
+            # 单张模式从第一张未标注的图片开始（包括网格中留作例外的图片）
+            self.session.go_to(self.current_image_index if enabled else self.session.next_unlabeled_index(0))
+    
+    def grid_page(self):
+        """当前页的图片路径（从 current_image_index 开始）"""
+        start = self.current_image_index
+        return self.image_files[start:start + self.grid_page_size]
+    
+    def show_grid_page(self):
+        """显示当前页的缩略图并预取后面两页"""
+        with self.metrics.stage('grid.page'):
+            self._show_grid_page()
+    
+    def _show_grid_page(self):
+        """show_grid_page 的实现（计时在外层）"""
+        page = self.grid_page()
+        start = self.current_image_index
+        end = start + len(page)
+        # 当前页和后两页一起提交解码，load 只需等待进行中的解码
+        self.thumbnail_prefetcher.prefetch(self.image_files[start:end + 2 * self.grid_page_size])
+        if start != self.grid_page_start:
+            # 换页时清除选择和例外（只在新的一页显示时清除，之前的按键仍针对显示的一页）
+            self.grid_page_start = start
+            self.grid_cursor = 0
+            self.grid_exceptions = set()
+        self.grid_cursor = min(self.grid_cursor, len(page) - 1)
+        
+        for i, cell in enumerate(self.grid_cells):
+            if i >= len(page):
+                cell.configure(image=self.blank_thumbnail, text='', highlightbackground='#f0f0f0',
+                               highlightcolor='#f0f0f0')
+                cell.image = None
+                continue
+            try:
+                photo = ImageTk.PhotoImage(self.thumbnail_prefetcher.load(page[i]))
+            except Exception as e:
+                photo = None
+                print(f"Failed to load thumbnail {page[i].name}: {e}")
+            cell.configure(image=photo or self.blank_thumbnail)
+            cell.image = photo  # 保持引用
+            self.update_grid_cell(i)
+        
+        self.grid_page_shown = page
+        self.current_image_path = page[self.grid_cursor] if page else None
+        self.set_label_buttons_state('normal')
+        self.update_status(f"Grid page {start // self.grid_page_size + 1}: H/L/S label the page except "
+                           f"marked images (Space/click marks, arrows move, Shift+H/L/S labels one image)")
+        self.frame_shown()
+    
+    def update_grid_cell(self, i):
+        """刷新一个格子的边框和文字：蓝色为选中，红色为例外，已单独标注的显示标签"""
+        page = self.grid_page()
+        if i >= len(page):
+            return
+        name = page[i].name
+        label = self.label_state.get(name)
+        color = '#d62728' if i in self.grid_exceptions else ('#1f77b4' if i == self.grid_cursor else '#f0f0f0')
+        text = name if len(name) <= 28 else name[:12] + '…' + name[-15:]
+        self.grid_cells[i].configure(text=f"{text}\n[{label}]" if label else text,
+                                     highlightbackground=color, highlightcolor=color)
+    
+    def move_grid_cursor(self, delta):
+        """移动选中的格子"""
+        page_length = len(self.grid_page())
+        if not page_length:
+            return
+        previous = self.grid_cursor
+        self.grid_cursor = max(0, min(page_length - 1, self.grid_cursor + delta))
+        self.current_image_path = self.grid_page()[self.grid_cursor]
+        self.update_grid_cell(previous)
+        self.update_grid_cell(self.grid_cursor)
+    
+    def click_grid_cell(self, i):
+        """点击格子：只对显示的一页有效，新的一页还没显示时忽略"""
+        if not self.pending_commands and self.display_current():
+            self.toggle_grid_exception(i)
+
+    def toggle_grid_exception(self, i):
+        """把一个格子标为例外（整页标注时不标注它）或取消"""
+        if not self.grid_mode or i >= len(self.grid_page()):
+            return
+        self.grid_exceptions ^= {i}
+        previous, self.grid_cursor = self.grid_cursor, i
+        self.current_image_path = self.grid_page()[i]
+        self.update_grid_cell(previous)
+        self.update_grid_cell(i)
+    
+    def turn_grid_page(self, pages):
+        """不标注，向前或向后翻页"""
+        start = self.current_image_index + pages * self.grid_page_size
+        if 0 <= start < len(self.image_files):
+            self.session.go_to(start)
+    
+    def label_grid_page(self, label_type):
+        """整页标注：当前页中除例外和已标注以外的图片都标为 label_type，一次写盘，然后翻到下一页"""
+        page = self.grid_page()
+        if not page:
+            return
+        names = [path.name for i, path in enumerate(page)
+                 if i not in self.grid_exceptions and path.name not in self.label_state]
+        # 整页作为一次操作撤销，撤销后回到这一页
+        self.session.label_many(names, label_type)
+        skipped = len(page) - len(names)
+        self.session.go_to(self.current_image_index + len(page))
+        self.update_status(f"Labeled {len(names)} images as {label_type}"
+                           + (f", {skipped} left for single view" if skipped else ""))
+    
+    def label_grid_cell(self, label_type):
+        """只标注选中的格子（不翻页）"""
+        page = self.grid_page()
+        if not page:
+            return
+        self.session.label_many([page[self.grid_cursor].name], label_type)
+        self.grid_exceptions.discard(self.grid_cursor)
+        self.update_grid_cell(self.grid_cursor)
+    
+    def handle_grid_keypress(self, event):
+        """网格模式的键盘操作：都针对显示的一页，显示还没跟上时排队"""
+        keys = {'h': 'highQuality', 'l': 'lowQuality', 's': 'skip'}
+        moves = {'Left': -1, 'Right': 1, 'Up': -self.grid_cols, 'Down': self.grid_cols}
+        if event.state & 0x4:
+            return  # Ctrl 组合键由专门的绑定处理
+        if event.char in keys:
+            self.run_command(lambda: self.label_grid_page(keys[event.char]))
+        elif event.char.lower() in keys:
+            self.run_command(lambda: self.label_grid_cell(keys[event.char.lower()]))  # Shift+H/L/S
+        elif event.keysym == 'space':
+            self.run_command(lambda: self.toggle_grid_exception(self.grid_cursor))
+        elif event.keysym in moves:
+            self.run_command(lambda: self.move_grid_cursor(moves[event.keysym]))
+        elif event.keysym == 'Next':
+            self.run_command(lambda: self.turn_grid_page(1))
+        elif event.keysym == 'Prior':
+            self.run_command(lambda: self.turn_grid_page(-1))
     
     def next_image(self):
         """移动到下一张图片"""
-        self.current_image_index += 1
-        self.update_progress_display()
-        self.update_stats_display()
-        self.update_task_info()
-        
-        if self.current_image_index < len(self.image_files):
-            self.show_current_image()
-        else:
-            self.show_completion_message()
+        with self.metrics.stage('next_image'):
+            self.session.advance()
     
     def update_progress_display(self):
         """更新进度显示"""
@@ -528,10 +1188,10 @@ class ImageLabeler:
     def update_stats_display(self):
         """更新统计信息显示"""
         # 统计标注数据
-        highQuality_labeled = sum(1 for label in self.labeled_files.values() if label == 'highQuality')
-        lowQuality_labeled = sum(1 for label in self.labeled_files.values() if label == 'lowQuality')
-        skip_count = sum(1 for label in self.labeled_files.values() if label == 'skip')
-        total_labeled = len(self.labeled_files)
+        highQuality_labeled = self.label_state.count('highQuality')
+        lowQuality_labeled = self.label_state.count('lowQuality')
+        skip_count = self.label_state.count('skip')
+        total_labeled = self.label_state.total
         
         stats_text = f"Stats: highQuality: {highQuality_labeled} | lowQuality: {lowQuality_labeled} | skip: {skip_count} | total: {total_labeled}"
         self.stats_label.configure(text=stats_text)
@@ -543,221 +1203,60 @@ class ImageLabeler:
             return
         
         try:
-            # 创建输出目录
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            task_id = self.current_task.get('task_id', 'unknown')
-            output_dir = self.project_dir / "output" / f"task_{task_id}_{timestamp}"
-            output_dir.mkdir(parents=True, exist_ok=True)
-            
-            # 自动生成文件名
-            csv_filename = f"task_{task_id}_results_{timestamp}.csv"
-            csv_path = output_dir / csv_filename
-            
-            # 收集标注数据
-            labeling_data = []
-            
-            # 从标注记录收集数据（从JSON文件中读取的标注信息）
-            for filename, label in self.labeled_files.items():
-                # 检查文件是否在images目录中
-                image_file_path = self.images_dir / filename
-                if image_file_path.exists():
-                    labeling_data.append({
-                        'filename': filename,
-                        'label': label,
-                        'folder': 'images',
-                        'file_size': image_file_path.stat().st_size,
-                        'modified_time': datetime.fromtimestamp(image_file_path.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S")
-                    })
-                else:
-                    # 如果文件不存在，仍然记录标注信息，但标记为文件不存在
-                    labeling_data.append({
-                        'filename': filename,
-                        'label': label,
-                        'folder': 'not_found',
-                        'file_size': 0,
-                        'modified_time': 'N/A'
-                    })
-            
-            # 写入CSV文件
-            with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['filename', 'label', 'folder', 'file_size', 'modified_time']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                writer.writeheader()
-                for data in labeling_data:
-                    writer.writerow(data)
-            
-            # 创建分类文件夹
-            export_highQuality_dir = output_dir / "highQuality"
-            export_lowQuality_dir = output_dir / "lowQuality"
-            export_skip_dir = output_dir / "skip"
-            export_unlabeled_dir = output_dir / "unlabeled"
-            
-            # 创建目录
-            export_highQuality_dir.mkdir(parents=True, exist_ok=True)
-            export_lowQuality_dir.mkdir(parents=True, exist_ok=True)
-            export_skip_dir.mkdir(parents=True, exist_ok=True)
-            export_unlabeled_dir.mkdir(parents=True, exist_ok=True)
-            
-            # 复制文件到对应目录
-            moved_count = 0
-            not_found_count = 0
-            
-            # 获取所有已标注的文件名集合
-            labeled_filenames = set(self.labeled_files.keys())
-            
-            # 复制已标注的文件
-            for filename, label in self.labeled_files.items():
-                source_path = self.images_dir / filename
-                if source_path.exists():
-                    if label == 'highQuality':
-                        target_path = export_highQuality_dir / filename
-                    elif label == 'lowQuality':
-                        target_path = export_lowQuality_dir / filename
-                    elif label == 'skip':
-                        target_path = export_skip_dir / filename
-                    else:
-                        continue
-                    
-                    try:
-                        shutil.copy2(str(source_path), str(target_path))
-                        moved_count += 1
-                    except Exception as e:
-                        print(f"复制文件失败 {filename}: {e}")
-                else:
-                    not_found_count += 1
-                    print(f"文件不存在: {filename}")
-            
-            # 复制未标注的文件（只针对当前task中的图片）
-            unlabeled_count = 0
-            task_image_names = set(self.current_task.get('images', []))
-            for file_path in self.images_dir.iterdir():
-                if file_path.is_file() and file_path.suffix.lower() in {'.jpg', '.jpeg', '.jpe', '.png', '.bmp', '.gif', '.tiff'}:
-                    # 只处理当前task中的图片
-                    if file_path.name in task_image_names and file_path.name not in labeled_filenames:
-                        target_path = export_unlabeled_dir / file_path.name
-                        try:
-                            shutil.copy2(str(file_path), str(target_path))
-                            unlabeled_count += 1
-                        except Exception as e:
-                            print(f"复制未标注文件失败 {file_path.name}: {e}")
-            
-            # 生成统计报告
-            report_path = output_dir / f"task_{task_id}_report_{timestamp}.txt"
-            self.generate_report(report_path, labeling_data)
-            
-            # 复制任务进度文件
-            if self.task_progress_file and self.task_progress_file.exists():
-                progress_copy_path = output_dir / f"task_progress_{task_id}_{timestamp}.json"
-                shutil.copy2(str(self.task_progress_file), str(progress_copy_path))
+            # 有未完成的导出时可以继续
+            resume_dir = self.session.find_incomplete_export()
+            if resume_dir and not messagebox.askyesno(
+                    "Resume export", f"Found an interrupted export:\n{resume_dir}\n\nResume it?"):
+                resume_dir = None
+            report = self.session.export(strategy=self.export_strategy.get(), parquet=self.export_parquet.get(),
+                                         resume_dir=resume_dir)
             
             messagebox.showinfo("Export success", 
-                              f"Task results have been exported to:\n{output_dir}\n\n"
+                              f"Task results have been exported to:\n{report.output_dir}\n\n"
                               f"Contains:\n"
-                              f"• CSV result file: {csv_filename}\n"
-                              f"• Statistics report: task_{task_id}_report_{timestamp}.txt\n"
-                              f"• Task progress file: task_progress_{task_id}_{timestamp}.json\n"
+                              f"• CSV result file: {report.csv_filename}\n"
+                              f"• Statistics report: {report.report_filename}\n"
+                              + (f"• Parquet result file: {report.parquet_filename}\n" if report.parquet_filename else "") +
+                              f"• Task progress file: {report.progress_filename}\n"
                               f"• Classified image folders: highQuality, lowQuality, skip, unlabeled\n\n"
-                              f"Processed {moved_count} labeled files, {unlabeled_count} unlabeled files, {not_found_count} files not found")
+                              f"Processed {report.labeled} labeled files, {report.unlabeled} unlabeled files, {report.not_found} files not found\n"
+                              f"Export mode: {report.strategy}, {report.resumed} files resumed from a previous run "
+                              f"({report.moved} moved, {report.removed} removed after relabeling), "
+                              f"{len(report.errors)} files failed")
             
-            self.update_status(f"Task {task_id} results have been exported with {len(labeling_data)} labeled records")
+            self.update_status(f"Task {report.task_id} results have been exported with {self.label_state.total} labeled records")
             
         except Exception as e:
             messagebox.showerror("Export failed", f"Error during export: {e}")
     
-    def generate_report(self, report_path, labeling_data):
-        """生成统计报告"""
-        try:
-            with open(report_path, 'w', encoding='utf-8') as f:
-                f.write("Task labeling results statistics report\n")
-                f.write("=" * 50 + "\n")
-                f.write(f"Task ID: {self.current_task.get('task_id', 'unknown')}\n")
-                f.write(f"Task name: {self.current_task.get('task_name', 'unknown')}\n")
-                f.write(f"Generated time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-                
-                # 总体统计
-                total_count = len(labeling_data)
-                highQuality_count = len([d for d in labeling_data if d['label'] == 'highQuality'])
-                lowQuality_count = len([d for d in labeling_data if d['label'] == 'lowQuality'])
-                skip_count = len([d for d in labeling_data if d['label'] == 'skip'])
-                
-                # 统计未标注文件（只针对当前task中的图片）
-                unlabeled_count = 0
-                task_image_names = set(self.current_task.get('images', []))
-                for file_path in self.images_dir.iterdir():
-                    if file_path.is_file() and file_path.suffix.lower() in {'.jpg', '.jpeg', '.jpe', '.png', '.bmp', '.gif', '.tiff'}:
-                        # 只统计当前task中的未标注图片
-                        if file_path.name in task_image_names and file_path.name not in self.labeled_files:
-                            unlabeled_count += 1
-                
-                total_all_files = total_count + unlabeled_count
-                
-                f.write("Overall statistics:\n")
-                f.write(f"  Total labeled: {total_count}\n")
-                f.write(f"  highQuality: {highQuality_count}\n")
-                f.write(f"  lowQuality: {lowQuality_count}\n")
-                f.write(f"  skip: {skip_count}\n")
-                f.write(f"  unlabeled: {unlabeled_count}\n")
-                f.write(f"  total files: {total_all_files}\n")
-                f.write(f"  highQuality ratio: {highQuality_count/total_count*100:.1f}%\n" if total_count > 0 else "  highQuality ratio: 0%\n")
-                f.write(f"  lowQuality ratio: {lowQuality_count/total_count*100:.1f}%\n" if total_count > 0 else "  lowQuality ratio: 0%\n")
-                f.write(f"  skip ratio: {skip_count/total_count*100:.1f}%\n" if total_count > 0 else "  skip ratio: 0%\n")
-                f.write(f"  unlabeled ratio: {unlabeled_count/total_all_files*100:.1f}%\n" if total_all_files > 0 else "  unlabeled ratio: 0%\n\n")
-                
-                # 文件大小统计
-                total_size = sum(d['file_size'] for d in labeling_data)
-                avg_size = total_size / total_count if total_count > 0 else 0
-                
-                f.write("File size statistics:\n")
-                f.write(f"  Total size: {total_size / 1024 / 1024:.2f} MB\n")
-                f.write(f"  Average size: {avg_size / 1024:.2f} KB\n\n")
-                
-                # 按标签分类的文件列表
-                f.write("highQuality file list:\n")
-                f.write("-" * 30 + "\n")
-                highQuality_files = [d for d in labeling_data if d['label'] == 'highQuality']
-                for data in sorted(highQuality_files, key=lambda x: x['filename']):
-                    f.write(f"  {data['filename']} ({data['file_size']/1024:.1f} KB)\n")
-                
-                f.write("\nlowQuality file list:\n")
-                f.write("-" * 30 + "\n")
-                lowQuality_files = [d for d in labeling_data if d['label'] == 'lowQuality']
-                for data in sorted(lowQuality_files, key=lambda x: x['filename']):
-                    f.write(f"  {data['filename']} ({data['file_size']/1024:.1f} KB)\n")
-                
-                f.write("\nskip file list:\n")
-                f.write("-" * 30 + "\n")
-                skip_files = [d for d in labeling_data if d['label'] == 'skip']
-                for data in sorted(skip_files, key=lambda x: x['filename']):
-                    f.write(f"  {data['filename']} ({data['file_size']/1024:.1f} KB)\n")
-                
-                # 未标注文件统计（只针对当前task中的图片）
-                unlabeled_files = []
-                task_image_names = set(self.current_task.get('images', []))
-                for file_path in self.images_dir.iterdir():
-                    if file_path.is_file() and file_path.suffix.lower() in {'.jpg', '.jpeg', '.jpe', '.png', '.bmp', '.gif', '.tiff'}:
-                        # 只统计当前task中的未标注图片
-                        if file_path.name in task_image_names and file_path.name not in self.labeled_files:
-                            unlabeled_files.append({
-                                'filename': file_path.name,
-                                'file_size': file_path.stat().st_size,
-                                'modified_time': datetime.fromtimestamp(file_path.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S")
-                            })
-                
-                f.write(f"\nUnlabeled file list (total {len(unlabeled_files)} files):\n")
-                f.write("-" * 30 + "\n")
-                for data in sorted(unlabeled_files, key=lambda x: x['filename']):
-                    f.write(f"  {data['filename']} ({data['file_size']/1024:.1f} KB)\n")
-                
-        except Exception as e:
-            print(f"Failed to generate report: {e}")
-    
     def update_status(self, message):
         """更新状态栏"""
         self.status_label.configure(text=message)
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="Image labeling tool")
+    parser.add_argument('--profile-startup', action='store_true', help="Print per-phase startup timing")
+    parser.add_argument('--queue', help="Label from a work queue (SQLite file or http://host:port) instead of task files")
+    parser.add_argument('--label-db', help="Also store labels in this SQLite database")
+    parser.add_argument('--order', choices=QUEUE_ORDERS, default='name',
+                        help="Queue order (score/uncertainty need: python image_quality.py build)")
+    parser.add_argument('--auto-low', type=float, default=AUTO_LOW_THRESHOLD,
+                        help="Auto-label images scoring below this as lowQuality")
+    parser.add_argument('--auto-high', type=float, default=AUTO_HIGH_THRESHOLD,
+                        help="Auto-label images scoring above this as highQuality (off by default)")
+    parser.add_argument('--grid', default='3x4', help="Grid mode page size as ROWSxCOLUMNS")
+    parser.add_argument('--metrics', action='store_true',
+                        help="Time the labeling hot path (F3 shows p50/p95/p99 per stage)")
+    parser.add_argument('--metrics-dump', help="Append per-stage latency percentiles to this JSONL file every 10 s")
+    args = parser.parse_args()
+    try:
+        grid_size = tuple(int(n) for n in args.grid.lower().split('x'))
+        if len(grid_size) != 2 or min(grid_size) < 1:
+            raise ValueError
+    except ValueError:
+        parser.error(f"--grid must look like 3x4, got {args.grid}")
+    
     root = tk.Tk()
     
     # 设置样式
@@ -765,7 +1264,9 @@ def main():
     style.theme_use('clam')
     
     # 创建应用
-    app = ImageLabeler(root)
+    app = ImageLabeler(root, profile_startup=args.profile_startup, queue_spec=args.queue, label_db=args.label_db,
+                       queue_order=args.order, auto_low=args.auto_low, auto_high=args.auto_high,
+                       grid_size=grid_size, metrics=args.metrics, metrics_dump=args.metrics_dump)
     
     # 启动应用
     root.mainloop()
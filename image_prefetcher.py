@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片预取
+在后台线程池中提前解码、缩放后续图片，主线程只需创建PhotoImage
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from display_decoder import DisplayDecoder
+
+
+def image_nbytes(image):
+    """估算解码后图片占用的内存"""
+    return image.width * image.height * len(image.getbands())
+
+
+class ImagePrefetcher:
+    """后台解码预取 + 按字节预算淘汰的LRU缓存"""
+
+    def __init__(self, decode=None, lookahead=8, max_bytes=256 * 1024 * 1024,
+                 workers=2):
+        self.decode = decode or DisplayDecoder()  # 任意 path -> PIL.Image 的解码器
+        self.lookahead = lookahead  # 向后预取的图片数量
+        self.max_bytes = max_bytes  # 缓存的字节预算
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # path -> 解码后的图片
+        self._cache_bytes = 0
+        self._inflight = {}  # path -> Future
+        self._generation = 0  # 取消时递增，丢弃旧的结果
+
+    def load(self, image_path):
+        """获取显示用图片：优先取缓存，其次等待进行中的预取，最后同步解码"""
+        with self._lock:
+            image = self._cache.get(image_path)
+            if image is not None:
+                self._cache.move_to_end(image_path)
+                return image
+            future = self._inflight.get(image_path)
+
+        if future is not None:
+            try:
+                image = future.result()
+            except CancelledError:
+                image = None
+            if image is not None:
+                return image
+
+        image = self.decode(image_path)
+        with self._lock:
+            self._store(image_path, image)
+        return image
+
+    def ready(self, image_path):
+        """load 是否不必等待后台解码（已在缓存中，或没有进行中的解码）"""
+        with self._lock:
+            return image_path in self._cache or image_path not in self._inflight
+
+    def prefetch(self, image_paths, drop_others=False):
+        """预取给定的后续图片（最多lookahead张）；drop_others 时取消其他尚未开始的解码（已跳过的图片）"""
+        with self._lock:
+            generation = self._generation
+            wanted = image_paths[:self.lookahead]
+            if drop_others:
+                keep = set(wanted)
+                for image_path, future in list(self._inflight.items()):
+                    if image_path not in keep and future.cancel():
+                        del self._inflight[image_path]
+            for image_path in wanted:
+                if image_path in self._cache or image_path in self._inflight:
+                    continue
+                future = self._executor.submit(self._decode_job, image_path, generation)
+                self._inflight[image_path] = future
+
+    def _decode_job(self, image_path, generation):
+        """后台线程：解码并放入缓存"""
+        try:
+            image = self.decode(image_path)
+        except Exception as e:
+            print(f"Prefetch failed {image_path}: {e}")
+            image = None
+
+        with self._lock:
+            self._inflight.pop(image_path, None)
+            if image is not None and generation == self._generation:
+                self._store(image_path, image)
+        return image
+
+    def _store(self, image_path, image):
+        """放入缓存并按字节预算淘汰最久未使用的图片（调用方持有锁）"""
+        if image_path in self._cache:
+            self._cache_bytes -= image_nbytes(self._cache.pop(image_path))
+        self._cache[image_path] = image
+        self._cache_bytes += image_nbytes(image)
+
+        while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= image_nbytes(evicted)
+
+    def cancel(self):
+        """取消所有进行中的预取并清空缓存（切换任务或图片目录时调用）"""
+        with self._lock:
+            self._generation += 1
+            for future in self._inflight.values():
+                future.cancel()
+            self._inflight.clear()
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def shutdown(self):
+        """关闭线程池"""
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片质量预评分
+对缩小后的灰度图用NumPy计算清晰度（拉普拉斯方差）、曝光（平均亮度和过暗/过亮像素比例）、
+噪声（Immerkær 快速噪声估计）和分辨率，合成一个 0~1 的质量分；
+多进程遍历图片目录，结果按 文件名 + 大小 + 修改时间 缓存在磁盘上，未变化的图片不重复计算。
+标注工具可以按质量分或不确定度排列待标注队列，并可把分数极端的图片批量预标注后逐张复核。
+
+计算评分（需要 numpy）:
+    python image_quality.py build --images-dir images [--index image_quality.npz] [--workers N]
+查看分数分布和最差的图片:
+    python image_quality.py show [--index image_quality.npz] [--limit 20]
+"""
+
+import os
+import sys
+import argparse
+from pathlib import Path
+from PIL import Image
+from npz_index import NpzIndex
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+METRICS = ('sharpness', 'brightness', 'clipped', 'noise', 'megapixels', 'score')
+QUEUE_ORDERS = ('name', 'score', 'uncertainty')
+
+# 评分时的最大边长（JPEG用draft按缩小比例解码）
+ANALYSIS_SIZE = 512
+
+# 默认的预标注阈值：低于 LOW 视为 lowQuality；HIGH 为None时不自动标注 highQuality
+AUTO_LOW_THRESHOLD = 0.2
+AUTO_HIGH_THRESHOLD = None
+
+# Immerkær 噪声估计的卷积核
+_NOISE_KERNEL = ((1, -2, 1), (-2, 4, -2), (1, -2, 1))
+
+
+def numpy_available():
+    """是否安装了 numpy"""
+    return np is not None
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Quality scoring requires numpy (pip install numpy)")
+
+
+def _load_gray(path):
+    """读取为最长边不超过 ANALYSIS_SIZE 的灰度数组，同时返回原图尺寸"""
+    with Image.open(path) as image:
+        original_size = image.size
+        image.draft('L', (ANALYSIS_SIZE, ANALYSIS_SIZE))
+        image = image.convert('L')
+        if max(image.size) > ANALYSIS_SIZE:
+            image.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE), Image.BILINEAR)
+        return np.asarray(image, dtype=np.float32), original_size
+
+
+def _conv3(gray, kernel):
+    """3x3 卷积（只计算有效区域），用切片相加代替逐像素循环"""
+    height, width = gray.shape
+    out = np.zeros((height - 2, width - 2), dtype=np.float32)
+    for dy in range(3):
+        for dx in range(3):
+            if kernel[dy][dx]:
+                out += kernel[dy][dx] * gray[dy:dy + height - 2, dx:dx + width - 2]
+    return out
+
+
+def measure(gray, original_size):
+    """单张灰度图的各项指标（不含合成分数）"""
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        return {'sharpness': 0.0, 'brightness': float(gray.mean()) / 255, 'clipped': 1.0,
+                'noise': 0.0, 'megapixels': original_size[0] * original_size[1] / 1e6}
+    laplacian = _conv3(gray, ((0, 1, 0), (1, -4, 1), (0, 1, 0)))
+    height, width = gray.shape
+    noise = np.abs(_conv3(gray, _NOISE_KERNEL)).sum() * np.sqrt(np.pi / 2) / (6 * (width - 2) * (height - 2))
+    return {
+        'sharpness': float(laplacian.var()),
+        'brightness': float(gray.mean()) / 255,
+        'clipped': float(np.count_nonzero((gray <= 5) | (gray >= 250))) / gray.size,
+        'noise': float(noise),
+        'megapixels': original_size[0] * original_size[1] / 1e6,
+    }
+
+
+def combine_scores(metrics):
+    """由各项指标数组合成 0~1 的质量分（越高越好），对整列一次性计算
+
+    清晰度按对数缩放（方差约1000以上视为清晰），曝光偏离中间亮度和大面积过暗/过亮扣分，
+    噪声标准差超过约20扣满，分辨率2百万像素以上不扣分。权重是经验值。
+    """
+    sharpness = np.clip(np.log10(metrics['sharpness'] + 1) / 3, 0, 1)
+    exposure = np.clip(1 - np.abs(metrics['brightness'] - 0.5) * 2, 0, 1) * (1 - metrics['clipped'])
+    noise = 1 - np.clip(metrics['noise'] / 20, 0, 1)
+    resolution = np.clip(metrics['megapixels'] / 2, 0, 1)
+    return (0.5 * sharpness + 0.2 * exposure + 0.15 * noise + 0.15 * resolution).astype(np.float32)
+
+
+def _score_chunk(paths):
+    """工作进程：一批图片 -> (成功的下标列表, 指标字典, 错误列表)"""
+    ok, rows, errors = [], [], []
+    for i, path in enumerate(paths):
+        try:
+            gray, original_size = _load_gray(path)
+            rows.append(measure(gray, original_size))
+        except Exception as e:
+            errors.append(f"{os.path.basename(path)}: {e}")
+            continue
+        ok.append(i)
+    if not ok:
+        return ok, None, errors
+    metrics = {key: np.array([row[key] for row in rows], dtype=np.float32) for key in METRICS[:-1]}
+    metrics['score'] = combine_scores(metrics)
+    return ok, metrics, errors
+
+
+class QualityIndex(NpzIndex):
+    """持久化的评分表：文件名、大小、修改时间和各项指标（npz文件）"""
+
+    COLUMNS = METRICS
+    DTYPE = 'float32'
+    REQUIRES = "Quality scoring requires numpy (pip install numpy)"
+
+    @property
+    def metrics(self):
+        """{指标名: (n,) float32}"""
+        return self.columns
+
+    def scores(self):
+        """{文件名: 质量分}"""
+        return dict(zip(self.names, self.metrics['score'].tolist()))
+
+
+def build_index(images_dir, index_path, workers=None, chunk_size=32, progress=None):
+    """为目录中新增或变化的图片评分并写回索引，返回 (索引, 新计算数, 错误列表)"""
+    return QualityIndex.build(images_dir, index_path, _score_chunk, workers, chunk_size, progress)
+
+
+def queue_sort_key(scores, order, low=AUTO_LOW_THRESHOLD, high=AUTO_HIGH_THRESHOLD):
+    """待标注队列的排序键（order为'name'时返回None，即按文件名）
+
+    score: 质量分从低到高；uncertainty: 离判断边界（两个阈值的中点）最近的在前，
+    最难判断的图片先交给人看。没有评分的图片排在最后，同分按文件名。
+    """
+    if order == 'name':
+        return None
+    if order not in QUEUE_ORDERS:
+        raise ValueError(f"Unknown queue order: {order}")
+    missing = float('inf')
+    if order == 'score':
+        return lambda name: (scores.get(name, missing), name)
+    boundary = (low + (high if high is not None else 1.0)) / 2
+    return lambda name: (abs(scores[name] - boundary) if name in scores else missing, name)
+
+
+def auto_labels(scores, names, low=AUTO_LOW_THRESHOLD, high=AUTO_HIGH_THRESHOLD):
+    """分数极端的图片的预标注：{文件名: 标签}；low/high 为None时不标注对应一侧"""
+    labels = {}
+    for name in names:
+        score = scores.get(name)
+        if score is None:
+            continue
+        if low is not None and score < low:
+            labels[name] = 'lowQuality'
+        elif high is not None and score > high:
+            labels[name] = 'highQuality'
+    return labels
+
+
+def main(argv=None):
+    """命令行入口"""
+    project_dir = Path(__file__).parent
+    parser = argparse.ArgumentParser(description="Image quality pre-scoring")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="Score new or changed images in a directory")
+    build_parser.add_argument('--images-dir', default=str(project_dir / "images"))
+    build_parser.add_argument('--index', default=str(project_dir / "image_quality.npz"))
+    build_parser.add_argument('--workers', type=int, default=None, help="Default: all CPU cores")
+
+    show_parser = subparsers.add_parser('show', help="Score distribution and the lowest-scoring images")
+    show_parser.add_argument('--index', default=str(project_dir / "image_quality.npz"))
+    show_parser.add_argument('--limit', type=int, default=20, help="Images to print")
+
+    args = parser.parse_args(argv)
+    if np is None:
+        print("Quality scoring requires numpy (pip install numpy)")
+        return 1
+
+    if args.command == 'build':
+        def progress(done, total):
+            if done % 5000 < 32:
+                print(f"  {min(done, total)}/{total}")
+
+        index, computed, errors = build_index(args.images_dir, args.index, args.workers, progress=progress)
+        print(f"Done: {len(index)} images in {args.index}, {computed} scored, {len(errors)} failed")
+        for error in errors[:20]:
+            print(f"  {error}")
+    elif args.command == 'show':
+        index = QualityIndex.load(args.index)
+        if not len(index):
+            print("No scored images")
+            return 0
+        score = index.metrics['score']
+        print(f"{len(index)} images, score percentiles "
+              + ", ".join(f"p{p}={v:.3f}" for p, v in zip((5, 25, 50, 75, 95),
+                                                         np.percentile(score, (5, 25, 50, 75, 95)))))
+        print(f"  below {AUTO_LOW_THRESHOLD}: {int(np.count_nonzero(score < AUTO_LOW_THRESHOLD))}")
+        print(f"{'score':>6} {'sharp':>9} {'bright':>6} {'clip':>5} {'noise':>6} {'MP':>5}  name")
+        for i in np.argsort(score, kind='stable')[:args.limit]:
+            m = {key: index.metrics[key][i] for key in METRICS}
+            print(f"{m['score']:6.3f} {m['sharpness']:9.1f} {m['brightness']:6.2f} {m['clipped']:5.2f} "
+                  f"{m['noise']:6.2f} {m['megapixels']:5.2f}  {index.names[i]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,732 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地Web标注服务
+asyncio + 标准库实现的HTTP服务：浏览器中标注，多个标注者共用一台机器的预览图缓存和解码线程池。
+每个标注者（请求头 X-Annotator 或参数 annotator）有自己的 LabelSession，
+任务清单、任务进度文件、租约和导出格式与桌面标注工具完全相同。
+
+    GET  /                     标注页面（H/L/S 标注，U 撤销）
+    GET  /api/tasks            任务列表和进度
+    POST /api/task             {"task": 任务文件名, "force": false}  加载任务（被他人持有时返回409）
+    GET  /api/queue?limit=50   当前任务的待标注图片；Link 头给出前 lookahead 张的 prefetch 提示，服务器同时预先解码
+    GET  /img/<文件名>         显示尺寸的预览图（ETag / Cache-Control，If-None-Match 命中时返回304）
+    POST /api/labels           {"labels": [{"image": 文件名, "label": 标签}, ...]}  缓冲后按批写盘，返回202
+    POST /api/undo             撤销最后一次标注
+    GET  /api/stats            标注统计、缓冲中的标注数和图片缓存命中率
+
+用法:
+    python label_server.py [--project-dir .] [--host 127.0.0.1] [--port 8780] [--label-db labels.db]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+from pathlib import Path
+from itertools import islice
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs, unquote, quote
+from concurrent.futures import ThreadPoolExecutor
+import dir_index
+from display_decoder import DisplayDecoder
+from preview_cache import PreviewCache
+from label_state import LABEL_TYPES
+from task_index import TaskIndex
+from task_lease import LeaseHeldError, default_annotator
+from latency_metrics import LatencyMetrics
+from label_session import LabelSession
+
+STATUS_TEXT = {200: 'OK', 202: 'Accepted', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+               409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+CONTENT_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+MAX_BODY = 1024 * 1024
+MAX_HEADERS = 100
+
+
+class HttpError(Exception):
+    """以指定状态码返回给客户端的错误"""
+
+    def __init__(self, status, message, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+class Request:
+    """解析后的HTTP请求"""
+
+    def __init__(self, method, target, headers, body):
+        self.method = method
+        parts = urlsplit(target)
+        self.path = unquote(parts.path)
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        try:
+            return json.loads(self.body or b'{}')
+        except ValueError as e:
+            raise HttpError(400, f"Invalid JSON: {e}")
+
+
+class Response:
+    """HTTP响应（body 为字节串）"""
+
+    def __init__(self, status=200, body=b'', content_type='application/json', headers=None):
+        self.status = status
+        self.body = body
+        self.headers = {'Content-Type': content_type}
+        self.headers.update(headers or {})
+
+    @classmethod
+    def json(cls, payload, status=200, headers=None):
+        return cls(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'), headers=headers)
+
+    def encode(self, keep_alive):
+        lines = [f"HTTP/1.1 {self.status} {STATUS_TEXT.get(self.status, '')}"]
+        headers = dict(self.headers, **{'Content-Length': str(len(self.body)),
+                                        'Connection': 'keep-alive' if keep_alive else 'close'})
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + self.body
+
+
+async def read_request(reader):
+    """读取一个请求；连接关闭时返回None"""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, version = request_line.decode('latin-1').split()
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise HttpError(400, "Too many headers")
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length")
+    if length > MAX_BODY:
+        raise HttpError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b''
+    request = Request(method, target, headers, body)
+    request.keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+    return request
+
+
+class ImagePipeline:
+    """服务器端的图片处理：所有标注者共用
+
+    预览图（显示尺寸）先查内存中的编码后字节LRU，再查磁盘预览图缓存，都未命中才在线程池中解码原图；
+    同一张图片的并发请求只解码一次。ETag 即预览图缓存键（文件名 + 大小 + 修改时间 + 预览尺寸）。
+    """
+
+    def __init__(self, preview_cache, executor, max_bytes=128 * 1024 * 1024):
+        self.cache = preview_cache
+        self.executor = executor
+        self.max_bytes = max_bytes
+        self.content_type = CONTENT_TYPES[preview_cache.image_format]
+        self._memory = OrderedDict()  # 缓存键 -> 编码后的字节
+        self._memory_bytes = 0
+        self._inflight = {}  # 缓存键 -> asyncio.Future
+        self._prefetching = set()  # 进行中的预取任务
+        self.hits = 0  # 内存命中
+        self.shared = 0  # 等待进行中的同一张图片（通常是预取）
+        self.loads = 0  # 从磁盘预览图读取或解码
+
+    async def get(self, image_path):
+        """返回 (ETag, 编码后的字节)"""
+        key = self.cache.key(image_path)
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return key, data
+
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, self._load, image_path, key)
+            self._inflight[key] = future
+            try:
+                data = await asyncio.shield(future)  # 客户端断开时不取消其他请求也在等的解码
+            finally:
+                del self._inflight[key]
+            self.loads += 1
+            self._remember(key, data)
+            return key, data
+        self.shared += 1
+        return key, await asyncio.shield(future)
+
+    def prefetch(self, image_paths):
+        """在后台准备这些图片（已在内存或正在准备的跳过）"""
+        for image_path in image_paths:
+            try:
+                key = self.cache.key(image_path)
+            except OSError:
+                continue
+            if key not in self._memory and key not in self._inflight:
+                task = asyncio.ensure_future(self.get(image_path))
+                self._prefetching.add(task)
+                task.add_done_callback(self._prefetch_done)
+
+    def _prefetch_done(self, task):
+        self._prefetching.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"Failed to prefetch image: {task.exception()}")
+
+    def close(self):
+        """取消进行中的预取"""
+        for task in list(self._prefetching):
+            task.cancel()
+
+    def _load(self, image_path, key):
+        """工作线程：读取磁盘预览图，未命中时解码原图并写入磁盘缓存"""
+        preview_path = self.cache.preview_path(key)
+        try:
+            data = preview_path.read_bytes()
+            os.utime(preview_path)  # LRU的最近使用时间
+            return data
+        except FileNotFoundError:
+            pass
+        image = self.cache.decoder(image_path)
+        try:
+            self.cache.put(image_path, image)
+            return preview_path.read_bytes()
+        except OSError as e:
+            print(f"Failed to write preview cache for {Path(image_path).name}: {e}")
+            buffer = io.BytesIO()
+            image.convert('RGB').save(buffer, self.cache.image_format, quality=self.cache.quality)
+            return buffer.getvalue()
+
+    def _remember(self, key, data):
+        if key in self._memory:
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def stats(self):
+        return {'memory_hits': self.hits, 'shared': self.shared, 'loads': self.loads,
+                'memory_images': len(self._memory),
+                'memory_mb': round(self._memory_bytes / (1024 * 1024), 1)}
+
+
+class AnnotatorSlot:
+    """一个标注者的会话
+
+    会话的所有操作（包括读取队列、标注状态和统计）都在它专用的单线程执行器中按提交顺序执行
+    （会话本身不是线程安全的，SQLite标签库的连接也只能在创建它的线程中使用），事件循环不会被写盘阻塞。
+    """
+
+    def __init__(self, annotator):
+        self.annotator = annotator
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"session-{annotator}")
+        self.session = None
+        self.ready = None  # 创建会话的任务（同一标注者的并发首个请求都等它）
+        self.task = None  # 当前任务文件名（换任务期间为None，拒绝标注请求）
+        self.task_names = frozenset()  # 当前任务的图片文件名（校验标注请求）
+        self.pending = []  # 尚未写入会话的标注 [(任务文件名, 文件名, 标签)]
+        self.scan_from = 0  # 队列中这个位置之前都已标注（只在会话线程中读写；撤销、换任务时归零）
+        self.prefetch_task = None  # 最近一次在后台查找并预取下几张未标注图片
+        self.commit_handle = None  # 延迟写入的定时器
+        self.commit_task = None  # 最近一次在后台开始的写入
+        self.commit_errors = 0  # 写入失败次数（标注已放回缓冲，下次重试）
+        self.last_commit_error = None
+
+    async def run(self, func, *args):
+        """在会话线程中执行 func(*args)"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+
+class LabelServer:
+    """Web标注服务"""
+
+    def __init__(self, project_dir, images_dir=None, label_db=None, lookahead=8, batch_size=50,
+                 commit_delay=0.5, workers=None, memory_bytes=128 * 1024 * 1024, max_age=600, metrics=None):
+        self.project_dir = Path(project_dir)
+        self.images_dir = Path(images_dir) if images_dir else self.project_dir / "images"
+        self.label_db = label_db
+        self.lookahead = lookahead  # 队列响应中提示预取、并在服务器端预先解码的图片数
+        self.batch_size = batch_size  # 缓冲的标注达到此数时立即写入
+        self.commit_delay = commit_delay  # 否则最多延迟这么多秒写入
+        self.max_age = max_age  # 图片的 Cache-Control max-age（秒）
+        self.metrics = metrics or LatencyMetrics(enabled=False)
+        self.task_index = TaskIndex(self.project_dir / "progress" / "task_index.json",
+                                    self.project_dir / "tasks", self.project_dir / "progress")
+        self.decode_executor = ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 4),
+                                                  thread_name_prefix="decode")
+        self.images = ImagePipeline(PreviewCache(self.project_dir / "preview_cache", DisplayDecoder()),
+                                    self.decode_executor, max_bytes=memory_bytes)
+        self.slots = {}  # 标注者 -> AnnotatorSlot
+        self.routes = {
+            ('GET', '/'): self.index_page,
+            ('GET', '/api/tasks'): self.list_tasks,
+            ('POST', '/api/task'): self.load_task,
+            ('GET', '/api/queue'): self.get_queue,
+            ('POST', '/api/labels'): self.post_labels,
+            ('POST', '/api/undo'): self.undo,
+            ('GET', '/api/stats'): self.get_stats,
+        }
+
+    # ---- 连接 ----
+
+    async def handle_connection(self, reader, writer):
+        """处理一个连接上的请求（HTTP/1.1 保持连接）"""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    writer.write(Response.json({'error': str(e)}, e.status).encode(False))
+                    break
+                if request is None:
+                    break
+                started = time.perf_counter()
+                response = await self.dispatch(request)
+                writer.write(response.encode(request.keep_alive))
+                await writer.drain()
+                self.metrics.record(f"http.{request.path.split('/')[1] or 'index'}", time.perf_counter() - started)
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request):
+        """按路径分发，把 HttpError 和其他异常转换成JSON错误响应"""
+        try:
+            if request.method == 'GET' and request.path.startswith('/img/'):
+                return await self.get_image(request)
+            handler = self.routes.get((request.method, request.path))
+            if handler is None:
+                raise HttpError(404, f"Not found: {request.method} {request.path}")
+            return await handler(request)
+        except HttpError as e:
+            return Response.json(dict(e.extra, error=str(e)), e.status)
+        except Exception as e:
+            print(f"Error handling {request.method} {request.path}: {e!r}")
+            return Response.json({'error': str(e)}, 500)
+
+    # ---- 标注者和会话 ----
+
+    def annotator_of(self, request):
+        """请求的标注者：X-Annotator 头或 annotator 参数，都没有时为本机默认标注者"""
+        annotator = request.headers.get('x-annotator') or request.query.get('annotator') or default_annotator()
+        if len(annotator) > 64 or not all(c.isalnum() or c in '-_.@' for c in annotator):
+            raise HttpError(400, "Annotator names may only contain letters, digits and -_.@")
+        return annotator
+
+    async def slot_for(self, request, require_task=True):
+        """请求的标注者的会话（第一次请求时创建）"""
+        annotator = self.annotator_of(request)
+        slot = self.slots.get(annotator)
+        if slot is None:
+            slot = self.slots[annotator] = AnnotatorSlot(annotator)
+            slot.ready = asyncio.ensure_future(slot.run(
+                lambda: LabelSession(self.project_dir, images_dir=self.images_dir, label_db=self.label_db,
+                                     annotator=annotator, task_index=self.task_index)))
+        slot.session = await slot.ready
+        if require_task and not slot.session.current_task:
+            raise HttpError(409, "No task loaded (POST /api/task first)")
+        return slot
+
+    async def commit(self, slot):
+        """把缓冲的标注一次写入会话（一次写盘）"""
+        if slot.commit_handle:
+            slot.commit_handle.cancel()
+            slot.commit_handle = None
+        records, slot.pending = slot.pending, []
+        if not records:
+            return
+
+        def apply():
+            # 只写入属于会话当前任务的标注（在会话线程中判断，与换任务按顺序执行；
+            # 文件名在接受请求时已按所标记的任务校验过）
+            session = slot.session
+            task = session.current_task.get('filename') if session.current_task else None
+            current = [(name, label) for record_task, name, label in records if record_task == task]
+            session.apply_labels(current)
+            return len(records) - len(current)
+
+        started = time.perf_counter()
+        try:
+            dropped = await slot.run(apply)
+        except Exception as e:
+            # 已回复202的标注不能丢：放回缓冲，下次写入时重试
+            slot.pending[:0] = records
+            slot.commit_errors += 1
+            slot.last_commit_error = f"{type(e).__name__}: {e}"
+            print(f"Failed to save labels of {slot.annotator}: {e}")
+            return
+        self.metrics.record('commit', time.perf_counter() - started)
+        if dropped:
+            print(f"Dropped {dropped} labels of {slot.annotator} for a task that is no longer loaded")
+
+    def start_commit(self, slot):
+        """在后台开始写入，保留任务句柄（关闭时等待它完成）"""
+        slot.commit_task = asyncio.ensure_future(self.commit(slot))
+
+    def schedule_commit(self, slot):
+        """缓冲满时立即写入，否则 commit_delay 秒后写入"""
+        if len(slot.pending) >= self.batch_size:
+            self.start_commit(slot)
+        elif slot.commit_handle is None:
+            loop = asyncio.get_running_loop()
+            slot.commit_handle = loop.call_later(self.commit_delay, self.start_commit, slot)
+
+    @staticmethod
+    def unlabeled(slot, pending, limit=None):
+        """会话线程：当前任务中尚未标注（也不在缓冲 pending 中）的前 limit 张图片（limit为None时全部），按会话的队列顺序
+
+        pending 为事件循环线程中取好的缓冲文件名集合。
+        """
+        files = slot.session.image_files
+        labeled = slot.session.label_state
+        start = slot.scan_from
+        while start < len(files) and (files[start].name in labeled or files[start].name in pending):
+            start += 1
+        slot.scan_from = start
+        remaining = (path for path in islice(files, start, None)
+                     if path.name not in labeled and path.name not in pending)
+        return list(islice(remaining, limit))
+
+    async def prefetch_unlabeled(self, slot):
+        """在会话线程中找出接下来的几张未标注图片并预先解码"""
+        pending = {name for _, name, _ in slot.pending}
+        self.images.prefetch(await slot.run(self.unlabeled, slot, pending, self.lookahead))
+
+    def image_url(self, name):
+        return f"/img/{quote(name)}"
+
+    # ---- 接口 ----
+
+    async def index_page(self, request):
+        return Response(200, INDEX_HTML.encode('utf-8'), content_type='text/html; charset=utf-8',
+                        headers={'Cache-Control': 'no-cache'})
+
+    async def list_tasks(self, request):
+        tasks = []
+        for filename in self.task_index.filenames():
+            summary = self.task_index.summary([filename])
+            tasks.append({'task': filename, 'name': self.task_index.display_name(filename),
+                          'completed': summary['completed'], 'total': summary['total_images']})
+        return Response.json({'tasks': tasks})
+
+    async def load_task(self, request):
+        payload = request.json()
+        task = payload.get('task')
+        if not task or Path(task).name != task or not (self.task_index.tasks_dir / task).exists():
+            raise HttpError(404, f"Task not found: {task}")
+        slot = await self.slot_for(request, require_task=False)
+        # 换任务期间的标注请求被拒绝；之前缓冲的标注先写入原任务
+        previous = slot.task, slot.task_names
+        slot.task, slot.task_names = None, frozenset()
+        await self.commit(slot)
+
+        def load():
+            session = slot.session
+            session.load_task(task, force=bool(payload.get('force')))
+            slot.scan_from = 0
+            return (frozenset(session.task_manifest), session.current_task.get('task_name', task),
+                    len(session.image_files), session.stats())
+        try:
+            slot.task_names, task_name, remaining, stats = await slot.run(load)
+            slot.task = task
+        except LeaseHeldError as e:
+            slot.task, slot.task_names = previous  # 原任务仍在会话中
+            raise HttpError(409, str(e), holder=e.holder.get('annotator'))
+        except BaseException:
+            slot.task, slot.task_names = previous
+            raise
+        return Response.json({'task': task, 'task_name': task_name, 'remaining': remaining, 'stats': stats})
+
+    async def get_queue(self, request):
+        slot = await self.slot_for(request)
+        await self.commit(slot)
+        try:
+            limit = max(1, min(1000, int(request.query.get('limit', 50))))
+        except ValueError:
+            raise HttpError(400, "limit must be an integer")
+        pending = {name for _, name, _ in slot.pending}
+
+        def read_queue():
+            session = slot.session
+            return session.current_task.get('filename'), self.unlabeled(slot, pending), session.stats()
+        task, remaining, stats = await slot.run(read_queue)
+        # 预取提示：浏览器按 Link 头预先下载，服务器同时在线程池中预先解码
+        ahead = remaining[:self.lookahead]
+        self.images.prefetch(ahead)
+        links = ', '.join(f"<{self.image_url(path.name)}>; rel=prefetch" for path in ahead)
+        return Response.json({'task': task, 'remaining': len(remaining),
+                              'images': [path.name for path in remaining[:limit]],
+                              'lookahead': self.lookahead, 'stats': stats},
+                             headers={'Link': links} if links else None)
+
+    async def get_image(self, request):
+        name = request.path[len('/img/'):]
+        # 只提供图片目录中的文件（目录列表有缓存），文件名中不能有路径
+        names = await asyncio.get_running_loop().run_in_executor(None, dir_index.list_directory, self.images_dir)
+        if not name or Path(name).name != name or name not in names:
+            raise HttpError(404, f"Image not found: {name}")
+        etag, data = await self.images.get(self.images_dir / name)
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': f"private, max-age={self.max_age}"}
+        if request.headers.get('if-none-match') == f'"{etag}"':
+            return Response(304, b'', content_type=self.images.content_type, headers=headers)
+        return Response(200, data, content_type=self.images.content_type, headers=headers)
+
+    async def post_labels(self, request):
+        slot = await self.slot_for(request)
+        if slot.task is None:
+            raise HttpError(409, "Task is being loaded")
+        payload = request.json()
+        items = payload.get('labels', [payload] if 'image' in payload else [])
+        records = []
+        for item in items:
+            name, label = item.get('image'), item.get('label')
+            if label not in LABEL_TYPES:
+                raise HttpError(400, f"Unknown label {label!r}, expected one of {', '.join(LABEL_TYPES)}")
+            if name not in slot.task_names:
+                raise HttpError(400, f"{name} is not in the current task")
+            records.append((slot.task, name, label))
+        slot.pending.extend(records)
+        self.schedule_commit(slot)
+        # 标注者接下来要看的图片提前解码（不等待，回复不排在写入之后）
+        slot.prefetch_task = asyncio.ensure_future(self.prefetch_unlabeled(slot))
+        return Response.json({'accepted': len(records), 'pending': len(slot.pending)}, 202)
+
+    async def undo(self, request):
+        slot = await self.slot_for(request)
+        await self.commit(slot)
+
+        def undo():
+            action = slot.session.undo()
+            slot.scan_from = 0
+            return action, slot.session.stats()
+        action, stats = await slot.run(undo)
+        if action is None:
+            raise HttpError(409, "Nothing to undo")
+        return Response.json({'image': action.filename, 'label': action.previous, 'stats': stats})
+
+    async def get_stats(self, request):
+        slot = await self.slot_for(request, require_task=False)
+
+        def read_stats():
+            session = slot.session
+            return session.current_task.get('filename') if session.current_task else None, session.stats()
+        task, stats = await slot.run(read_stats)
+        return Response.json({'annotator': slot.annotator, 'task': task,
+                              'stats': stats, 'pending': len(slot.pending),
+                              'commit_errors': slot.commit_errors, 'last_commit_error': slot.last_commit_error,
+                              'images': self.images.stats()})
+
+    # ---- 运行 ----
+
+    async def flush_loop(self, interval=1.0):
+        """定期将各会话的进度日志写盘、续期租约，并按间隔写出耗时统计"""
+        while True:
+            await asyncio.sleep(interval)
+            for slot in list(self.slots.values()):
+                if slot.session:
+                    if slot.pending and slot.commit_handle is None:
+                        await self.commit(slot)  # 重试写入失败后放回缓冲的标注
+                    await slot.run(slot.session.flush)
+            try:
+                self.metrics.maybe_dump()
+            except OSError as e:
+                print(f"Failed to write metrics: {e}")
+
+    async def close(self):
+        """写入缓冲的标注，保存进度并释放所有租约"""
+        for slot in list(self.slots.values()):
+            if slot.commit_task:
+                await slot.commit_task
+            if slot.prefetch_task:
+                await asyncio.gather(slot.prefetch_task, return_exceptions=True)
+            await self.commit(slot)
+            if slot.session:
+                await slot.run(slot.session.close)
+            slot.executor.shutdown()
+        self.images.close()
+        self.decode_executor.shutdown(wait=True, cancel_futures=True)
+        if self.metrics.enabled:
+            self.metrics.maybe_dump(force=True)
+
+    async def serve(self, host='127.0.0.1', port=8780, ready=None):
+        """运行服务直到被取消；ready(地址) 在开始监听后调用"""
+        await asyncio.get_running_loop().run_in_executor(None, self.task_index.load)
+        await asyncio.get_running_loop().run_in_executor(None, self.task_index.refresh)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        address = server.sockets[0].getsockname()
+        if ready:
+            ready(address)
+        flusher = asyncio.ensure_future(self.flush_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            flusher.cancel()
+            await self.close()
+
+
+INDEX_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Image Labeling</title>
+<style>
+body { font-family: Arial, sans-serif; background: #f0f0f0; margin: 0; text-align: center; }
+header { padding: 10px; } #image { max-width: 800px; max-height: 600px; border: 2px solid #888; background: #fff; }
+#status { font-size: 13px; margin: 8px; } button { margin: 4px; padding: 6px 14px; }
+</style></head>
+<body>
+<header>Annotator <input id="annotator" size="12"> Task <select id="tasks"></select>
+<button onclick="loadTask()">Load</button></header>
+<div id="progress"></div>
+<img id="image" alt="">
+<div><button onclick="label('highQuality')">High Quality (H)</button>
+<button onclick="label('lowQuality')">Low Quality (L)</button>
+<button onclick="label('skip')">Skip (S)</button>
+<button onclick="undo()">Undo (U)</button></div>
+<div id="status"></div>
+<script>
+let queue = [], lookahead = 8, remaining = 0, refilling = null, actions = Promise.resolve();
+const posting = new Set();  // 尚未完成的标注请求
+const labeled = new Set();  // 本地已标注的图片（请求可能还没到服务器，补充队列时去掉）
+const $ = id => document.getElementById(id);
+$('annotator').value = localStorage.getItem('annotator') || '';
+function headers() {
+  localStorage.setItem('annotator', $('annotator').value);
+  return {'Content-Type': 'application/json', 'X-Annotator': $('annotator').value};
+}
+async function api(method, path, body) {
+  const response = await fetch(path, {method, headers: headers(), body: body && JSON.stringify(body)});
+  const data = await response.json();
+  if (!response.ok) throw new Error(data.error);
+  return data;
+}
+function enqueue(action) {
+  // 按键按顺序执行：等待补充队列、撤销时不丢弃之后的按键
+  actions = actions.then(action).catch(e => { $('status').textContent = e.message; });
+  return actions;
+}
+async function listTasks() {
+  const data = await api('GET', '/api/tasks');
+  $('tasks').innerHTML = data.tasks.map(t => `<option value="${t.task}">${t.name}</option>`).join('');
+}
+function loadTask(force) { return enqueue(() => switchTask(force)); }
+async function switchTask(force) {
+  await Promise.allSettled([...posting]);
+  try {
+    await api('POST', '/api/task', {task: $('tasks').value, force: !!force});
+  } catch (e) {
+    if (!force && confirm(e.message + '\\n\\nTake over the task anyway?')) return switchTask(true);
+    $('status').textContent = e.message; return;
+  }
+  queue = []; labeled.clear();
+  await refill(); show();
+}
+function refill() {
+  // 已发出的标注请求完成后再取队列，仍在路上的由 labeled 去掉
+  if (!refilling) refilling = (async () => {
+    try {
+      await Promise.allSettled([...posting]);
+      const data = await api('GET', '/api/queue?limit=100');
+      queue = data.images.filter(name => !labeled.has(name));
+      lookahead = data.lookahead;
+      remaining = data.remaining - (data.images.length - queue.length);
+    } finally { refilling = null; }
+  })();
+  return refilling;
+}
+function show() {
+  $('progress').textContent = `Remaining: ${remaining}`;
+  if (!queue.length) { $('image').removeAttribute('src'); $('status').textContent = 'Task is completed'; return; }
+  $('image').src = '/img/' + encodeURIComponent(queue[0]);
+  $('status').textContent = queue[0];
+  // 预取后面几张（服务器已在后台解码）
+  for (const name of queue.slice(1, 1 + lookahead)) new Image().src = '/img/' + encodeURIComponent(name);
+}
+function label(value) { return enqueue(() => applyLabel(value)); }
+async function applyLabel(value) {
+  if (!queue.length && remaining > 0) { await refill(); show(); }
+  if (!queue.length) return;
+  const name = queue.shift(); remaining -= 1; labeled.add(name);
+  show();
+  const request = api('POST', '/api/labels', {labels: [{image: name, label: value}]})
+    .catch(e => { $('status').textContent = 'Failed to save label: ' + e.message; })
+    .finally(() => posting.delete(request));
+  posting.add(request);
+  if (queue.length < lookahead && remaining > queue.length) refill().then(show, e => { $('status').textContent = e.message; });
+}
+function undo() { return enqueue(applyUndo); }
+async function applyUndo() {
+  await Promise.allSettled([...posting]);  // 撤销的应是最后一次标注
+  try {
+    const data = await api('POST', '/api/undo');
+    labeled.delete(data.image); queue = [data.image, ...queue.filter(name => name !== data.image)];
+    remaining += 1; show();
+  } catch (e) { $('status').textContent = e.message; }
+}
+document.addEventListener('keydown', event => {
+  if (event.target.tagName === 'INPUT' || event.repeat) return;
+  const keys = {h: 'highQuality', l: 'lowQuality', s: 'skip'};
+  const key = event.key.toLowerCase();
+  if (keys[key]) label(keys[key]); else if (key === 'u') undo();
+});
+listTasks();
+</script></body></html>
+"""
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="Local web labeling server")
+    parser.add_argument('--project-dir', default=str(Path(__file__).parent))
+    parser.add_argument('--images-dir', help="Image directory (default: <project dir>/images)")
+    parser.add_argument('--label-db', help="Also store labels in this SQLite database")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8780)
+    parser.add_argument('--lookahead', type=int, default=8, help="Images hinted and pre-decoded ahead of the queue")
+    parser.add_argument('--workers', type=int, help="Decode threads shared by all annotators")
+    parser.add_argument('--metrics-dump', help="Append per-endpoint latency percentiles to this JSONL file")
+    args = parser.parse_args(argv)
+
+    metrics = LatencyMetrics(enabled=bool(args.metrics_dump), dump_path=args.metrics_dump)
+    server = LabelServer(args.project_dir, images_dir=args.images_dir, label_db=args.label_db,
+                         lookahead=args.lookahead, workers=args.workers, metrics=metrics)
+
+    async def run():
+        serving = asyncio.current_task()
+        try:
+            # kill / 服务管理器停止时也写入缓冲的标注并释放租约
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, serving.cancel)
+        except NotImplementedError:  # Windows
+            pass
+        try:
+            await server.serve(args.host, args.port,
+                               ready=lambda address: print(f"Serving on http://{address[0]}:{address[1]}"))
+        except asyncio.CancelledError:
+            pass
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
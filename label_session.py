@@ -0,0 +1,1067 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+标注会话（与界面无关的标注核心）
+负责任务加载、待标注队列、标注、撤销/重做、进度持久化、任务租约、工作队列、
+近似重复、质量预标注和导出，不导入 tkinter，可在无显示器的服务器上运行。
+界面（image_labeler.py 的 Tk 窗口、Web 前端等）通过 on(事件, 回调) 订阅状态变化：
+
+    task_loaded     切换到新任务（当前位置为0）          {'task_id', 'task_name', 'filename', 'remaining'}
+    position        当前位置变化                          {'index', 'path'}（path 为None表示队列已到末尾）
+    labels_changed  标注变化（标注、批量标注、撤销、重做）{'records': [(文件名, 标签或None), ...], 'reason'}
+    queue_changed   待标注队列重建或追加                  {'length'}
+    index_changed   任务索引中的计数已写盘                {}
+    lease_lost      任务被他人接管，进度改写到自己的文件  {'holder', 'side_file'}
+
+回调以 callback(事件名, 数据) 调用；订阅 '*' 可以收到所有事件。
+会话对象只应在一个线程中使用，标明“后台线程”的方法（read_task、load_quality_scores）除外。
+background_writes=True 时进度日志在单独的写盘线程中按顺序写入，标注方法只更新内存状态、不等待fsync。
+
+脚本批量标注（CSV每行: 文件名,标签）和导出:
+    python label_session.py apply --task task_001.json labels.csv
+    python label_session.py export --task task_001.json [--strategy copy|hardlink|reflink|symlink] [--parquet]
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+from pathlib import Path
+from datetime import datetime
+from progress_store import ProgressStore, ProgressWriter
+from label_state import LabelState, LABEL_TYPES
+from undo_history import UndoHistory
+import dir_index
+from task_manifest import open_manifest
+from task_index import TaskIndex, progress_path_for
+from latency_metrics import LatencyMetrics
+from task_lease import TaskLease, LeaseHeldError, default_annotator
+from work_queue import QueueSession, open_queue
+from label_store import LabelStore, DatabaseProgressStore
+from image_hash import load_duplicate_groups, numpy_available
+from image_quality import (QualityIndex, queue_sort_key, auto_labels, QUEUE_ORDERS,
+                           AUTO_LOW_THRESHOLD, AUTO_HIGH_THRESHOLD)
+from export_engine import ExportEngine, COPY_STRATEGIES
+from report_writer import (iter_export_rows, write_rows, ExportSummary, CsvResultWriter,
+                           TextReportWriter, ParquetResultWriter)
+
+EVENTS = ('task_loaded', 'position', 'labels_changed', 'queue_changed', 'index_changed', 'lease_lost')
+
+
+def build_image_queue(images_dir, task_image_names, labeled_files, sort_key=None):
+    """得到待标注队列：任务中存在且未标注的图片，默认按文件名排序（sort_key 可按质量分等排序）"""
+    # 用目录索引一次性解析任务中的文件名（一次scandir，按目录修改时间缓存）
+    found, missing = dir_index.resolve_names(images_dir, task_image_names)
+    if missing:
+        print(f"警告: 任务中有 {len(missing)} 张图片文件不存在于 {images_dir}"
+              f"（例如: {', '.join(missing[:3])}）")
+
+    # 过滤掉已标注的图片（只显示未标注的图片），按文件名或 sort_key 排序
+    unlabeled = sorted((name for name in found if name not in labeled_files), key=sort_key)
+    return [images_dir / name for name in unlabeled]
+
+
+class ExportReport:
+    """一次导出的结果（界面据此显示汇总）"""
+
+    def __init__(self, output_dir, task_id, timestamp):
+        self.output_dir = output_dir
+        self.task_id = task_id
+        self.timestamp = timestamp
+        self.csv_filename = f"task_{task_id}_results_{timestamp}.csv"
+        self.report_filename = f"task_{task_id}_report_{timestamp}.txt"
+        self.progress_filename = f"task_progress_{task_id}_{timestamp}.json"
+        self.parquet_filename = None
+        self.labeled = 0  # 导出的已标注文件数
+        self.unlabeled = 0
+        self.not_found = 0  # 已标注但不存在于图片目录的文件数
+        self.strategy = None
+        self.resumed = 0  # 上次已完成、本次跳过的文件数
+        self.moved = 0  # 上次导出后重新标注、移到新分类文件夹的文件数
+        self.removed = 0  # 上次导出后不再属于原分类、被删除的文件数
+        self.errors = []  # (目标相对路径, 错误信息)
+
+
+class LabelSession:
+    """一个标注者的标注会话
+
+    状态：当前任务、任务清单、标注状态、待标注队列（image_files）和当前位置（current_index）、
+    撤销历史、进度存储、任务租约，以及可选的工作队列、标签库、近似重复分组和质量评分。
+    所有修改都通过方法进行，修改后发出对应事件。
+    """
+
+    def __init__(self, project_dir, images_dir=None, queue_spec=None, label_db=None, queue_order='name',
+                 auto_low=AUTO_LOW_THRESHOLD, auto_high=AUTO_HIGH_THRESHOLD, metrics=None, annotator=None,
+                 task_index=None, background_writes=False, check_state=None):
+        self.project_dir = Path(project_dir)
+        self.images_dir = Path(images_dir) if images_dir else self.project_dir / "images"
+        self.tasks_dir = self.project_dir / "tasks"
+        self.progress_dir = self.project_dir / "progress"
+        self.metrics = metrics or LatencyMetrics(enabled=False)
+        self._listeners = {}  # 事件名 -> [回调]
+
+        # 待标注队列和当前位置
+        self.image_files = []
+        self.current_index = 0
+        # 标注状态：文件名 -> 标签，并增量维护各类计数
+        # （check_state=True 或 LABELER_CHECK_STATE=1 时每次修改都校验，供测试使用）
+        if check_state is None:
+            check_state = os.environ.get('LABELER_CHECK_STATE') == '1'
+        self.label_state = LabelState(check=check_state)
+        # 撤销/重做功能（只记录文件名、标签和队列位置，深度可调）
+        self.undo_history = UndoHistory(max_depth=1000)
+
+        # 任务相关变量
+        self.current_task = None  # 任务元数据（不含图片列表）
+        self.task_manifest = None  # 任务图片列表，按需读取
+        self.task_progress_file = None
+        self.progress_store = None
+        # 交互界面使用写盘线程：标注时只把记录交给它，日志写盘和压缩不阻塞按键处理
+        self.writer = ProgressWriter() if background_writes else None
+        self._compaction_queued = False
+        # 同一进程中的多个会话（如 label_server.py）共用一个任务索引，避免互相覆盖计数
+        self.task_index = task_index or TaskIndex(self.progress_dir / "task_index.json", self.tasks_dir,
+                                                  self.progress_dir)
+
+        # 多人协作：每个任务同一时间只由持有租约的标注者写进度
+        self.annotator = annotator or default_annotator()
+        self.task_lease = None
+        self.lease_renew_interval = 60  # 秒
+        self.last_lease_renew = 0
+
+        # 可选的SQLite标签库（--label-db）：标注按批写入数据库，JSON进度文件仍在关闭任务时写出
+        self.label_store = LabelStore(label_db) if label_db else None
+
+        # 近似重复分组（image_hash.py build 生成的哈希索引），可把标签一并应用到同组未标注的图片
+        self.hash_index_path = self.project_dir / "image_hashes.npz"
+        self.duplicate_groups = {}  # 文件名 -> 组代表文件名（当前任务内）
+        self.duplicate_members = {}  # 组代表文件名 -> [组内文件名]
+        self.propagate_duplicates = False
+
+        # 质量预评分（image_quality.py build 生成的评分索引）：可按分数或不确定度排列待标注队列，
+        # 并把分数极端的图片批量预标注，预标注记录在进度目录的单独文件中供逐张复核
+        self.quality_index_path = self.project_dir / "image_quality.npz"
+        self._quality_index = None  # (索引文件修改时间, QualityIndex)，只在后台线程读取
+        self.quality_scores = None  # 当前任务的 {文件名: 质量分}，没有评分索引时为None
+        self.queue_order = queue_order
+        self.auto_thresholds = (auto_low, auto_high)
+        self.auto_labeled = {}  # 文件名 -> {'label', 'score', 'reviewed'}
+        self.auto_labels_file = None
+        self.review_mode = False  # 正在逐张复核预标注
+
+        # 工作队列模式（--queue）：按需领取小块图片代替固定的任务文件
+        self.queue_session = QueueSession(open_queue(queue_spec, self.annotator)) if queue_spec else None
+        self.queue_prefetch = 10  # 剩余图片少于此数时提前领取下一块
+
+    # ---- 事件 ----
+
+    def on(self, event, callback):
+        """订阅事件（'*' 订阅全部），回调以 callback(事件名, 数据) 调用；返回 callback 以便 off()"""
+        if event != '*' and event not in EVENTS:
+            raise ValueError(f"Unknown event: {event}")
+        self._listeners.setdefault(event, []).append(callback)
+        return callback
+
+    def off(self, event, callback):
+        """取消订阅"""
+        listeners = self._listeners.get(event, [])
+        if callback in listeners:
+            listeners.remove(callback)
+
+    def emit(self, event, **data):
+        """通知订阅者（按订阅顺序同步调用）"""
+        for callback in self._listeners.get(event, []) + self._listeners.get('*', []):
+            callback(event, data)
+
+    # ---- 状态 ----
+
+    @property
+    def labeled_files(self):
+        """已标注记录（只读，修改请通过标注方法）"""
+        return self.label_state.labeled_files
+
+    @property
+    def current_path(self):
+        """当前图片路径（队列已到末尾时为None）"""
+        if self.current_index < len(self.image_files):
+            return self.image_files[self.current_index]
+        return None
+
+    def stats(self):
+        """各类标签数量和总数"""
+        stats = {label_type: self.label_state.count(label_type) for label_type in LABEL_TYPES}
+        stats['total'] = self.label_state.total
+        return stats
+
+    def is_complete(self):
+        """队列已到末尾，且不在复核中、工作队列也没有更多图片"""
+        return (self.current_index >= len(self.image_files) and not self.review_mode
+                and not (self.queue_session and not self.queue_session.exhausted))
+
+    # ---- 任务加载 ----
+
+    def open_progress_store(self, progress_file, task_id):
+        """任务进度存储：默认为JSON快照 + 日志，指定 --label-db 时写入标签库"""
+        if self.label_store:
+            return DatabaseProgressStore(self.label_store, progress_file, task_id=task_id, annotator=self.annotator)
+        return ProgressStore(progress_file, task_id=task_id, annotator=self.annotator)
+
+    def read_task(self, task_path, images_dir=None, order=None, timer=None):
+        """后台线程：读取任务清单、任务进度并建立待标注队列（不修改会话状态）
+
+        images_dir / order 默认取会话当前的设置；从界面的后台线程调用时应在主线程取好后传入。
+        """
+        images_dir = images_dir or self.images_dir
+        order = order or self.queue_order
+
+        def mark(name, since):
+            if timer:
+                timer.mark(name, since=since)
+
+        time_mark = time.perf_counter()
+        # 打开任务清单（JSON或二进制格式），图片列表按需读取
+        manifest = open_manifest(task_path)
+        task_data = dict(manifest.meta)
+        task_id = task_data.get('task_id', task_path.stem)
+        mark("task_load: manifest", time_mark)
+
+        # 加载任务进度（快照 + 日志重放）
+        time_mark = time.perf_counter()
+        progress_file = progress_path_for(self.progress_dir, task_id)
+        progress_store = self.open_progress_store(progress_file, task_id)
+
+        # 领取任务租约（被他人持有时由调用方决定是否接管）
+        lease = TaskLease(progress_file.with_suffix('.lease'), self.annotator)
+        try:
+            lease.acquire()
+            lease_holder = None
+        except LeaseHeldError as e:
+            lease_holder = e.holder
+
+        if self.label_store or progress_file.exists() or progress_store.journal_path.exists():
+            labeled_files = progress_store.load()
+            print(f"Loaded {len(labeled_files)} labeled records from task progress file")
+        else:
+            labeled_files = {}
+            print(f"Task progress file does not exist: {progress_file}")
+        mark("task_load: progress", time_mark)
+
+        # 质量评分和预标注记录（都可能不存在）
+        time_mark = time.perf_counter()
+        names = list(manifest)
+        quality_scores = self.load_quality_scores(names)
+        auto_labels_file = self.progress_dir / f"task_auto_labels_{task_id}.json"
+        auto_labeled = self.read_auto_labels(auto_labels_file)
+        mark("task_load: quality scores", time_mark)
+
+        # 获取任务中的图片
+        time_mark = time.perf_counter()
+        image_files = build_image_queue(images_dir, names, labeled_files, self.queue_sort_key(quality_scores, order))
+        mark("task_load: image queue", time_mark)
+
+        return {
+            'manifest': manifest,
+            'task_data': task_data,
+            'images_dir': images_dir,
+            'progress_file': progress_file,
+            'progress_store': progress_store,
+            'lease': lease,
+            'lease_holder': lease_holder,
+            'labeled_files': labeled_files,
+            'image_files': image_files,
+            'quality_scores': quality_scores,
+            'order': order,
+            'auto_labels_file': auto_labels_file,
+            'auto_labeled': auto_labeled,
+        }
+
+    @staticmethod
+    def discard_loaded(loaded):
+        """放弃 read_task 的结果（加载期间又选择了其他任务，或不接管他人的任务）"""
+        loaded['manifest'].close()
+        loaded['lease'].release()
+
+    def take_over(self, loaded):
+        """强制接管被他人持有租约的任务，并重新读取对方已保存的进度"""
+        loaded['lease'].acquire(force=True)
+        loaded['lease_holder'] = None
+        loaded['labeled_files'] = loaded['progress_store'].load()
+        loaded['image_files'] = build_image_queue(loaded['images_dir'], list(loaded['manifest']),
+                                                  loaded['labeled_files'],
+                                                  self.queue_sort_key(loaded['quality_scores'], loaded['order']))
+
+    def apply_loaded_task(self, task_filename, loaded):
+        """切换到 read_task 读取好的任务（租约须已取得），发出 task_loaded"""
+        # 切换任务前先保存上一个任务的进度
+        self.close_task_progress()
+        self.release_task_lease()
+        self.task_lease = loaded['lease']
+        self.last_lease_renew = time.monotonic()
+        if self.task_manifest:
+            self.task_manifest.close()
+
+        self.task_manifest = loaded['manifest']
+        self.current_task = loaded['task_data']
+        self.current_task['filename'] = task_filename
+
+        # 设置任务进度文件
+        self.task_progress_file = loaded['progress_file']
+        self.progress_store = loaded['progress_store']
+        self.label_state.reset(loaded['labeled_files'])
+        self.quality_scores = loaded['quality_scores']
+        self.auto_labels_file = loaded['auto_labels_file']
+        self.auto_labeled = loaded['auto_labeled']
+        self.review_mode = False
+        self.duplicate_groups = {}
+        self.duplicate_members = {}
+
+        # 统计各类型标注数量
+        print(f"  Labeled statistics: highQuality={self.label_state.count('highQuality')}, "
+              f"lowQuality={self.label_state.count('lowQuality')}, skip={self.label_state.count('skip')}")
+
+        # 待标注队列（加载期间切换了图片目录时重新建立；队列重建后旧的撤销记录不再对应）
+        if loaded['images_dir'] == self.images_dir:
+            self.image_files = loaded['image_files']
+        else:
+            self.rebuild_queue(notify=False)
+        self.undo_history.clear()
+        self.current_index = 0
+
+        self.emit('task_loaded', task_id=self.current_task.get('task_id'),
+                  task_name=self.current_task.get('task_name', task_filename),
+                  filename=task_filename, remaining=len(self.image_files))
+
+    def load_task(self, task_filename, force=False):
+        """同步加载任务（脚本使用）；任务被他人持有且 force=False 时抛出 LeaseHeldError"""
+        task_path = self.tasks_dir / task_filename
+        if not task_path.exists():
+            raise FileNotFoundError(f"任务文件不存在: {task_filename}")
+        loaded = self.read_task(task_path)
+        if loaded['lease_holder'] is not None:
+            if not force:
+                self.discard_loaded(loaded)
+                raise LeaseHeldError(loaded['lease_holder'])
+            self.take_over(loaded)
+        self.apply_loaded_task(task_filename, loaded)
+        self.load_task_duplicates()
+
+    def start_queue(self):
+        """工作队列模式：进度保存在本队列专用的进度文件中，队列中的图片由 fetch_queue_chunk 领取"""
+        client = self.queue_session.client
+        task_id = f"queue_{client.name}"
+        self.current_task = {'task_id': task_id, 'task_name': f"Work queue {client.name}", 'filename': None}
+
+        self.task_progress_file = progress_path_for(self.progress_dir, task_id)
+        self.progress_store = self.open_progress_store(self.task_progress_file, task_id)
+        self.label_state.reset(self.progress_store.load())
+        self.auto_labels_file = self.progress_dir / f"task_auto_labels_{task_id}.json"
+        self.auto_labeled = self.read_auto_labels(self.auto_labels_file)
+        self.image_files = []
+        self.current_index = 0
+
+    def needs_queue_chunk(self):
+        """工作队列模式下剩余图片不多、应领取下一块"""
+        return (self.queue_session is not None and not self.review_mode and not self.queue_session.exhausted
+                and len(self.image_files) - self.current_index <= self.queue_prefetch)
+
+    def fetch_queue_chunk(self):
+        """同步领取并追加下一块（脚本使用；界面在后台线程调用 queue_session.fetch 后交给 add_queue_chunk）"""
+        return self.add_queue_chunk(self.queue_session.fetch())
+
+    def add_queue_chunk(self, lease):
+        """把领取到的一块图片追加到待标注队列末尾，返回这一块的文件名"""
+        names = self.queue_session.add_lease(lease)
+        # 之前已在本地标注过（例如确认前程序退出）的图片直接确认
+        for name in names:
+            if name in self.label_state:
+                self.queue_session.mark_labeled(name)
+        if not self.review_mode:
+            # 复核中时，复核结束后按 queue_session.names() 重建队列时会包含这一块
+            self.image_files.extend(build_image_queue(self.images_dir, names, self.label_state,
+                                                      self.queue_sort_key(self.quality_scores)))
+            self.emit('queue_changed', length=len(self.image_files))
+        return names
+
+    def sync_work_queue(self, final=False, background=None, pending=None):
+        """确认已标注的图片并定期续期租约；final=True 时同步执行并归还未标注的图片
+
+        pending 为进度写盘前取出的待确认图片（take_acks），默认现在取出；
+        确认前按当前标注状态筛选，之后被撤销的图片不确认（重新标注时会再次记录）。
+        background(work, on_done) 不为None时在后台执行网络同步（如界面的 run_in_background）。
+        """
+        session = self.queue_session
+        if pending is None:
+            pending = session.take_acks()
+        pending = {lease_id: [name for name in dict.fromkeys(names) if name in self.label_state]
+                   for lease_id, names in pending.items()}
+        pending = {lease_id: names for lease_id, names in pending.items() if names}
+        renew = time.monotonic() - self.last_lease_renew >= self.lease_renew_interval
+        if renew:
+            self.last_lease_renew = time.monotonic()
+
+        def work():
+            session.ack(pending)
+            if final:
+                session.release()
+            elif renew:
+                session.renew()
+
+        def on_done(result, error):
+            if error:
+                # 下次再确认
+                session.restore_acks(pending)
+                print(f"Failed to sync with the work queue: {error}")
+
+        if final:
+            work()
+        elif pending or renew:
+            if background:
+                background(work, on_done)
+            else:
+                try:
+                    work()
+                except Exception as e:
+                    on_done(None, e)
+
+    def rebuild_queue(self, notify=True):
+        """按任务清单（或工作队列已领取的图片）、标注状态和排序方式重新建立待标注队列"""
+        if not self.current_task:
+            return
+
+        with self.metrics.stage('get_task_images'):
+            names = self.queue_session.names() if self.queue_session else list(self.task_manifest)
+            self.image_files = build_image_queue(self.images_dir, names, self.label_state,
+                                                 self.queue_sort_key(self.quality_scores))
+        if notify:
+            self.emit('queue_changed', length=len(self.image_files))
+
+    def set_images_dir(self, images_dir):
+        """切换图片目录并重建队列（旧的撤销记录不再对应），回到第一张"""
+        self.images_dir = Path(images_dir)
+        if self.current_task:
+            self.rebuild_queue()
+            self.undo_history.clear()
+            self.go_to(0)
+
+    def set_queue_order(self, order):
+        """按新的顺序重新排列待标注队列（score/uncertainty 需要质量评分，否则抛出 ValueError）"""
+        if order not in QUEUE_ORDERS:
+            raise ValueError(f"Unknown queue order: {order}")
+        if order != 'name' and self.quality_scores is None:
+            raise ValueError("No quality scores found")
+        self.queue_order = order
+        if self.current_task and not self.review_mode:
+            self.rebuild_queue()
+            self.undo_history.clear()
+            self.go_to(0)
+
+    # ---- 租约和持久化 ----
+
+    def release_task_lease(self):
+        """释放当前任务的租约"""
+        if self.task_lease:
+            try:
+                self.task_lease.release()
+            except OSError as e:
+                print(f"Failed to release task lease: {e}")
+            self.task_lease = None
+
+    def renew_task_lease(self):
+        """定期续期任务租约；租约被他人接管后，之后的进度改写到本标注者自己的进度文件，可用 progress_merge.py 合并"""
+        if not self.task_lease or time.monotonic() - self.last_lease_renew < self.lease_renew_interval:
+            return
+        self.last_lease_renew = time.monotonic()
+        try:
+            self.task_lease.renew()
+        except LeaseHeldError as e:
+            self.task_lease = None
+            task_id = self.current_task.get('task_id', 'unknown')
+            safe_annotator = "".join(c if c.isalnum() or c in '-_.' else '_' for c in self.annotator)
+            side_file = self.progress_dir / f"task_progress_{task_id}.{safe_annotator}.json"
+            self.write_progress(self.progress_store.flush)
+            self.progress_store = ProgressStore(side_file, task_id=task_id, annotator=self.annotator)
+            self.write_progress(self.progress_store.compact, dict(self.labeled_files))
+            self.task_progress_file = side_file
+            self.emit('lease_lost', holder=e.holder, side_file=side_file)
+        except OSError as e:
+            print(f"Failed to renew task lease: {e}")
+
+    def update_task_counts(self):
+        """批次索引中的计数直接取自增量计数器，随进度日志一起写盘"""
+        self.task_index.set_counts(self.current_task['filename'],
+                                   {label_type: self.label_state.count(label_type) for label_type in LABEL_TYPES})
+
+    def write_progress(self, func, *args):
+        """执行进度存储的写操作：有写盘线程时按顺序交给它（不等待），否则直接执行"""
+        if self.writer:
+            self.writer.submit(func, *args)
+        else:
+            func(*args)
+
+    def write_progress_now(self, func, *args):
+        """执行进度存储的写操作并等待完成（有写盘线程时在其中按顺序执行），失败时抛出异常"""
+        if self.writer:
+            return self.writer.run(func, *args)
+        return func(*args)
+
+    def wait_for_writes(self):
+        """等待写盘线程完成已提交的进度写入"""
+        if self.writer:
+            self.writer.wait()
+
+    def _compact_progress(self, store, labeled_files):
+        try:
+            store.compact(labeled_files)
+        finally:
+            self._compaction_queued = False
+
+    def save_progress(self, records):
+        """保存任务进度 [(文件名, 标签), ...]（标签为None表示撤销）：一次追加写盘"""
+        if not self.progress_store or not records:
+            return
+
+        try:
+            with self.metrics.stage('save_task_progress'):
+                store = self.progress_store
+                if len(records) == 1:
+                    self.write_progress(store.record, *records[0])
+                else:
+                    self.write_progress(store.record_many, list(records))
+                # 压缩在写盘线程中进行时用标注状态的副本，排队期间不重复提交
+                if not self._compaction_queued and store.needs_compaction():
+                    self._compaction_queued = True
+                    self.write_progress(self._compact_progress, store, dict(self.labeled_files))
+        except Exception as e:
+            print(f"Failed to save task progress file: {e}")
+
+        # 工作队列模式：这里只记为待确认，flush 中日志写盘成功后才向队列确认
+        # （写入失败的记录留在存储的待写列表中，随下次写盘一起写入）
+        if self.queue_session:
+            for filename, label in records:
+                if label is not None:
+                    self.queue_session.mark_labeled(filename)
+
+        self.update_task_counts()
+
+    def flush(self, background=None):
+        """定期调用：将进度日志和任务索引写盘、续期任务租约、与工作队列同步
+
+        有写盘线程且给出 background 时，日志在写盘线程中写入，完成后再在调用线程中写任务索引
+        （其中的进度文件签名取自已写盘的日志）并与工作队列同步。
+        向队列确认的只是写盘前已记录的标注，写盘失败时它们留到下次写盘成功后再确认。
+        """
+        if not self.progress_store:
+            return
+        store = self.progress_store
+        pending = self.queue_session.take_acks() if self.queue_session else {}
+        if self.writer and background:
+            background(lambda: self.writer.run(store.flush),
+                       lambda result, error: self._after_flush(store, pending, error, background))
+        else:
+            error = None
+            try:
+                self.write_progress_now(store.flush)
+            except Exception as e:
+                error = e
+            self._after_flush(store, pending, error, background)
+        self.renew_task_lease()
+
+    def _after_flush(self, store, pending, error, background):
+        """日志写盘完成后：写任务索引、向工作队列确认写盘前记录的标注并续期租约"""
+        if error is not None:
+            print(f"Failed to save task progress file: {error}")
+        if error is None and store is self.progress_store:
+            self.flush_task_index()
+        elif pending:
+            self.queue_session.restore_acks(pending)
+            pending = {}
+        if self.queue_session:
+            self.sync_work_queue(background=background, pending=pending)
+
+    def flush_task_index(self):
+        """任务索引中更新过的计数写盘，写盘时发出 index_changed"""
+        try:
+            if self.task_index.flush():
+                self.emit('index_changed')
+        except Exception as e:
+            print(f"Failed to save task index: {e}")
+
+    def close_task_progress(self):
+        """将当前任务的进度压缩为完整快照，返回进度是否已写盘"""
+        if not self.progress_store:
+            return True
+        try:
+            self.write_progress_now(self.progress_store.close, dict(self.labeled_files))
+        except Exception as e:
+            print(f"Failed to save task progress file: {e}")
+            return False
+        try:
+            self.update_task_counts()
+            self.task_index.flush()
+            self.emit('index_changed')
+            self.save_auto_labels()
+        except Exception as e:
+            print(f"Failed to save task progress file: {e}")
+        return True
+
+    def close(self):
+        """结束会话：保存进度、释放租约、归还工作队列中未标注的图片"""
+        saved = self.close_task_progress()
+        self.release_task_lease()
+        if self.queue_session:
+            try:
+                # 进度没能写盘时不确认，未确认的图片随租约归还队列
+                self.sync_work_queue(final=True, pending=None if saved else {})
+            except Exception as e:
+                print(f"Failed to sync with the work queue: {e}")
+        if self.task_manifest:
+            self.task_manifest.close()
+            self.task_manifest = None
+        if self.writer:
+            self.writer.shutdown()
+
+    # ---- 标注 ----
+
+    def go_to(self, index):
+        """跳转到队列中的指定位置（可以是末尾），发出 position"""
+        self.current_index = index
+        self.emit('position', index=index, path=self.current_path)
+
+    def next_unlabeled_index(self, index):
+        """从 index 开始第一张未标注图片的位置（跳过随近似重复一并标注的图片；复核模式下不跳过）"""
+        while not self.review_mode and index < len(self.image_files) and self.image_files[index].name in self.label_state:
+            index += 1
+        return index
+
+    def advance(self):
+        """移动到下一张未标注的图片"""
+        self.go_to(self.next_unlabeled_index(self.current_index + 1))
+
+    def label(self, label_type, advance=False, filename=None):
+        """标注当前图片并加入撤销历史，返回 (文件名, [一并标注的近似重复图片])；队列已到末尾时返回None
+
+        filename 为发出标注命令时针对的图片：当前图片已不是它（任务切换、队列重排等）时不标注，返回None。
+        """
+        path = self.current_path
+        if path is None or (filename is not None and path.name != filename):
+            return None
+        filename = path.name
+
+        # 记录已标注（不移动文件）
+        self.mark_reviewed(filename)
+        previous = self.label_state.set(filename, label_type)
+        records = [(filename, label_type)]
+
+        # 同组未标注的近似重复图片使用同一标签（与本次标注一起撤销）
+        propagated = []
+        if self.propagate_duplicates:
+            for name in self.unlabeled_duplicates(filename):
+                self.label_state.set(name, label_type)
+                propagated.append((name, None))
+                records.append((name, label_type))
+        self.save_progress(records)
+
+        # 记录撤销信息
+        self.undo_history.record(filename, previous, label_type, self.current_index, propagated)
+        self.emit('labels_changed', records=records, reason='label')
+        if advance:
+            self.advance()
+        return filename, [name for name, _ in propagated]
+
+    def label_many(self, names, label_type, index=None, reason='batch'):
+        """把多张图片标为 label_type：一次写盘，作为一次操作撤销（撤销后回到 index，默认当前位置）"""
+        if not names:
+            return
+        previous = [(name, self.label_state.set(name, label_type)) for name in names]
+        records = [(name, label_type) for name in names]
+        self.save_progress(records)
+        self.undo_history.record(names[0], previous[0][1], label_type,
+                                 self.current_index if index is None else index, previous[1:])
+        self.emit('labels_changed', records=records, reason=reason)
+
+    def apply_labels(self, records, reason='batch'):
+        """写入一批各自的标签 [(文件名, 标签), ...]（如 label_server.py 缓冲的标注）：一次写盘，每张图片可单独撤销"""
+        if not records:
+            return
+        for filename, label in records:
+            previous = self.label_state.set(filename, label)
+            self.undo_history.record(filename, previous, label, self.current_index)
+        self.save_progress(records)
+        self.emit('labels_changed', records=records, reason=reason)
+
+    def undo(self):
+        """撤销最后一次标注并回到该图片原来的位置，返回撤销的操作（没有时为None）"""
+        action = self.undo_history.undo()
+        if action is None:
+            return None
+
+        # 恢复之前的标注状态
+        records = []
+        for filename, previous in ((action.filename, action.previous),) + action.propagated:
+            if previous is None:
+                self.label_state.remove(filename)
+            else:
+                self.label_state.set(filename, previous)
+            records.append((filename, previous))
+        self.save_progress(records)
+        self.emit('labels_changed', records=records, reason='undo')
+
+        # 回到被撤销图片所在的位置（队列在内存中，无需重新扫描文件）
+        self.go_to(action.index)
+        return action
+
+    def redo(self, stride=None):
+        """重做最近一次撤销的标注，返回该操作（没有时为None）
+
+        之后移动到操作位置之后第一张未标注的图片；stride 不为None时移动到 操作位置 + stride（网格整页）。
+        """
+        action = self.undo_history.redo()
+        if action is None:
+            return None
+
+        records = [(filename, action.label)
+                   for filename in (action.filename,) + tuple(name for name, _ in action.propagated)]
+        for filename, label in records:
+            self.label_state.set(filename, label)
+        self.save_progress(records)
+        self.emit('labels_changed', records=records, reason='redo')
+
+        if stride is None:
+            self.go_to(self.next_unlabeled_index(action.index + 1))
+        else:
+            self.go_to(action.index + stride)
+        return action
+
+    # ---- 近似重复 ----
+
+    def load_task_duplicates(self, background=None):
+        """按哈希索引对当前任务的图片分组（没有索引或没有numpy时不分组）
+
+        background(work, on_done) 不为None时在后台读取；期间切换了任务时丢弃结果。
+        """
+        self.duplicate_groups = {}
+        self.duplicate_members = {}
+        if not numpy_available() or not self.hash_index_path.exists() or not self.task_manifest:
+            return
+
+        manifest = self.task_manifest
+        names = list(manifest)
+
+        def on_done(result, error):
+            if manifest is not self.task_manifest:
+                return
+            if error:
+                print(f"Failed to group near-duplicate images: {error}")
+                return
+            self.duplicate_groups = result
+            members = {}
+            for name, representative in result.items():
+                members.setdefault(representative, []).append(name)
+            self.duplicate_members = members
+            print(f"Near-duplicate images in task: {len(result)} in {len(members)} groups")
+
+        work = lambda: load_duplicate_groups(self.hash_index_path, names)
+        if background:
+            background(work, on_done)
+        else:
+            try:
+                on_done(work(), None)
+            except Exception as e:
+                on_done(None, e)
+
+    def unlabeled_duplicates(self, filename):
+        """与 filename 同组且尚未标注的图片"""
+        representative = self.duplicate_groups.get(filename)
+        if representative is None:
+            return []
+        return [name for name in self.duplicate_members[representative]
+                if name != filename and name not in self.label_state]
+
+    # ---- 质量评分和预标注 ----
+
+    def load_quality_scores(self, names=None):
+        """后台线程：读取质量评分（索引文件不变时复用），返回 {文件名: 质量分}；没有索引或numpy时返回None
+
+        names 不为None时只取这些图片的分数。
+        """
+        if not numpy_available() or not self.quality_index_path.exists():
+            return None
+        mtime = self.quality_index_path.stat().st_mtime_ns
+        if self._quality_index is None or self._quality_index[0] != mtime:
+            self._quality_index = (mtime, QualityIndex.load(self.quality_index_path))
+        index = self._quality_index[1]
+        return (index.subset(names) if names is not None else index).scores()
+
+    def queue_sort_key(self, scores, order=None):
+        """待标注队列的排序键（没有评分时按文件名）；order 默认取会话当前的顺序"""
+        if scores is None:
+            return None
+        low, high = self.auto_thresholds
+        return queue_sort_key(scores, order or self.queue_order, low, high)
+
+    @staticmethod
+    def read_auto_labels(path):
+        """读取预标注记录文件（不存在时为空）"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Failed to read auto-label file {path}: {e}")
+            return {}
+
+    def save_auto_labels(self):
+        """写出预标注记录文件（先写临时文件再替换）"""
+        if not self.auto_labels_file or not self.auto_labeled:
+            return
+        tmp_path = self.auto_labels_file.with_name(self.auto_labels_file.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.auto_labeled, f, ensure_ascii=False)
+        os.replace(tmp_path, self.auto_labels_file)
+
+    def auto_label_candidates(self):
+        """队列中分数极端的未标注图片 {文件名: 标签}（没有评分时为空）"""
+        if self.quality_scores is None:
+            return {}
+        low, high = self.auto_thresholds
+        names = [path.name for path in self.image_files if path.name not in self.label_state]
+        return auto_labels(self.quality_scores, names, low, high)
+
+    def apply_auto_labels(self, candidates):
+        """写入预标注（一次写盘，不进入撤销历史），记录到预标注文件供复核"""
+        for name, label in candidates.items():
+            self.label_state.set(name, label)
+            self.auto_labeled[name] = {'label': label, 'score': round(self.quality_scores[name], 4),
+                                       'reviewed': False}
+        records = list(candidates.items())
+        self.save_progress(records)
+        try:
+            self.save_auto_labels()
+        except OSError as e:
+            print(f"Failed to save auto-label file: {e}")
+        self.emit('labels_changed', records=records, reason='auto')
+
+    def pending_reviews(self):
+        """尚未复核、且标签仍是预标注结果的图片（按文件名排序，只含图片目录中存在的）"""
+        names = sorted(name for name, entry in self.auto_labeled.items()
+                       if not entry.get('reviewed') and self.label_state.get(name) == entry['label'])
+        found, _ = dir_index.resolve_names(self.images_dir, names)
+        found = set(found)
+        return [name for name in names if name in found]
+
+    def start_review(self):
+        """复核模式：队列换成 pending_reviews() 的图片，返回图片数（为0时不进入复核）"""
+        if not self.current_task:
+            return 0
+        names = self.pending_reviews()
+        if not names:
+            return 0
+        self.review_mode = True
+        self.image_files = [self.images_dir / name for name in names]
+        self.undo_history.clear()
+        self.emit('queue_changed', length=len(self.image_files))
+        self.go_to(0)
+        return len(self.image_files)
+
+    def end_review(self):
+        """结束复核，回到待标注队列"""
+        self.review_mode = False
+        try:
+            self.save_auto_labels()
+        except OSError as e:
+            print(f"Failed to save auto-label file: {e}")
+        self.rebuild_queue()
+        self.undo_history.clear()
+        self.go_to(0)
+
+    def mark_reviewed(self, filename):
+        """复核模式下标记一张预标注图片已经看过"""
+        entry = self.auto_labeled.get(filename)
+        if self.review_mode and entry is not None:
+            entry['reviewed'] = True
+
+    def keep_auto_label(self):
+        """复核模式：保留当前图片的预标注并看下一张"""
+        path = self.current_path
+        if self.review_mode and path is not None:
+            self.mark_reviewed(path.name)
+            self.advance()
+
+    # ---- 导出 ----
+
+    def export_prefix(self):
+        return f"task_{self.current_task.get('task_id', 'unknown')}_"
+
+    def find_incomplete_export(self):
+        """当前任务中断的导出目录（没有时为None）"""
+        return ExportEngine.find_incomplete(self.project_dir / "output", self.export_prefix())
+
+    def export(self, strategy='copy', parquet=False, resume_dir=None):
+        """导出标注结果（CSV、统计报告、可选Parquet、分类文件夹和进度快照），返回 ExportReport
+
+        resume_dir 为 find_incomplete_export() 找到的目录时继续该次导出，
+        上次导出后重新标注或撤销标注的文件会从原分类文件夹移走或删除。
+        """
+        if not self.current_task:
+            raise RuntimeError("No task loaded")
+
+        # 创建输出目录（有未完成的导出时可以继续）
+        task_id = self.current_task.get('task_id', 'unknown')
+        if resume_dir:
+            output_dir = Path(resume_dir)
+            timestamp = output_dir.name[len(self.export_prefix()):]
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_dir = self.project_dir / "output" / f"{self.export_prefix()}{timestamp}"
+        output_dir.mkdir(parents=True, exist_ok=True)
+        report = ExportReport(output_dir, task_id, timestamp)
+
+        # 一次scandir得到本任务相关文件的元数据表 {文件名: (大小, 修改时间)}，
+        # CSV、复制和报告都使用这张表，不再重复遍历目录和stat
+        task_image_names = set(self.queue_session.names() if self.queue_session else self.task_manifest)
+        file_table = dir_index.scan_file_table(self.images_dir, task_image_names | self.labeled_files.keys())
+
+        # 在一次遍历中流式写出CSV、统计报告和可选的Parquet（行只排序一次）
+        summary = ExportSummary.from_table(self.label_state, task_image_names, file_table)
+        writers = [CsvResultWriter(output_dir / report.csv_filename),
+                   TextReportWriter(output_dir / report.report_filename, self.current_task, summary)]
+        if parquet:
+            report.parquet_filename = f"task_{task_id}_results_{timestamp}.parquet"
+            writers.append(ParquetResultWriter(output_dir / report.parquet_filename))
+        # 使用标签库时已标注的行直接由索引查询按导出顺序得到
+        sorted_labels = None
+        if self.label_store and self.progress_store:
+            self.write_progress(self.progress_store.flush)
+            self.wait_for_writes()
+            sorted_labels = self.label_store.sorted_labels(task_id)
+        write_rows(iter_export_rows(self.labeled_files, task_image_names, file_table, sorted_labels), writers)
+
+        # 创建分类文件夹
+        for folder in ("highQuality", "lowQuality", "skip", "unlabeled"):
+            (output_dir / folder).mkdir(parents=True, exist_ok=True)
+
+        # 收集导出任务：(源文件, 目标相对路径)
+        export_jobs = []
+
+        # 已标注的文件
+        for filename, label in self.labeled_files.items():
+            if filename in file_table:
+                if label in ('highQuality', 'lowQuality', 'skip'):
+                    export_jobs.append((self.images_dir / filename, f"{label}/{filename}"))
+            else:
+                report.not_found += 1
+        if report.not_found:
+            print(f"警告: {report.not_found} 个已标注的文件不存在于 {self.images_dir}")
+        report.labeled = len(export_jobs)
+
+        # 未标注的文件（只针对当前task中的图片）
+        for filename in task_image_names:
+            if filename in file_table and filename not in self.label_state:
+                export_jobs.append((self.images_dir / filename, f"unlabeled/{filename}"))
+        report.unlabeled = len(export_jobs) - report.labeled
+
+        # 并行导出，已完成的文件记录在清单中，中断后可继续
+        engine = ExportEngine(output_dir, strategy=strategy)
+        export_result = engine.run(export_jobs)
+        report.strategy = engine.strategy
+        report.resumed = export_result.resumed
+        report.moved = export_result.moved
+        report.removed = export_result.removed
+        report.errors = export_result.errors
+        if export_result.errors:
+            errors_path = output_dir / f"task_{task_id}_export_errors_{timestamp}.txt"
+            with open(errors_path, 'w', encoding='utf-8') as f:
+                for rel_dst, error in export_result.errors:
+                    f.write(f"{rel_dst}: {error}\n")
+            print(f"{len(export_result.errors)} files failed to export, see {errors_path.name}")
+
+        # 复制任务进度文件（先压缩日志，保证快照完整）
+        self.close_task_progress()
+        if self.task_progress_file and self.task_progress_file.exists():
+            shutil.copy2(str(self.task_progress_file), str(output_dir / report.progress_filename))
+
+        # 没有失败的文件时标记导出完成，否则下次可以继续导出
+        if not export_result.errors:
+            engine.mark_complete()
+        return report
+
+
+def read_label_csv(path):
+    """读取 文件名,标签 的CSV（可有表头），返回 [(文件名, 标签)]"""
+    records = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip():
+                continue
+            name, label = row[0].strip(), row[1].strip()
+            if label not in LABEL_TYPES:
+                if not records and label.lower() == 'label':
+                    continue  # 表头
+                raise ValueError(f"Unknown label {label!r} for {name}")
+            records.append((name, label))
+    return records
+
+
+def main(argv=None):
+    """命令行：无界面地批量标注或导出一个任务"""
+    parser = argparse.ArgumentParser(description="Headless labeling session")
+    parser.add_argument('--project-dir', default=str(Path(__file__).parent))
+    parser.add_argument('--images-dir', help="Image directory (default: <project dir>/images)")
+    parser.add_argument('--label-db', help="Also store labels in this SQLite database")
+    parser.add_argument('--force', action='store_true', help="Take over the task if another annotator holds it")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    apply_parser = subparsers.add_parser('apply', help="Apply labels from a CSV of filename,label rows")
+    apply_parser.add_argument('--task', required=True, help="Task file name in the tasks directory")
+    apply_parser.add_argument('labels', help="CSV file with filename,label rows")
+    apply_parser.add_argument('--overwrite', action='store_true', help="Also relabel images that are already labeled")
+
+    export_parser = subparsers.add_parser('export', help="Export the results of a task")
+    export_parser.add_argument('--task', required=True, help="Task file name in the tasks directory")
+    export_parser.add_argument('--strategy', choices=COPY_STRATEGIES, default='copy',
+                               help="How to place images in the class folders (default: full copy)")
+    export_parser.add_argument('--parquet', action='store_true', help="Also write a Parquet result file")
+    export_parser.add_argument('--resume', action='store_true', help="Resume an interrupted export if there is one")
+    args = parser.parse_args(argv)
+
+    session = LabelSession(args.project_dir, images_dir=args.images_dir, label_db=args.label_db)
+    try:
+        try:
+            session.load_task(args.task, force=args.force)
+        except LeaseHeldError as e:
+            print(f"{args.task} is being labeled by {e.holder.get('annotator', 'unknown')} (use --force to take over)")
+            return 1
+
+        if args.command == 'apply':
+            task_names = set(session.task_manifest)
+            records = read_label_csv(args.labels)
+            unknown = [name for name, _ in records if name not in task_names]
+            records = [(name, label) for name, label in records
+                       if name in task_names and (args.overwrite or name not in session.label_state)]
+            # 按标签分批，每批一次写盘
+            by_label = {}
+            for name, label in records:
+                by_label.setdefault(label, []).append(name)
+            for label, names in by_label.items():
+                session.label_many(names, label)
+            print(f"Labeled {len(records)} images"
+                  + (f", {len(unknown)} names are not in the task" if unknown else ""))
+        else:
+            resume_dir = session.find_incomplete_export() if args.resume else None
+            report = session.export(strategy=args.strategy, parquet=args.parquet, resume_dir=resume_dir)
+            print(f"Exported to {report.output_dir}: {report.labeled} labeled, {report.unlabeled} unlabeled, "
+                  f"{report.not_found} not found, {report.resumed} resumed, "
+                  f"{report.moved} moved, {report.removed} removed, {len(report.errors)} failed")
+        stats = session.stats()
+        print("Stats: " + " | ".join(f"{key}: {value}" for key, value in stats.items()))
+    finally:
+        session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+标注状态
+持有 labeled_files（文件名 -> 标签）并随标注/跳过/撤销/重新加载增量维护各类计数
+"""
+
+# 标签类型
+LABEL_TYPES = ('highQuality', 'lowQuality', 'skip')
+
+
+class LabelState:
+    """标注状态
+
+    所有修改都应通过 set / remove / reset 进行，这样计数始终与 labeled_files 一致。
+    check=True 时每次修改后都会完整重算并校验计数（用于测试）。
+    """
+
+    def __init__(self, labeled_files=None, check=False):
+        self.check = check
+        self.labeled_files = {}
+        self.counts = dict.fromkeys(LABEL_TYPES, 0)
+        self.reset(labeled_files or {})
+
+    def reset(self, labeled_files):
+        """替换全部标注（加载任务进度时调用），只遍历一次"""
+        self.labeled_files = dict(labeled_files)
+        self.counts = self._recount()
+        self._verify_if_checking()
+
+    def set(self, filename, label):
+        """设置标注，返回之前的标签（没有则为None）"""
+        previous = self.labeled_files.get(filename)
+        if previous is not None:
+            self.counts[previous] -= 1
+        self.labeled_files[filename] = label
+        self.counts[label] = self.counts.get(label, 0) + 1
+        self._verify_if_checking()
+        return previous
+
+    def remove(self, filename):
+        """删除标注，返回被删除的标签（没有则为None）"""
+        previous = self.labeled_files.pop(filename, None)
+        if previous is not None:
+            self.counts[previous] -= 1
+        self._verify_if_checking()
+        return previous
+
+    def get(self, filename):
+        return self.labeled_files.get(filename)
+
+    def count(self, label):
+        """某类标签的数量"""
+        return self.counts.get(label, 0)
+
+    @property
+    def total(self):
+        return len(self.labeled_files)
+
+    def __len__(self):
+        return len(self.labeled_files)
+
+    def __contains__(self, filename):
+        return filename in self.labeled_files
+
+    def _recount(self):
+        counts = dict.fromkeys(LABEL_TYPES, 0)
+        for label in self.labeled_files.values():
+            counts[label] = counts.get(label, 0) + 1
+        return counts
+
+    def verify(self):
+        """完整重算并与增量计数比较，不一致时抛出异常"""
+        expected = {label: n for label, n in self._recount().items() if n}
+        actual = {label: n for label, n in self.counts.items() if n}
+        if expected != actual:
+            raise RuntimeError(f"Label counters out of sync: counted {expected}, tracked {actual}")
+
+    def _verify_if_checking(self):
+        if self.check:
+            self.verify()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite标签库（可选）
+所有任务的标注保存在一个数据库中（WAL模式，按批提交），跨任务的查询走索引，不必逐个读取进度文件；
+原有的JSON进度文件仍可导入导出
+
+    python label_store.py import --db labels.db progress/task_progress_*.json
+    python label_store.py export --db labels.db --task-id task_xxx --output task_progress_task_xxx.json
+    python label_store.py query --db labels.db [--label lowQuality] [--task-id task_xxx] [--since 2025-08-06]
+    python label_store.py counts --db labels.db
+
+标注端:
+    python image_labeler.py --label-db labels.db
+"""
+
+import sys
+import csv
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+
+from label_state import LABEL_TYPES
+from progress_store import ProgressStore, read_progress, read_journal
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotators (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS labels (
+    task_id TEXT NOT NULL,
+    image_id INTEGER NOT NULL REFERENCES images(id),
+    label TEXT NOT NULL,
+    annotator_id INTEGER REFERENCES annotators(id),
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (task_id, image_id)
+);
+CREATE INDEX IF NOT EXISTS labels_task_label ON labels(task_id, label);
+CREATE INDEX IF NOT EXISTS labels_label ON labels(label);
+CREATE INDEX IF NOT EXISTS labels_updated ON labels(updated_at);
+CREATE TABLE IF NOT EXISTS label_events (
+    id INTEGER PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    image_id INTEGER NOT NULL REFERENCES images(id),
+    label TEXT,
+    annotator_id INTEGER REFERENCES annotators(id),
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS label_events_at ON label_events(at);
+"""
+
+# 导出时各标签的顺序（与 report_writer.SECTION_ORDER 一致）
+_RANK_SQL = "CASE l.label " + " ".join(f"WHEN '{label}' THEN {rank}" for rank, label in enumerate(LABEL_TYPES)) \
+            + f" ELSE {len(LABEL_TYPES) + 1} END"
+
+
+class LabelStore:
+    """SQLite标签库（线程安全）
+
+    labels 保存每个任务中每张图片的当前标签，label_events 保存每一次标注和撤销（label为NULL）。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._image_ids = {}
+        self._annotator_ids = {}
+
+    def close(self):
+        self._conn.close()
+
+    def _id(self, cursor, table, cache, name):
+        """名称 -> id（不存在时插入），结果缓存在内存中"""
+        if name is None:
+            return None
+        row_id = cache.get(name)
+        if row_id is None:
+            cursor.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+            row_id = cursor.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+            cache[name] = row_id
+        return row_id
+
+    def write(self, records):
+        """在一个事务中写入一批记录 (task_id, 文件名, 标签或None, 标注者, 时间戳)"""
+        if not records:
+            return
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for task_id, filename, label, annotator, at in records:
+                    image_id = self._id(cursor, 'images', self._image_ids, filename)
+                    annotator_id = self._id(cursor, 'annotators', self._annotator_ids, annotator)
+                    cursor.execute("INSERT INTO label_events (task_id, image_id, label, annotator_id, at) "
+                                   "VALUES (?, ?, ?, ?, ?)", (task_id, image_id, label, annotator_id, at))
+                    if label is None:
+                        cursor.execute("DELETE FROM labels WHERE task_id = ? AND image_id = ?", (task_id, image_id))
+                    else:
+                        cursor.execute("INSERT OR REPLACE INTO labels (task_id, image_id, label, annotator_id, updated_at) "
+                                       "VALUES (?, ?, ?, ?, ?)", (task_id, image_id, label, annotator_id, at))
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def labels(self, task_id):
+        """任务的当前标注 {文件名: 标签}"""
+        return dict(self._query("SELECT i.name, l.label FROM labels l JOIN images i ON i.id = l.image_id "
+                                "WHERE l.task_id = ?", (task_id,)))
+
+    def sorted_labels(self, task_id):
+        """任务的当前标注 [(文件名, 标签)]，按 (标签顺序, 文件名) 排序，供导出直接使用"""
+        return self._query(f"SELECT i.name, l.label FROM labels l JOIN images i ON i.id = l.image_id "
+                           f"WHERE l.task_id = ? ORDER BY {_RANK_SQL}, i.name", (task_id,))
+
+    def counts(self, task_id=None):
+        """各标签数量（不指定任务时统计全部任务）"""
+        if task_id is None:
+            rows = self._query("SELECT label, COUNT(*) FROM labels GROUP BY label")
+        else:
+            rows = self._query("SELECT label, COUNT(*) FROM labels WHERE task_id = ? GROUP BY label", (task_id,))
+        counts = {label: 0 for label in LABEL_TYPES}
+        counts.update(rows)
+        return counts
+
+    def query(self, label=None, task_id=None, since=None):
+        """按标签 / 任务 / 修改时间查询，返回 [(task_id, 文件名, 标签, 标注者, 修改时间戳)]"""
+        conditions, params = [], []
+        if label is not None:
+            conditions.append("l.label = ?")
+            params.append(label)
+        if task_id is not None:
+            conditions.append("l.task_id = ?")
+            params.append(task_id)
+        if since is not None:
+            conditions.append("l.updated_at >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._query("SELECT l.task_id, i.name, l.label, a.name, l.updated_at FROM labels l "
+                           "JOIN images i ON i.id = l.image_id LEFT JOIN annotators a ON a.id = l.annotator_id "
+                           f"{where} ORDER BY l.updated_at", params)
+
+    def last_event_time(self, task_id):
+        """任务最后一次标注或撤销的时间戳，数据库中还没有该任务时为None"""
+        return self._query("SELECT MAX(at) FROM label_events WHERE task_id = ?", (task_id,))[0][0]
+
+    def import_snapshot(self, snapshot_path, task_id=None, annotator=None):
+        """导入原格式的JSON进度文件（连同 .journal 日志），返回 (task_id, 导入的标注数)"""
+        snapshot_path = Path(snapshot_path)
+        data = {}
+        if snapshot_path.exists():
+            with open(snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        task_id = task_id or data.get('task_id') or snapshot_path.stem.replace('task_progress_', '', 1)
+        try:
+            at = datetime.fromisoformat(data['last_updated']).timestamp()
+        except (KeyError, TypeError, ValueError):
+            at = time.time()
+
+        labeled_files = read_progress(snapshot_path)
+        annotator = annotator or data.get('annotator')
+        self.write([(task_id, filename, label, annotator, at) for filename, label in labeled_files.items()])
+        return task_id, len(labeled_files)
+
+    def export_snapshot(self, task_id, snapshot_path):
+        """把任务的当前标注导出为原格式的JSON进度文件，返回标注数"""
+        labeled_files = self.labels(task_id)
+        ProgressStore(snapshot_path, task_id=task_id).compact(labeled_files)
+        return len(labeled_files)
+
+
+def _json_progress_time(snapshot_path):
+    """JSON进度最后一次修改的时间：快照的 last_updated（没有时用文件修改时间）与日志最后一条记录的时间中较晚者，
+    都不存在时为None"""
+    snapshot_path = Path(snapshot_path)
+    times = []
+    try:
+        with open(snapshot_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        try:
+            times.append(datetime.fromisoformat(data['last_updated']).timestamp())
+        except (KeyError, TypeError, ValueError):
+            times.append(snapshot_path.stat().st_mtime)
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        print(f"Failed to load task progress file: {e}")
+    records, _, _ = read_journal(snapshot_path.with_suffix('.journal'))
+    times.extend(record.get('t', 0) for record in records)
+    return max(times) if times else None
+
+
+class DatabaseProgressStore:
+    """与 ProgressStore 接口相同的任务进度存储，标注按批写入标签库
+
+    JSON进度比数据库中该任务的最后一次标注新时（第一次打开该任务，或之后不带 --label-db 标注过）先同步进数据库；
+    压缩/关闭时仍写出原格式的JSON快照，导出、任务索引等读取JSON进度文件的代码不受影响。
+    """
+
+    def __init__(self, store, snapshot_path, task_id=None, annotator=None, flush_every=20, flush_interval=1.0):
+        self.store = store
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = self.snapshot_path.with_suffix('.journal')
+        self.task_id = task_id
+        self.annotator = annotator
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+
+        self._pending = []
+        self._changed = False  # 上次写出JSON快照后是否有新的标注
+        self._last_flush = time.monotonic()
+
+    def load(self):
+        """读取任务的当前标注（JSON进度较新时先同步进数据库）"""
+        json_time = _json_progress_time(self.snapshot_path)
+        last_event = self.store.last_event_time(self.task_id)
+        if json_time is not None and (last_event is None or json_time > last_event):
+            count = self._import_json(json_time)
+            if count:
+                print(f"Imported {count} labels from {self.snapshot_path.name} into {self.store.db_path.name}")
+        self._pending = []
+        self._last_flush = time.monotonic()
+        return self.store.labels(self.task_id)
+
+    def _import_json(self, at):
+        """把JSON进度与数据库中的差异（新增、改变和已撤销的标注）写入数据库，时间记为 at，返回写入的记录数
+
+        之后数据库的最后一次标注时间等于JSON进度的时间，下次打开时不再重复同步。
+        自己写出的快照与数据库一致，没有差异，不写入。
+        """
+        labeled_files = read_progress(self.snapshot_path)
+        current = self.store.labels(self.task_id)
+        records = [(self.task_id, filename, label, self.annotator, at)
+                   for filename, label in labeled_files.items() if current.get(filename) != label]
+        records.extend((self.task_id, filename, None, self.annotator, at)
+                       for filename in current if filename not in labeled_files)
+        self.store.write(records)
+        return len(records)
+
+    def record(self, filename, label):
+        """记录一条标注，label为None表示撤销"""
+        self._pending.append((self.task_id, filename, label, self.annotator, round(time.time(), 3)))
+        self._changed = True
+        if (len(self._pending) >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def record_many(self, records):
+        """记录多条标注 [(文件名, 标签), ...] 并立即在一个事务中写入"""
+        now = round(time.time(), 3)
+        self._pending.extend((self.task_id, filename, label, self.annotator, now) for filename, label in records)
+        self._changed = True
+        self.flush()
+
+    def flush(self):
+        """在一个事务中写入待写记录"""
+        self._last_flush = time.monotonic()
+        if self._pending:
+            self.store.write(self._pending)
+            self._pending = []
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, labeled_files):
+        """写入数据库并写出原格式的JSON快照"""
+        self.flush()
+        snapshot = ProgressStore(self.snapshot_path, task_id=self.task_id, annotator=self.annotator)
+        snapshot.compact(labeled_files)
+        self._changed = False
+
+    def close(self, labeled_files):
+        if self._changed or self._pending:
+            self.compact(labeled_files)
+
+
+def _parse_since(value):
+    """--since 参数：日期/时间（ISO格式）或相对时间如 24h、7d"""
+    if value[-1:] in ('h', 'd') and value[:-1].isdigit():
+        return time.time() - int(value[:-1]) * (3600 if value[-1] == 'h' else 86400)
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="SQLite label store tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="Import JSON progress files")
+    import_parser.add_argument('--db', required=True)
+    import_parser.add_argument('files', nargs='+')
+    import_parser.add_argument('--annotator', default=None)
+
+    export_parser = subparsers.add_parser('export', help="Export a task as a JSON progress file")
+    export_parser.add_argument('--db', required=True)
+    export_parser.add_argument('--task-id', required=True)
+    export_parser.add_argument('--output', required=True)
+
+    query_parser = subparsers.add_parser('query', help="List labels as CSV")
+    query_parser.add_argument('--db', required=True)
+    query_parser.add_argument('--label', choices=LABEL_TYPES)
+    query_parser.add_argument('--task-id')
+    query_parser.add_argument('--since', help="ISO date/time, or a relative age such as 24h or 7d")
+
+    counts_parser = subparsers.add_parser('counts', help="Label counts")
+    counts_parser.add_argument('--db', required=True)
+    counts_parser.add_argument('--task-id')
+
+    args = parser.parse_args(argv)
+    store = LabelStore(args.db)
+
+    if args.command == 'import':
+        for path in args.files:
+            task_id, count = store.import_snapshot(path, annotator=args.annotator)
+            print(f"{path}: {count} labels imported for {task_id}")
+    elif args.command == 'export':
+        count = store.export_snapshot(args.task_id, args.output)
+        print(f"Exported {count} labels to {args.output}")
+    elif args.command == 'query':
+        since = _parse_since(args.since) if args.since else None
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['task_id', 'filename', 'label', 'annotator', 'updated_time'])
+        for task_id, filename, label, annotator, updated_at in store.query(args.label, args.task_id, since):
+            writer.writerow([task_id, filename, label, annotator or '',
+                             time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(updated_at))])
+    elif args.command == 'counts':
+        for label, count in store.counts(args.task_id).items():
+            print(f"{label}: {count}")
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
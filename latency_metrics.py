@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+热路径耗时统计
+按阶段记录最近若干次的耗时，给出滚动的 p50/p95/p99，可定期追加写入 JSONL 文件；
+enabled=False 时 stage() 返回共享的空上下文，record() 立即返回，几乎没有开销
+
+    metrics = LatencyMetrics(enabled=True, dump_path="metrics.jsonl")
+    with metrics.stage("save_task_progress"):
+        ...
+    print(metrics.format())
+
+查看 JSONL 文件中最后一次的统计:
+    python latency_metrics.py metrics.jsonl
+"""
+
+import sys
+import json
+import math
+import time
+import threading
+from collections import deque
+from contextlib import nullcontext
+
+PERCENTILES = (50, 95, 99)
+
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    """计时上下文：退出时记录耗时"""
+
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def percentile(sorted_values, p):
+    """已排序序列的第p百分位（最近秩法）"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(p / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+class LatencyMetrics:
+    """各阶段的滚动耗时统计（线程安全，后台解码线程也可以记录）
+
+    每个阶段只保留最近 window 次耗时，百分位在读取时排序计算；
+    另外累计总次数和总耗时。
+    """
+
+    def __init__(self, enabled=False, window=1024, dump_path=None, dump_interval=10.0):
+        self.enabled = enabled
+        self.window = window
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self._samples = {}  # 阶段名 -> deque(耗时秒)
+        self._totals = {}  # 阶段名 -> [次数, 总耗时秒]
+        self._lock = threading.Lock()
+        self._last_dump = time.monotonic()
+
+    def stage(self, name):
+        """计时上下文管理器：with metrics.stage('decode'): ..."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        """记录一次耗时（秒）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+                self._totals[name] = [0, 0.0]
+            samples.append(seconds)
+            totals = self._totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def wrap(self, name, func):
+        """包装一个函数，每次调用都计时（未启用时原样返回）"""
+        if not self.enabled:
+            return func
+
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def snapshot(self):
+        """{阶段名: {'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}}，百分位只基于最近 window 次"""
+        with self._lock:
+            copied = {name: (sorted(samples), tuple(self._totals[name])) for name, samples in self._samples.items()}
+        stats = {}
+        for name, (values, (count, total)) in sorted(copied.items()):
+            entry = {'count': count, 'mean_ms': round(total / count * 1000, 3)}
+            for p in PERCENTILES:
+                entry[f'p{p}_ms'] = round(percentile(values, p) * 1000, 3)
+            entry['max_ms'] = round(values[-1] * 1000, 3)
+            stats[name] = entry
+        return stats
+
+    def format(self, stats=None):
+        """文本表格（调试浮层和终端输出）"""
+        stats = self.snapshot() if stats is None else stats
+        lines = [f"{'stage':26s} {'n':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} ms"]
+        for name, entry in stats.items():
+            lines.append(f"{name[:26]:26s} {entry['count']:6d} {entry['p50_ms']:7.1f} {entry['p95_ms']:7.1f} "
+                         f"{entry['p99_ms']:7.1f} {entry['max_ms']:7.1f}")
+        return "\n".join(lines)
+
+    def maybe_dump(self, force=False):
+        """距上次写出超过 dump_interval 秒（或 force）时向 dump_path 追加一行统计"""
+        if not self.enabled or not self.dump_path:
+            return False
+        if not force and time.monotonic() - self._last_dump < self.dump_interval:
+            return False
+        self._last_dump = time.monotonic()
+        stats = self.snapshot()
+        if not stats:
+            return False
+        with open(self.dump_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'t': round(time.time(), 3), 'stages': stats}, ensure_ascii=False) + '\n')
+        return True
+
+
+def main(argv=None):
+    """打印 JSONL 统计文件中最后一次的统计"""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("Usage: python latency_metrics.py metrics.jsonl")
+        return 1
+    last = None
+    with open(argv[0], 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                last = line
+    if last is None:
+        print("No metrics recorded")
+        return 0
+    record = json.loads(last)
+    print(f"Metrics at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['t']))}:")
+    print(LatencyMetrics().format(record['stages']))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
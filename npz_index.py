@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按文件名缓存的逐图片数组表（npz文件）
+每张图片一行：文件名、大小、修改时间和若干数据列（如感知哈希、质量指标）；
+增量构建时大小和修改时间都没变的图片沿用旧值，其余分块交给多进程计算。
+image_hash.HashIndex 和 image_quality.QualityIndex 都基于这里的 NpzIndex。
+"""
+
+import os
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class NpzIndex:
+    """持久化的表：文件名、大小、修改时间和 COLUMNS 中的各列（npz文件）
+
+    子类设置 COLUMNS（列名）、DTYPE（各列的类型）和 REQUIRES（缺少numpy时的错误信息）。
+    """
+
+    COLUMNS = ()
+    DTYPE = 'float32'
+    REQUIRES = "This index requires numpy (pip install numpy)"
+
+    def __init__(self, names=(), sizes=None, mtimes=None, columns=None):
+        self._require_numpy()
+        self.names = list(names)
+        count = len(self.names)
+        self.sizes = sizes if sizes is not None else np.zeros(count, dtype=np.int64)
+        self.mtimes = mtimes if mtimes is not None else np.zeros(count, dtype=np.float64)
+        self.columns = columns or {key: np.zeros(count, dtype=self.DTYPE) for key in self.COLUMNS}
+        self._positions = None
+
+    @classmethod
+    def _require_numpy(cls):
+        if np is None:
+            raise RuntimeError(cls.REQUIRES)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def load(cls, path):
+        """读取索引文件，不存在时返回空索引"""
+        cls._require_numpy()
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        with np.load(path) as data:
+            blob = data['names'].tobytes().decode('utf-8')
+            names = blob.split('\n') if blob else []
+            return cls(names, data['sizes'], data['mtimes'], {key: data[key] for key in cls.COLUMNS})
+
+    def save(self, path):
+        """写出索引文件（先写临时文件再原子替换）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp.npz')
+        names = np.frombuffer('\n'.join(self.names).encode('utf-8'), dtype=np.uint8)
+        np.savez(tmp_path, names=names, sizes=self.sizes, mtimes=self.mtimes, **self.columns)
+        os.replace(tmp_path, path)
+
+    def position(self, name):
+        """文件名 -> 下标（不存在时为None）"""
+        if self._positions is None:
+            self._positions = {name: i for i, name in enumerate(self.names)}
+        return self._positions.get(name)
+
+    def subset(self, names):
+        """只包含给定文件名的索引（索引中没有的忽略）"""
+        positions = [p for p in (self.position(name) for name in names) if p is not None]
+        take = np.asarray(positions, dtype=np.int64)
+        return type(self)([self.names[p] for p in positions], self.sizes[take], self.mtimes[take],
+                          {key: values[take] for key, values in self.columns.items()})
+
+    @classmethod
+    def build(cls, images_dir, index_path, chunk_worker, workers=None, chunk_size=64, progress=None):
+        """为目录中新增或变化的图片计算各列并写回索引，返回 (索引, 新计算数, 错误列表)
+
+        chunk_worker: 工作进程中执行的模块级函数，一批图片路径 -> (成功的下标列表, {列名: 数组}或None, 错误列表)
+        progress(已完成数, 总数): 每完成一块调用一次
+        """
+        cls._require_numpy()
+        from task_splitter import IMAGE_EXTENSIONS
+
+        old = cls.load(index_path)
+        files = []
+        with os.scandir(images_dir) as entries:
+            for entry in entries:
+                if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS and entry.is_file():
+                    st = entry.stat()
+                    files.append((entry.name, st.st_size, st.st_mtime))
+        files.sort()
+
+        names = [name for name, _, _ in files]
+        sizes = np.array([size for _, size, _ in files], dtype=np.int64)
+        mtimes = np.array([mtime for _, _, mtime in files], dtype=np.float64)
+        index = cls(names, sizes, mtimes)
+
+        # 大小和修改时间都没变的直接沿用旧值
+        todo, reused, reused_from = [], [], []
+        for i, (name, size, mtime) in enumerate(files):
+            p = old.position(name)
+            if p is not None and old.sizes[p] == size and old.mtimes[p] == mtime:
+                reused.append(i)
+                reused_from.append(p)
+            else:
+                todo.append(i)
+        if reused:
+            for key in cls.COLUMNS:
+                index.columns[key][reused] = old.columns[key][reused_from]
+
+        errors = []
+        failed = []
+        chunks = [todo[start:start + chunk_size] for start in range(0, len(todo), chunk_size)]
+        if chunks:
+            images_dir = os.fspath(images_dir)
+            path_chunks = [[os.path.join(images_dir, names[i]) for i in chunk] for chunk in chunks]
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+                for done, (chunk, (ok, values, chunk_errors)) in enumerate(
+                        zip(chunks, executor.map(chunk_worker, path_chunks)), 1):
+                    errors.extend(chunk_errors)
+                    ok_set = set(ok)
+                    failed.extend(i for j, i in enumerate(chunk) if j not in ok_set)
+                    if values is not None:
+                        targets = np.asarray([chunk[j] for j in ok], dtype=np.int64)
+                        for key in cls.COLUMNS:
+                            index.columns[key][targets] = values[key]
+                    if progress:
+                        progress(done * chunk_size, len(todo))
+
+        if failed:
+            # 无法读取的图片不写入索引，下次重试
+            failed = set(failed)
+            index = index.subset([name for i, name in enumerate(names) if i not in failed])
+        index.save(index_path)
+        return index, len(todo) - len(failed), errors
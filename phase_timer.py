@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分阶段计时
+记录启动等流程中各阶段的耗时，用于 --profile-startup 报告
+"""
+
+import time
+import threading
+
+
+class PhaseTimer:
+    """按阶段记录耗时；enabled=False 时所有调用都是空操作"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self._last = self.start
+        self._phases = []  # (阶段名, 耗时秒, 结束时距开始的秒数)
+        self._lock = threading.Lock()
+
+    def mark(self, phase, since=None):
+        """记录一个阶段结束；since为阶段开始的perf_counter值，默认是上一个阶段结束时"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            began = self._last if since is None else since
+            self._phases.append((phase, now - began, now - self.start))
+            if since is None:
+                self._last = now
+
+    def report(self, title="Startup timing"):
+        """生成文本报告"""
+        lines = [f"{title}:"]
+        for phase, duration, at in self._phases:
+            lines.append(f"  {phase:28s} {duration * 1000:9.1f} ms   (t+{at * 1000:.1f} ms)")
+        return "\n".join(lines)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预览图缓存
+按 文件名 + 大小 + 修改时间 为键，在磁盘上缓存显示尺寸的预览图，超过容量按LRU淘汰
+
+预生成整个任务的预览图（使用全部CPU核心）:
+    python preview_cache.py warm tasks/task_xxx.json [--images-dir images] [--workers N]
+"""
+
+import os
+import sys
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+from display_decoder import DisplayDecoder
+from task_manifest import open_manifest
+
+PREVIEW_FORMATS = {'JPEG': '.jpg', 'WEBP': '.webp'}
+
+
+class PreviewCache:
+    """磁盘预览图缓存
+
+    实例可直接作为解码器调用：cache(image_path) -> PIL.Image，
+    命中时读取小尺寸预览图，未命中时用 decoder 解码原图并写入缓存。
+    缓存占用在打开时由后台线程统计一次，之后随写入累加；统计和淘汰都要扫描整个缓存目录，
+    在后台线程中进行，不阻塞调用 put 的解码/预取线程。
+    """
+
+    def __init__(self, cache_dir, decoder=None, max_bytes=2 * 1024 * 1024 * 1024,
+                 image_format='JPEG', quality=90, track_usage=True):
+        if image_format not in PREVIEW_FORMATS:
+            raise ValueError(f"Unsupported preview format: {image_format}")
+        self.cache_dir = Path(cache_dir)
+        self.decoder = decoder or DisplayDecoder()
+        self.max_bytes = max_bytes  # 缓存目录容量上限
+        self.image_format = image_format
+        self.quality = quality
+
+        self._lock = threading.Lock()
+        self._total_bytes = None  # 缓存目录占用（后台统计完成前为None）
+        self._scanning = False  # 后台统计或淘汰进行中
+        self._written_during_scan = 0  # 后台扫描期间写入的字节
+        if track_usage:
+            self._start_scan(self.disk_usage)
+
+    def key(self, image_path):
+        """缓存键：文件名 + 大小 + 修改时间 + 预览尺寸"""
+        st = os.stat(image_path)
+        identity = (f"{Path(image_path).name}\0{st.st_size}\0{st.st_mtime_ns}\0"
+                    f"{self.decoder.max_width}x{self.decoder.max_height}")
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def preview_path(self, key):
+        """预览图路径（按键前两位分子目录，避免单目录文件过多）"""
+        return self.cache_dir / key[:2] / (key + PREVIEW_FORMATS[self.image_format])
+
+    def get(self, image_path):
+        """读取缓存的预览图，未命中返回None"""
+        preview_path = self.preview_path(self.key(image_path))
+        try:
+            image = Image.open(preview_path)
+            image.load()
+        except (FileNotFoundError, OSError):
+            return None
+
+        # 更新修改时间，作为LRU的最近使用时间
+        try:
+            os.utime(preview_path)
+        except OSError:
+            pass
+        return image
+
+    def put(self, image_path, image, evict=True):
+        """写入预览图（先写临时文件再原子替换，支持多进程同时写入）"""
+        preview_path = self.preview_path(self.key(image_path))
+        preview_path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = preview_path.with_name(f"{preview_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(tmp_path, self.image_format, quality=self.quality)
+        size = tmp_path.stat().st_size
+        os.replace(tmp_path, preview_path)
+
+        if evict:
+            with self._lock:
+                if self._scanning:
+                    self._written_during_scan += size
+                    return
+                if self._total_bytes is None:
+                    scan = self.disk_usage  # 打开时没有统计（track_usage=False）
+                elif self._total_bytes + size > self.max_bytes:
+                    scan = self.evict
+                else:
+                    self._total_bytes += size
+                    return
+                self._start_scan(scan)
+
+    def _start_scan(self, scan):
+        """在后台线程中执行 scan()（统计占用或淘汰，返回占用字节数），完成后加上期间写入的字节
+
+        调用方持有 _lock（或在 __init__ 中，实例尚未共享）。
+        """
+        def run():
+            try:
+                total = scan()
+            except Exception as e:
+                print(f"Failed to scan preview cache: {e}")
+                total = None
+            with self._lock:
+                if total is not None:
+                    self._total_bytes = total + self._written_during_scan
+                self._written_during_scan = 0
+                self._scanning = False
+
+        self._scanning = True
+        threading.Thread(target=run, name="preview-cache-scan", daemon=True).start()
+
+    def __call__(self, image_path):
+        image = self.get(image_path)
+        if image is None:
+            image = self.decoder(image_path)
+            try:
+                self.put(image_path, image)
+            except Exception as e:
+                print(f"Failed to write preview cache for {Path(image_path).name}: {e}")
+        return image
+
+    def _iter_previews(self):
+        """遍历缓存中的预览图 (路径, 大小, 修改时间)"""
+        if not self.cache_dir.exists():
+            return
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    st = entry.stat()
+                    yield entry.path, st.st_size, st.st_mtime
+
+    def disk_usage(self):
+        """缓存目录当前占用的字节数"""
+        return sum(size for _, size, _ in self._iter_previews())
+
+    def evict(self, target_ratio=0.9):
+        """删除最久未使用的预览图，直到占用降到容量的target_ratio，返回剩余字节数"""
+        previews = sorted(self._iter_previews(), key=lambda p: p[2])
+        total = sum(size for _, size, _ in previews)
+        target = self.max_bytes * target_ratio
+        for path, size, _ in previews:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+        return total
+
+
+# 预生成时每个工作进程持有一个缓存实例
+_worker_cache = None
+
+
+def _init_worker(cache_dir, max_width, max_height, image_format, quality):
+    global _worker_cache
+    decoder = DisplayDecoder(max_width, max_height)
+    _worker_cache = PreviewCache(cache_dir, decoder, image_format=image_format, quality=quality,
+                                 track_usage=False)
+
+
+def _warm_one(image_path):
+    """工作进程：生成单张预览图，返回 (是否新生成, 错误信息)"""
+    try:
+        if _worker_cache.get(image_path) is not None:
+            return False, None
+        _worker_cache.put(image_path, _worker_cache.decoder(image_path), evict=False)
+        return True, None
+    except Exception as e:
+        return False, f"{Path(image_path).name}: {e}"
+
+
+def warm_task(task_path, images_dir, cache_dir, workers=None, max_width=None, max_height=None,
+              image_format='JPEG', quality=90, max_bytes=2 * 1024 * 1024 * 1024):
+    """为任务中的全部图片预生成预览图，返回 (新生成数, 已存在数, 错误列表)"""
+    manifest = open_manifest(task_path)
+    images_dir = Path(images_dir)
+    paths = [str(images_dir / name) for name in manifest]
+    manifest.close()
+    decoder = DisplayDecoder()
+    init_args = (str(cache_dir), max_width or decoder.max_width, max_height or decoder.max_height,
+                 image_format, quality)
+
+    created, cached, errors = 0, 0, []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=init_args) as executor:
+        for i, (is_new, error) in enumerate(executor.map(_warm_one, paths, chunksize=32), 1):
+            if error:
+                errors.append(error)
+            elif is_new:
+                created += 1
+            else:
+                cached += 1
+            if i % 500 == 0:
+                print(f"  {i}/{len(paths)}")
+
+    # 所有进程写完后统一按容量淘汰
+    cache = PreviewCache(cache_dir, DisplayDecoder(*init_args[1:3]), max_bytes=max_bytes, track_usage=False)
+    if cache.disk_usage() > max_bytes:
+        cache.evict()
+
+    return created, cached, errors
+
+
+def main():
+    """命令行入口"""
+    project_dir = Path(__file__).parent
+    parser = argparse.ArgumentParser(description="Preview cache tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    warm_parser = subparsers.add_parser('warm', help="Pre-generate previews for a task file")
+    warm_parser.add_argument('task_file')
+    warm_parser.add_argument('--images-dir', default=str(project_dir / "images"))
+    warm_parser.add_argument('--cache-dir', default=str(project_dir / "preview_cache"))
+    warm_parser.add_argument('--workers', type=int, default=None, help="Default: all CPU cores")
+    warm_parser.add_argument('--format', choices=sorted(PREVIEW_FORMATS), default='JPEG')
+    warm_parser.add_argument('--max-mb', type=int, default=2048, help="Cache size cap in MB")
+
+    args = parser.parse_args()
+
+    if args.command == 'warm':
+        print(f"Warming preview cache for {args.task_file}...")
+        created, cached, errors = warm_task(args.task_file, args.images_dir, args.cache_dir,
+                                            workers=args.workers, image_format=args.format,
+                                            max_bytes=args.max_mb * 1024 * 1024)
+        print(f"Done: {created} generated, {cached} already cached, {len(errors)} failed")
+        for error in errors[:20]:
+            print(f"  {error}")
+        if errors:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
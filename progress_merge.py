@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合并多个标注者的任务进度
+每个输入是一个进度快照（可带 .journal 日志），输出为原有格式的进度快照:
+    python progress_merge.py merged.json alice/task_progress_x.json bob/task_progress_x.json \
+        [--policy last-writer|majority] [--conflicts conflicts.csv]
+
+last-writer: 每张图片取最后一次标注（日志中有每条记录的时间，快照只有整体的 last_updated）
+majority:    每张图片取多数标注者的标签，票数相同时取最后一次标注
+"""
+
+import os
+import sys
+import csv
+import json
+import argparse
+from pathlib import Path
+from datetime import datetime
+from collections import Counter
+
+from progress_store import ProgressStore, read_journal
+
+MERGE_POLICIES = ('last-writer', 'majority')
+
+
+def _snapshot_time(data, path):
+    """快照的时间：last_updated 字段，没有时用文件修改时间"""
+    try:
+        return datetime.fromisoformat(data['last_updated']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return os.stat(path).st_mtime
+
+
+def load_progress_records(snapshot_path):
+    """读取一个标注者的进度，返回 (task_id, annotator, {文件名: (标签, 时间戳)})"""
+    snapshot_path = Path(snapshot_path)
+    task_id, annotator, records = None, None, {}
+
+    if snapshot_path.exists():
+        with open(snapshot_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        task_id = data.get('task_id')
+        annotator = data.get('annotator')
+        snapshot_time = _snapshot_time(data, snapshot_path)
+        records = {filename: (label, snapshot_time)
+                   for filename, label in (data.get('labeled_files') or {}).items()}
+
+    # 日志中的记录带有各自的时间
+    # （只读：标注工具可能仍在追加，不完整的最后一行忽略，文件不修改）
+    journal, _, _ = read_journal(snapshot_path.with_suffix('.journal'))
+    for record in journal:
+        if record.get('l') is None:
+            records.pop(record['f'], None)
+        else:
+            records[record['f']] = (record['l'], record.get('t', 0))
+
+    return task_id, annotator or snapshot_path.parent.name, records
+
+
+def merge_records(sources, policy='last-writer'):
+    """合并多个 {文件名: (标签, 时间戳)}
+
+    返回 (合并后的 {文件名: 标签}, 冲突列表 [(文件名, 选中的标签, [各来源的标签或None])])
+    """
+    if policy not in MERGE_POLICIES:
+        raise ValueError(f"Unknown merge policy: {policy}")
+
+    merged = {}
+    conflicts = []
+    all_files = set()
+    for records in sources:
+        all_files.update(records)
+
+    for filename in sorted(all_files):
+        votes = [records.get(filename) for records in sources]
+        present = [vote for vote in votes if vote is not None]
+        labels = {label for label, _ in present}
+
+        if len(labels) == 1:
+            merged[filename] = present[0][0]
+            continue
+
+        if policy == 'majority':
+            counts = Counter(label for label, _ in present)
+            top = max(counts.values())
+            candidates = [vote for vote in present if counts[vote[0]] == top]
+        else:
+            candidates = present
+        # 最后一次标注；时间相同时取靠后的来源，结果可重复
+        chosen = max(enumerate(candidates), key=lambda item: (item[1][1], item[0]))[1][0]
+        merged[filename] = chosen
+        conflicts.append((filename, chosen, [vote[0] if vote else None for vote in votes]))
+
+    return merged, conflicts
+
+
+def write_conflicts(path, conflicts, source_names):
+    """把冲突写成CSV：文件名、选中的标签、各来源的标签"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['filename', 'merged_label'] + list(source_names))
+        for filename, chosen, labels in conflicts:
+            writer.writerow([filename, chosen] + [label or '' for label in labels])
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="Merge task progress files from several annotators")
+    parser.add_argument('output', help="Merged progress snapshot to write")
+    parser.add_argument('inputs', nargs='+', help="Progress snapshots (a .journal next to each is replayed)")
+    parser.add_argument('--policy', choices=MERGE_POLICIES, default='last-writer')
+    parser.add_argument('--conflicts', help="Write conflicting labels to this CSV file")
+    args = parser.parse_args(argv)
+
+    task_ids = set()
+    source_names = []
+    sources = []
+    for path in args.inputs:
+        task_id, annotator, records = load_progress_records(path)
+        if task_id:
+            task_ids.add(task_id)
+        source_names.append(annotator)
+        sources.append(records)
+        print(f"  {path}: {len(records)} labels ({annotator})")
+    if len(task_ids) > 1:
+        print(f"Warning: inputs belong to different tasks: {', '.join(sorted(task_ids))}")
+
+    merged, conflicts = merge_records(sources, args.policy)
+
+    output_path = Path(args.output)
+    lease_path = output_path.with_suffix('.lease')
+    if lease_path.exists():
+        print(f"Warning: {lease_path.name} exists, the task may still be open in a labeler")
+    store = ProgressStore(output_path, task_id=task_ids.pop() if len(task_ids) == 1 else None)
+    store.compact(merged)
+
+    print(f"Merged {len(merged)} labels from {len(sources)} files into {output_path} "
+          f"({len(conflicts)} conflicts, policy {args.policy})")
+    if args.conflicts and conflicts:
+        write_conflicts(args.conflicts, conflicts, source_names)
+        print(f"Conflicts written to {args.conflicts}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务进度存储
+快照 + 追加式日志：每次标注只追加一条记录，定期压缩成原有格式的JSON快照
+ProgressWriter 可把写盘放到后台线程，标注时界面线程不等待fsync
+read_progress / read_journal 供任务索引、进度合并等非持有者只读地读取进度，不修改文件
+"""
+
+import os
+import json
+import time
+import uuid
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+
+def read_snapshot(snapshot_path):
+    """读取进度快照中的 labeled_files（文件不存在或损坏时为空字典）"""
+    snapshot_path = Path(snapshot_path)
+    if snapshot_path.exists():
+        try:
+            with open(snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data.get('labeled_files'), dict):
+                return data['labeled_files'].copy()
+        except Exception as e:
+            print(f"Failed to load task progress file: {e}")
+    return {}
+
+
+def read_journal(journal_path):
+    """只读地读取日志，返回 (记录列表, 以换行结尾的完整部分的字节数, 末尾是否有不完整的行)
+
+    不修改文件：最后一行不完整时（崩溃留下的，或持有者正在追加）忽略它；
+    中间无法解析的行跳过，继续读取后面的记录。
+    """
+    records, complete_size, torn = [], 0, False
+    try:
+        f = open(journal_path, 'rb')
+    except FileNotFoundError:
+        return records, complete_size, torn
+    with f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                torn = True
+                break
+            complete_size += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict) or 'f' not in record:
+                print(f"Skipping corrupt journal record in {Path(journal_path).name}")
+                continue
+            records.append(record)
+    return records, complete_size, torn
+
+
+def read_progress(snapshot_path):
+    """只读地读取任务进度（快照 + 日志重放），返回 labeled_files；不截断日志，可在其他标注者写入时读取"""
+    snapshot_path = Path(snapshot_path)
+    labeled_files = read_snapshot(snapshot_path)
+    records, _, _ = read_journal(snapshot_path.with_suffix('.journal'))
+    for record in records:
+        ProgressStore._apply(labeled_files, record)
+    return labeled_files
+
+
+class ProgressStore:
+    """日志式任务进度存储
+
+    快照文件保持原格式 {task_id, labeled_files, last_updated}（指定标注者时另有 annotator 字段），
+    导出等旧代码可直接读取。
+    日志文件与快照同名、后缀为 .journal，每行一条记录：
+        {"f": 文件名, "l": 标签, "t": 时间戳}   标注 / 跳过
+        {"f": 文件名, "l": null, "t": 时间戳}   撤销
+    """
+
+    def __init__(self, snapshot_path, task_id=None, flush_every=20, flush_interval=1.0,
+                 compact_every=5000, annotator=None):
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = self.snapshot_path.with_suffix('.journal')
+        self.task_id = task_id
+        self.annotator = annotator
+        self.flush_every = flush_every  # 累计多少条记录后写盘并fsync
+        self.flush_interval = flush_interval  # 距上次写盘超过多少秒后写盘
+        self.compact_every = compact_every  # 日志超过多少条记录后压缩为快照
+
+        self._pending = []  # 尚未写入日志的记录
+        self._journal_records = 0  # 日志文件中已有的记录数
+        self._last_flush = time.monotonic()
+
+    def load(self):
+        """读取快照并重放日志，返回 labeled_files 字典
+
+        只应由持有这个日志的存储（持有任务租约的会话）调用：崩溃留下的不完整最后一行会被截掉，
+        以免后续追加接在半行后面。其他读取者请用 read_progress。
+        """
+        labeled_files = read_snapshot(self.snapshot_path)
+        records, complete_size, torn = read_journal(self.journal_path)
+        for record in records:
+            self._apply(labeled_files, record)
+        self._journal_records = len(records)
+        if torn:
+            print(f"Ignoring truncated journal record in {self.journal_path.name}")
+            os.truncate(self.journal_path, complete_size)
+
+        self._pending = []
+        self._last_flush = time.monotonic()
+        return labeled_files
+
+    @staticmethod
+    def _apply(labeled_files, record):
+        """将一条日志记录应用到标注字典"""
+        if record.get('l') is None:
+            labeled_files.pop(record['f'], None)
+        else:
+            labeled_files[record['f']] = record['l']
+
+    def record(self, filename, label):
+        """追加一条标注记录，label为None表示撤销"""
+        self._pending.append({'f': filename, 'l': label, 't': round(time.time(), 3)})
+        if (len(self._pending) >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def record_many(self, records):
+        """一次追加多条标注记录 [(文件名, 标签), ...] 并立即写盘（一次写入、一次fsync）"""
+        now = round(time.time(), 3)
+        self._pending.extend({'f': filename, 'l': label, 't': now} for filename, label in records)
+        self.flush()
+
+    def flush(self):
+        """将待写记录追加到日志并fsync"""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        lines = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in self._pending)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._journal_records += len(self._pending)
+        self._pending = []
+
+    def needs_compaction(self):
+        """日志是否已超过压缩阈值"""
+        return self._journal_records + len(self._pending) >= self.compact_every
+
+    def compact(self, labeled_files):
+        """写出完整快照（先写临时文件再原子替换），然后清空日志"""
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            'task_id': self.task_id,
+            'labeled_files': labeled_files,
+            'last_updated': datetime.now().isoformat()
+        }
+        if self.annotator:
+            data['annotator'] = self.annotator
+        # 临时文件名各写入者不同，共享目录上多个进程同时压缩也不会互相覆盖临时文件
+        tmp_path = self.snapshot_path.with_name(f"{self.snapshot_path.name}.{uuid.uuid4().hex[:12]}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        # 快照已包含全部记录，日志可以清空（即使清空前崩溃，重放也是幂等的）
+        if self.journal_path.exists():
+            self.journal_path.unlink()
+        self._journal_records = 0
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    def close(self, labeled_files):
+        """关闭前压缩，保证快照文件是最新的"""
+        if self._pending or self._journal_records:
+            self.compact(labeled_files)
+
+
+class ProgressWriter:
+    """进度写盘线程
+
+    进度存储的写操作（record / record_many / flush / compact）提交到这一个后台线程，按提交顺序执行，
+    提交方不等待写盘和fsync。存储对象只在这个线程中被修改，本身不需要加锁。
+    写入失败时打印错误；日志中未写入的记录留在存储的待写列表中，下次 flush 时重试。
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="progress-writer")
+
+    def submit(self, func, *args):
+        """提交一个写操作，返回 Future"""
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._report_error)
+        return future
+
+    def run(self, func, *args):
+        """在写盘线程中执行一个写操作并等待完成，失败时把异常抛给调用方"""
+        return self._executor.submit(func, *args).result()
+
+    @staticmethod
+    def _report_error(future):
+        if not future.cancelled() and future.exception():
+            print(f"Failed to save task progress file: {future.exception()}")
+
+    def wait(self):
+        """等待之前提交的写操作全部完成"""
+        self._executor.submit(lambda: None).result()
+
+    def shutdown(self):
+        """完成已提交的写操作后结束线程"""
+        self._executor.shutdown(wait=True)
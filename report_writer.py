@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导出结果写入
+按 (标签, 文件名) 只排序一次，生成紧凑的行元组，CSV / 文本报告 / Parquet 在同一次遍历中流式写出
+"""
+
+import csv
+import time
+from datetime import datetime
+from itertools import chain
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from label_state import LABEL_TYPES
+
+# 报告中各部分的顺序，None 表示未标注
+SECTION_ORDER = LABEL_TYPES + (None,)
+_SECTION_RANK = {label: rank for rank, label in enumerate(SECTION_ORDER)}
+
+# 行元组：(文件名, 标签或None, 文件大小或None, 修改时间戳或None)
+ROW_FIELDS = ('filename', 'label', 'file_size', 'modified_time')
+
+
+def parquet_available():
+    """是否安装了 pyarrow"""
+    return pyarrow is not None
+
+
+def _format_mtime(mtime):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(mtime))
+
+
+def iter_export_rows(labeled_files, task_image_names, file_table, sorted_labels=None):
+    """生成导出行：已标注的文件（含不存在的）+ 任务中存在但未标注的文件
+
+    只对 (标签顺序, 文件名) 排序一次，行本身按需生成，不保存中间的字典列表。
+    sorted_labels 为已按此顺序排好的 [(文件名, 标签)]（例如标签库的查询结果）时，
+    只需对未标注的文件排序。
+    """
+    if sorted_labels is None:
+        keys = [(_SECTION_RANK.get(label, len(SECTION_ORDER)), filename)
+                for filename, label in labeled_files.items()]
+        keys.extend((_SECTION_RANK[None], filename) for filename in task_image_names
+                    if filename not in labeled_files and filename in file_table)
+        keys.sort()
+        labeled = ((filename, labeled_files.get(filename)) for _, filename in keys)
+    else:
+        unlabeled = sorted(filename for filename in task_image_names
+                           if filename not in labeled_files and filename in file_table)
+        labeled = chain(sorted_labels, ((filename, None) for filename in unlabeled))
+
+    for filename, label in labeled:
+        file_info = file_table.get(filename)
+        if file_info:
+            yield filename, label, file_info[0], file_info[1]
+        else:
+            yield filename, label, None, None
+
+
+class ExportSummary:
+    """报告头部的总体统计，由计数器和元数据表直接得到，不需要遍历行"""
+
+    def __init__(self, label_state, unlabeled_count, labeled_size):
+        self.total = label_state.total
+        self.counts = {label: label_state.count(label) for label in LABEL_TYPES}
+        self.unlabeled = unlabeled_count
+        self.labeled_size = labeled_size
+
+    @classmethod
+    def from_table(cls, label_state, task_image_names, file_table):
+        labeled_size = 0
+        for filename in label_state.labeled_files:
+            file_info = file_table.get(filename)
+            if file_info:
+                labeled_size += file_info[0]
+        unlabeled_count = sum(1 for filename in task_image_names
+                              if filename in file_table and filename not in label_state)
+        return cls(label_state, unlabeled_count, labeled_size)
+
+
+class CsvResultWriter:
+    """CSV结果（只包含已标注的文件，与原格式相同的列）"""
+
+    def __init__(self, path):
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(['filename', 'label', 'folder', 'file_size', 'modified_time'])
+
+    def write(self, row):
+        filename, label, size, mtime = row
+        if label is None:
+            return
+        if size is None:
+            # 文件不存在，仍然记录标注信息
+            self._writer.writerow((filename, label, 'not_found', 0, 'N/A'))
+        else:
+            self._writer.writerow((filename, label, 'images', size, _format_mtime(mtime)))
+
+    def close(self):
+        self._file.close()
+
+
+class TextReportWriter:
+    """文本统计报告：先写总体统计，然后随行的到来依次写出各分类的文件列表"""
+
+    def __init__(self, path, task, summary):
+        self._file = open(path, 'w', encoding='utf-8')
+        self._section = _SECTION_RANK[LABEL_TYPES[0]] - 1
+        self._summary = summary
+        self._write_header(task, summary)
+
+    def _write_header(self, task, summary):
+        f = self._file
+        f.write("Task labeling results statistics report\n")
+        f.write("=" * 50 + "\n")
+        f.write(f"Task ID: {task.get('task_id', 'unknown')}\n")
+        f.write(f"Task name: {task.get('task_name', 'unknown')}\n")
+        f.write(f"Generated time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+
+        total_count = summary.total
+        unlabeled_count = summary.unlabeled
+        total_all_files = total_count + unlabeled_count
+
+        f.write("Overall statistics:\n")
+        f.write(f"  Total labeled: {total_count}\n")
+        for label in LABEL_TYPES:
+            f.write(f"  {label}: {summary.counts[label]}\n")
+        f.write(f"  unlabeled: {unlabeled_count}\n")
+        f.write(f"  total files: {total_all_files}\n")
+        for label in LABEL_TYPES:
+            f.write(f"  {label} ratio: {summary.counts[label]/total_count*100:.1f}%\n" if total_count > 0 else f"  {label} ratio: 0%\n")
+        f.write(f"  unlabeled ratio: {unlabeled_count/total_all_files*100:.1f}%\n" if total_all_files > 0 else "  unlabeled ratio: 0%\n\n")
+
+        # 文件大小统计
+        avg_size = summary.labeled_size / total_count if total_count > 0 else 0
+        f.write("File size statistics:\n")
+        f.write(f"  Total size: {summary.labeled_size / 1024 / 1024:.2f} MB\n")
+        f.write(f"  Average size: {avg_size / 1024:.2f} KB\n\n")
+
+    def _open_sections_until(self, rank):
+        """写出rank之前（含rank）还没写过的分类标题，空分类也保留标题"""
+        f = self._file
+        while self._section < rank:
+            self._section += 1
+            label = SECTION_ORDER[self._section]
+            if self._section > 0:
+                f.write("\n")
+            if label is None:
+                f.write(f"Unlabeled file list (total {self._summary.unlabeled} files):\n")
+            else:
+                f.write(f"{label} file list:\n")
+            f.write("-" * 30 + "\n")
+
+    def write(self, row):
+        filename, label, size, _ = row
+        rank = _SECTION_RANK.get(label)
+        if rank is None:
+            return
+        self._open_sections_until(rank)
+        self._file.write(f"  {filename} ({(size or 0)/1024:.1f} KB)\n")
+
+    def close(self):
+        self._open_sections_until(len(SECTION_ORDER) - 1)
+        self._file.close()
+
+
+class ParquetResultWriter:
+    """Parquet列式结果（需要pyarrow），按批写出，包含未标注的文件"""
+
+    def __init__(self, path, batch_size=50000):
+        if pyarrow is None:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)")
+        self._schema = pyarrow.schema([
+            ('filename', pyarrow.string()),
+            ('label', pyarrow.string()),
+            ('file_size', pyarrow.int64()),
+            ('modified_time', pyarrow.timestamp('s')),
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(str(path), self._schema)
+        self._batch_size = batch_size
+        self._columns = tuple([] for _ in ROW_FIELDS)
+
+    def write(self, row):
+        filename, label, size, mtime = row
+        self._columns[0].append(filename)
+        self._columns[1].append(label)
+        self._columns[2].append(size)
+        self._columns[3].append(int(mtime) if mtime is not None else None)
+        if len(self._columns[0]) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self._columns[0]:
+            table = pyarrow.Table.from_arrays([pyarrow.array(col, type=field.type) for col, field
+                                               in zip(self._columns, self._schema)], schema=self._schema)
+            self._writer.write_table(table)
+            for col in self._columns:
+                col.clear()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def write_rows(rows, writers):
+    """一次遍历把每一行交给所有写入器"""
+    try:
+        for row in rows:
+            for writer in writers:
+                writer.write(row)
+    finally:
+        for writer in writers:
+            writer.close()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务索引
+缓存每个任务文件的 id / 名称 / 图片总数 / 已完成数和各标签数量，以及批次索引文件中的任务分组，
+启动和查看批次进度时不必解析任务清单和进度文件
+
+查看批次进度（只读索引文件）:
+    python task_index.py status [--tasks-dir tasks] [--progress-dir progress] [--refresh]
+"""
+
+import os
+import sys
+import json
+import uuid
+import threading
+import argparse
+from pathlib import Path
+from collections import Counter
+
+from task_manifest import open_manifest, find_task_files
+from progress_store import read_progress
+from label_state import LABEL_TYPES
+
+BATCH_FILE_PATTERN = 'batch_*.json'
+NO_BATCH = '(no batch)'
+
+
+def progress_path_for(progress_dir, task_id):
+    """任务进度快照文件路径"""
+    return Path(progress_dir) / f"task_progress_{task_id}.json"
+
+
+def _file_signature(path):
+    """(mtime_ns, size)，文件不存在时为 (0, 0)"""
+    try:
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+    except FileNotFoundError:
+        return [0, 0]
+
+
+def progress_signature(progress_dir, task_id):
+    """进度快照和日志的签名，用于判断缓存的已完成数是否过期"""
+    snapshot_path = progress_path_for(progress_dir, task_id)
+    return _file_signature(snapshot_path) + _file_signature(snapshot_path.with_suffix('.journal'))
+
+
+def label_counts(labeled_files):
+    """{标签: 数量}，包含全部标签类型"""
+    counter = Counter(labeled_files.values())
+    return {label: counter.get(label, 0) for label in LABEL_TYPES}
+
+
+class TaskIndex:
+    """任务索引缓存（保存在进度目录中）
+
+    entries: 任务文件名 -> {task_id, task_name, total_images, completed, counts,
+                            task_signature, progress_signature}
+    batches: 批次索引文件名 -> {batch_id, tasks, total_images, signature}
+
+    可在多个线程中使用（后台 refresh 与标注时的 set_counts / flush），更新和写盘都加锁。
+    """
+
+    def __init__(self, index_path, tasks_dir, progress_dir):
+        self.index_path = Path(index_path)
+        self.tasks_dir = Path(tasks_dir)
+        self.progress_dir = Path(progress_dir)
+        self.entries = {}
+        self.batches = {}
+        self._dirty = set()  # 计数已在内存中更新、尚未写盘的任务文件名
+        self._lock = threading.RLock()
+
+    def load(self):
+        """读取缓存文件（只读这一个小文件，不访问任务和进度文件）"""
+        entries, batches = {}, {}
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                entries = data.get('tasks', {})
+                batches = data.get('batches', {})
+            except Exception as e:
+                print(f"Failed to load task index: {e}")
+        with self._lock:
+            self.entries = entries
+            self.batches = batches
+        return self
+
+    def save(self):
+        """原子写出缓存文件
+
+        临时文件名每次唯一（同一进度目录可能有多个进程、多个线程同时写索引），
+        本进程内的写盘在锁内串行，旧内容不会覆盖新内容。
+        """
+        with self._lock:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_path.with_name(f"{self.index_path.name}.{uuid.uuid4().hex[:12]}.tmp")
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'tasks': self.entries, 'batches': self.batches}, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.index_path)
+            except BaseException:
+                tmp_path.unlink(missing_ok=True)
+                raise
+
+    def filenames(self):
+        """已缓存的任务文件名（排序）"""
+        return sorted(self.entries)
+
+    def refresh(self):
+        """与任务目录同步：只对新增或变化的任务重新读取清单和进度，返回是否有变化
+
+        读取文件时不持锁（在副本上更新），最后在锁内替换，期间标注线程的 set_counts 不被阻塞。
+        """
+        with self._lock:
+            previous = {name: dict(entry) for name, entry in self.entries.items()}
+            previous_batches = dict(self.batches)
+
+        changed = False
+        current = {}
+        for task_path in find_task_files(self.tasks_dir):
+            entry = previous.get(task_path.name)
+            task_signature = _file_signature(task_path)
+
+            if entry is None or entry.get('task_signature') != task_signature:
+                manifest = open_manifest(task_path)
+                try:
+                    meta = manifest.meta
+                    entry = {
+                        'task_id': meta.get('task_id', task_path.stem),
+                        'task_name': meta.get('task_name', task_path.stem),
+                        'total_images': meta.get('total_images', len(manifest)),
+                        'task_signature': task_signature,
+                    }
+                finally:
+                    manifest.close()
+                changed = True
+
+            signature = progress_signature(self.progress_dir, entry['task_id'])
+            if entry.get('progress_signature') != signature:
+                # 只读重放：日志可能正被其他标注者的会话追加，不能截断
+                labeled_files = read_progress(progress_path_for(self.progress_dir, entry['task_id']))
+                self._set_progress(entry, labeled_files, signature)
+                changed = True
+
+            current[task_path.name] = entry
+
+        if set(current) != set(previous):
+            changed = True
+        batches, batches_changed = self._refresh_batches(previous_batches)
+
+        with self._lock:
+            # 刷新期间标注更新、尚未写盘的计数比刚读到的进度文件新
+            for task_filename in self._dirty:
+                entry = self.entries.get(task_filename)
+                if entry is not None and task_filename in current:
+                    current[task_filename]['counts'] = entry.get('counts')
+                    current[task_filename]['completed'] = entry.get('completed')
+            self.entries = current
+            self.batches = batches
+            if changed or batches_changed:
+                self.save()
+        return changed or batches_changed
+
+    def _refresh_batches(self, previous):
+        """同步批次索引文件（只重新读取变化的），返回 (批次表, 是否有变化)"""
+        changed = False
+        current = {}
+        batch_files = sorted(self.tasks_dir.glob(BATCH_FILE_PATTERN)) if self.tasks_dir.exists() else []
+        for batch_path in batch_files:
+            batch = previous.get(batch_path.name)
+            signature = _file_signature(batch_path)
+            if batch is None or batch.get('signature') != signature:
+                try:
+                    with open(batch_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except Exception as e:
+                    print(f"Failed to read batch index {batch_path.name}: {e}")
+                    continue
+                batch = {
+                    'batch_id': data.get('batch_id', batch_path.stem),
+                    'tasks': data.get('tasks', []),
+                    'total_images': data.get('total_images', 0),
+                    'signature': signature,
+                }
+                changed = True
+            current[batch_path.name] = batch
+
+        if set(current) != set(previous):
+            changed = True
+        return current, changed
+
+    def _set_progress(self, entry, labeled_files, signature):
+        entry['counts'] = label_counts(labeled_files)
+        entry['completed'] = len(labeled_files)
+        entry['progress_signature'] = signature
+
+    def set_counts(self, task_filename, counts):
+        """标注时在内存中更新某任务的各标签数量（O(1)，由 flush 写盘）"""
+        with self._lock:
+            entry = self.entries.get(task_filename)
+            if entry is None:
+                return
+            entry['counts'] = dict(counts)
+            entry['completed'] = sum(counts.values())
+            self._dirty.add(task_filename)
+
+    def flush(self):
+        """任务进度落盘后，把内存中更新过的计数连同进度文件签名一起写盘，返回是否写盘"""
+        with self._lock:
+            if not self._dirty:
+                return False
+            for task_filename in self._dirty:
+                entry = self.entries.get(task_filename)
+                if entry is not None:
+                    entry['progress_signature'] = progress_signature(self.progress_dir, entry['task_id'])
+            self._dirty.clear()
+            self.save()
+            return True
+
+    def is_stale(self, task_filename):
+        """缓存的计数是否落后于磁盘上的进度文件（只stat，不读取文件）"""
+        entry = self.entries.get(task_filename)
+        if entry is None:
+            return True
+        return entry.get('progress_signature') != progress_signature(self.progress_dir, entry['task_id'])
+
+    def batch_groups(self):
+        """按批次分组：[(批次id, [任务文件名, ...]), ...]，不属于任何批次的任务归入 NO_BATCH"""
+        groups = []
+        grouped = set()
+        for batch_name in sorted(self.batches):
+            batch = self.batches[batch_name]
+            tasks = [name for name in batch['tasks'] if name in self.entries]
+            grouped.update(tasks)
+            groups.append((batch['batch_id'], tasks))
+        ungrouped = [name for name in self.filenames() if name not in grouped]
+        if ungrouped:
+            groups.append((NO_BATCH, ungrouped))
+        return groups
+
+    def summary(self, task_filenames):
+        """若干任务的合计：{total_images, completed, highQuality, lowQuality, skip}"""
+        totals = {'total_images': 0, 'completed': 0}
+        totals.update({label: 0 for label in LABEL_TYPES})
+        for task_filename in task_filenames:
+            entry = self.entries.get(task_filename, {})
+            totals['total_images'] += entry.get('total_images', 0)
+            totals['completed'] += entry.get('completed', 0)
+            for label in LABEL_TYPES:
+                totals[label] += entry.get('counts', {}).get(label, 0)
+        return totals
+
+    def display_name(self, task_filename):
+        """下拉框中显示的名称：文件名 + 进度"""
+        entry = self.entries.get(task_filename)
+        if not entry:
+            return task_filename
+        return f"{task_filename}  ({entry.get('completed', 0)}/{entry.get('total_images', 0)})"
+
+
+def format_status(index, check_stale=False):
+    """批次进度文本表（只使用索引中的数据）"""
+    header = f"{'task':36s} {'done':>13s} {'%':>6s} " + " ".join(f"{label:>11s}" for label in LABEL_TYPES)
+
+    def row(name, totals, stale=False):
+        total = totals['total_images']
+        percent = totals['completed'] / total * 100 if total else 0.0
+        done = f"{totals['completed']}/{total}"
+        counts = " ".join(f"{totals[label]:>11d}" for label in LABEL_TYPES)
+        return f"{name:36s} {done:>13s} {percent:5.1f}% {counts}" + ("  *" if stale else "")
+
+    lines = []
+    any_stale = False
+    for batch_id, task_filenames in index.batch_groups():
+        lines.append(f"Batch {batch_id}")
+        lines.append(header)
+        for task_filename in task_filenames:
+            stale = check_stale and index.is_stale(task_filename)
+            any_stale = any_stale or stale
+            lines.append(row(task_filename, index.summary([task_filename]), stale))
+        lines.append(row("total", index.summary(task_filenames)))
+        lines.append("")
+    if not lines:
+        lines.append("No tasks in index")
+    if any_stale:
+        lines.append("* progress file changed since the index was updated (run with --refresh)")
+    return "\n".join(lines).rstrip("\n")
+
+
+def main(argv=None):
+    """命令行入口"""
+    project_dir = Path(__file__).parent
+    parser = argparse.ArgumentParser(description="Task index tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    status_parser = subparsers.add_parser('status', help="Show per-task and per-batch progress from the index")
+    status_parser.add_argument('--tasks-dir', default=str(project_dir / "tasks"))
+    status_parser.add_argument('--progress-dir', default=str(project_dir / "progress"))
+    status_parser.add_argument('--refresh', action='store_true',
+                               help="Re-read task and progress files that changed since the index was built")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        progress_dir = Path(args.progress_dir)
+        index = TaskIndex(progress_dir / "task_index.json", args.tasks_dir, progress_dir).load()
+        if args.refresh or not index.entries:
+            index.refresh()
+        print(format_status(index, check_stale=not args.refresh))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
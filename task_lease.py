@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务租约
+多人在共享目录上协作时，每个任务同一时间只由一个标注者写进度：
+租约文件与进度快照同名、后缀为 .lease，用 O_CREAT | O_EXCL 原子创建，定期续期，过期后可被接管
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import getpass
+from pathlib import Path
+
+
+def default_annotator():
+    """标注者名称：环境变量 LABELER_ANNOTATOR，默认为 用户名@主机名"""
+    name = os.environ.get('LABELER_ANNOTATOR')
+    if name:
+        return name
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = 'unknown'
+    return f"{user}@{socket.gethostname()}"
+
+
+class LeaseHeldError(Exception):
+    """任务租约被其他标注者持有"""
+
+    def __init__(self, holder):
+        self.holder = holder
+        super().__init__(f"Task is leased by {holder.get('annotator', 'unknown')} "
+                         f"until {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(holder.get('expires', 0)))}")
+
+
+class TaskLease:
+    """单个任务的租约
+
+    租约文件内容：{annotator, host, pid, token, acquired, expires}
+    token 区分同一标注者的不同实例，续期和释放前都会检查租约仍是自己的。
+    """
+
+    def __init__(self, lease_path, annotator=None, ttl=600):
+        self.lease_path = Path(lease_path)
+        self.annotator = annotator or default_annotator()
+        self.ttl = ttl  # 秒，超过此时间未续期的租约可被接管
+        self.token = uuid.uuid4().hex
+        self.held = False
+
+    def read(self):
+        """读取当前租约，不存在或无法解析时返回None"""
+        try:
+            with open(self.lease_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _payload(self, acquired=None):
+        now = time.time()
+        return {
+            'annotator': self.annotator,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'token': self.token,
+            'acquired': acquired or now,
+            'expires': now + self.ttl,
+        }
+
+    def _create(self):
+        """原子创建租约文件，已存在时返回False"""
+        self.lease_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(self.lease_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._payload(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+
+    @staticmethod
+    def is_stale(holder):
+        """租约已过期，或持有者是本机上已退出的进程"""
+        if holder is None:
+            return True
+        if holder.get('expires', 0) < time.time():
+            return True
+        if holder.get('host') == socket.gethostname() and holder.get('pid'):
+            try:
+                os.kill(holder['pid'], 0)
+            except ProcessLookupError:
+                return True
+            except OSError:
+                pass
+        return False
+
+    def _unparsable_holder(self):
+        """租约文件存在但无法解析时：最近 ttl 秒内修改过则视为正在创建中、仍被持有，
+        返回占位的持有者信息；否则返回None（文件不存在或已过期，可接管）"""
+        try:
+            mtime = os.stat(self.lease_path).st_mtime
+        except FileNotFoundError:
+            return None
+        if mtime + self.ttl < time.time():
+            return None
+        return {'annotator': 'unknown', 'expires': mtime + self.ttl}
+
+    def _take_over(self):
+        """把旧租约改名移走后重新创建；多个实例同时接管时只有一个能改名成功"""
+        stale_path = self.lease_path.with_name(f"{self.lease_path.name}.{self.token}.stale")
+        try:
+            os.rename(self.lease_path, stale_path)
+        except FileNotFoundError:
+            pass
+        else:
+            stale_path.unlink(missing_ok=True)
+        return self._create()
+
+    def acquire(self, force=False):
+        """获取租约；被其他人持有且未过期时抛出 LeaseHeldError（force=True 时强制接管）"""
+        if self._create():
+            self.held = True
+            return self
+
+        holder = self.read()
+        if holder and holder.get('token') == self.token:
+            self.held = True
+            return self
+        if holder is None and not force:
+            # 其他实例刚以 O_EXCL 创建、还没写完内容的租约同样是被持有的
+            pending = self._unparsable_holder()
+            if pending is not None:
+                raise LeaseHeldError(pending)
+        if (force or self.is_stale(holder)) and self._take_over():
+            self.held = True
+            return self
+        raise LeaseHeldError(self.read() or holder or {})
+
+    def renew(self):
+        """续期；租约已被他人接管时抛出 LeaseHeldError"""
+        holder = self.read()
+        if not holder or holder.get('token') != self.token:
+            self.held = False
+            raise LeaseHeldError(holder or {})
+
+        tmp_path = self.lease_path.with_name(f"{self.lease_path.name}.{self.token}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._payload(holder.get('acquired')), f)
+        os.replace(tmp_path, self.lease_path)
+
+    def release(self):
+        """释放租约（只删除自己的租约）"""
+        if not self.held:
+            return
+        self.held = False
+        holder = self.read()
+        if holder and holder.get('token') == self.token:
+            self.lease_path.unlink(missing_ok=True)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务清单读写
+除原有的 JSON 任务文件外，支持紧凑的二进制清单 (.tman)：
+打开时只读文件头和元数据（常数时间），文件名通过 mmap 和偏移索引按需读取
+
+.tman 文件布局（小端）：
+    magic b'TMAN' | version u32 | meta_len u32 | count u64
+    meta JSON（meta_len 字节，任务的 task_id / task_name 等字段，不含 images）
+    偏移索引 (count + 1) x u64，相对于字符串区起点
+    字符串区：UTF-8 文件名依次相连
+"""
+
+import json
+import mmap
+import struct
+from pathlib import Path
+
+MANIFEST_MAGIC = b'TMAN'
+MANIFEST_VERSION = 1
+BINARY_SUFFIX = '.tman'
+JSON_SUFFIX = '.json'
+TASK_FILE_PATTERNS = ('task_*' + JSON_SUFFIX, 'task_*' + BINARY_SUFFIX)
+
+_HEADER = struct.Struct('<4sIIQ')
+_OFFSET = struct.Struct('<Q')
+
+
+class JsonManifest:
+    """原有的JSON任务文件（一次性解析）"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self._names = data.pop('images', [])
+        self.meta = data
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getitem__(self, index):
+        return self._names[index]
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def names(self, start=0, stop=None):
+        return self._names[start:stop]
+
+    def close(self):
+        pass
+
+
+class BinaryManifest:
+    """二进制任务清单（mmap，按需读取文件名）"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Empty task manifest: {self.path}")
+
+        magic, version, meta_len, count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MANIFEST_MAGIC:
+            self.close()
+            raise ValueError(f"Not a task manifest: {self.path}")
+        if version != MANIFEST_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported task manifest version {version}: {self.path}")
+
+        meta_start = _HEADER.size
+        self.meta = json.loads(self._mmap[meta_start:meta_start + meta_len].decode('utf-8'))
+        self._count = count
+        self._index_start = meta_start + meta_len
+        self._blob_start = self._index_start + (count + 1) * _OFFSET.size
+
+    def __len__(self):
+        return self._count
+
+    def _offset(self, index):
+        return _OFFSET.unpack_from(self._mmap, self._index_start + index * _OFFSET.size)[0]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        start = self._blob_start + self._offset(index)
+        end = self._blob_start + self._offset(index + 1)
+        return self._mmap[start:end].decode('utf-8')
+
+    def names(self, start=0, stop=None):
+        """读取一段文件名 [start, stop)"""
+        stop = self._count if stop is None else min(stop, self._count)
+        if start >= stop:
+            return []
+        offsets = struct.unpack_from(f'<{stop - start + 1}Q', self._mmap,
+                                     self._index_start + start * _OFFSET.size)
+        blob = self._mmap[self._blob_start + offsets[0]:self._blob_start + offsets[-1]]
+        base = offsets[0]
+        return [blob[a - base:b - base].decode('utf-8') for a, b in zip(offsets, offsets[1:])]
+
+    def __iter__(self, page_size=4096):
+        for start in range(0, self._count, page_size):
+            yield from self.names(start, start + page_size)
+
+    def close(self):
+        if getattr(self, '_mmap', None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+
+def open_manifest(path):
+    """打开任务清单（根据后缀选择JSON或二进制格式）"""
+    path = Path(path)
+    if path.suffix == BINARY_SUFFIX:
+        return BinaryManifest(path)
+    return JsonManifest(path)
+
+
+def write_manifest(path, meta, names):
+    """写出任务清单：.tman 后缀写二进制格式，否则写原有的JSON格式"""
+    path = Path(path)
+    if path.suffix != BINARY_SUFFIX:
+        task_data = dict(meta)
+        task_data['images'] = list(names)
+        # 保持原有的字段顺序：images 在 total_images 之后
+        ordered = {}
+        for key, value in task_data.items():
+            if key != 'images':
+                ordered[key] = value
+            if key == 'total_images':
+                ordered['images'] = task_data['images']
+        ordered.setdefault('images', task_data['images'])
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(ordered, f, ensure_ascii=False, indent=2)
+        return
+
+    encoded = [name.encode('utf-8') for name in names]
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MANIFEST_MAGIC, MANIFEST_VERSION, len(meta_bytes), len(encoded)))
+        f.write(meta_bytes)
+        f.write(struct.pack(f'<{len(offsets)}Q', *offsets))
+        f.writelines(encoded)
+    tmp_path.replace(path)
+
+
+def find_task_files(tasks_dir):
+    """列出目录中的任务文件（JSON和二进制），按文件名排序"""
+    tasks_dir = Path(tasks_dir)
+    if not tasks_dir.exists():
+        return []
+    files = []
+    for pattern in TASK_FILE_PATTERNS:
+        files.extend(tasks_dir.glob(pattern))
+    return sorted(files)
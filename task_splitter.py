@@ -3,26 +3,211 @@
 """
 任务分割工具
 将图片分割成多个任务包，用于多人协作标注
+
+无界面服务器上可以直接用命令行：
+    python task_splitter.py split --images-dir images --task-size 10000 [--seed 42 | --no-shuffle]
+    python task_splitter.py preview --images-dir images --task-size 10000 [--page 0]
+加 --group-duplicates 时按感知哈希索引（image_hash.py build）把近似重复的图片分到同一个任务
 """
 
 import os
+import sys
 import json
+import heapq
 import shutil
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+import hashlib
+import argparse
+import tempfile
+from itertools import islice
 from pathlib import Path
 from datetime import datetime
 import random
 
+from task_manifest import write_manifest, JSON_SUFFIX, BINARY_SUFFIX
+
+try:
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog
+except ImportError:
+    # 无界面环境只能使用命令行
+    tk = None
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.jpe', '.png', '.bmp', '.gif', '.tiff'}
+
+# 外部排序时每块在内存中排序的文件名数量
+SORT_CHUNK_SIZE = 500000
+
+
+def iter_image_names(images_dir):
+    """用 os.scandir 流式列出目录中的图片文件名（不排序）"""
+    with os.scandir(images_dir) as entries:
+        for entry in entries:
+            if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS and entry.is_file():
+                yield entry.name
+
+
+def shuffle_key(seed):
+    """由种子得到确定性的打乱键：同一种子下每个文件名的位置固定，与输入顺序无关"""
+    salt = str(seed).encode('utf-8')[:64]
+    return lambda name: hashlib.blake2b(name.encode('utf-8'), key=salt, digest_size=8).hexdigest()
+
+
+def external_sort(names, key=None, chunk_size=SORT_CHUNK_SIZE):
+    """对文件名流排序（key为None时按文件名排序）
+
+    超过chunk_size时每块排序后写入临时文件，再逐行归并，内存占用不随总数增长。
+    """
+    chunk = []
+    chunk_paths = []
+    tmp_dir = None
+
+    def spill():
+        nonlocal tmp_dir
+        if tmp_dir is None:
+            tmp_dir = tempfile.mkdtemp(prefix="task_splitter_")
+        chunk.sort()
+        chunk_path = os.path.join(tmp_dir, f"chunk_{len(chunk_paths):05d}.txt")
+        with open(chunk_path, 'w', encoding='utf-8') as f:
+            f.writelines(f"{k}\t{name}\n" for k, name in chunk)
+        chunk_paths.append(chunk_path)
+        chunk.clear()
+
+    try:
+        for name in names:
+            chunk.append((key(name) if key else name, name))
+            if len(chunk) >= chunk_size:
+                spill()
+
+        if not chunk_paths:
+            chunk.sort()
+            for _, name in chunk:
+                yield name
+            return
+
+        if chunk:
+            spill()
+        files = [open(path, 'r', encoding='utf-8') for path in chunk_paths]
+        try:
+            for line in heapq.merge(*files):
+                yield line.rstrip('\n').split('\t', 1)[1]
+        finally:
+            for f in files:
+                f.close()
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def ordered_names(names, shuffle=True, seed=None, group_of=None):
+    """按任务分配顺序生成文件名：打乱时按种子确定的顺序，否则按文件名排序
+
+    group_of 为 {文件名: 组代表文件名} 时，同组的近似重复图片连续排列在组代表的位置上。
+    """
+    key = shuffle_key(seed) if shuffle else None
+    if group_of:
+        base = key or (lambda name: name)
+        return external_sort(names, lambda name: base(group_of.get(name, name)) + '\x01' + name)
+    return external_sort(names, key)
+
+
+def split_summary(total_images, task_size):
+    """任务分割的统计信息"""
+    task_count = (total_images + task_size - 1) // task_size if task_size > 0 else 0
+    last_task_size = total_images - (task_count - 1) * task_size if task_count else 0
+    return {
+        'total_images': total_images,
+        'task_size': task_size,
+        'task_count': task_count,
+        'last_task_size': last_task_size,
+    }
+
+
+def preview_page(names, task_size, page, page_size=50):
+    """预览的一页：返回 [(任务序号, 任务内序号, 文件名), ...]"""
+    listing = ((i // task_size + 1, i % task_size + 1, name) for i, name in enumerate(names))
+    return list(islice(listing, page * page_size, (page + 1) * page_size))
+
+
+def write_tasks(names, tasks_dir, task_size, shuffled, seed=None, timestamp=None, binary=False,
+                group_of=None):
+    """按顺序把文件名流写成任务文件，每满task_size张写出一个文件
+
+    内存中只保留一个任务的文件名。binary=True 时写紧凑的二进制清单 (.tman)。
+    group_of 为 {文件名: 组代表文件名} 时不拆开同一组，任务可能略多于task_size张。
+    返回 (任务文件名列表, 图片总数, 批次索引文件名)。
+    """
+    if task_size <= 0:
+        raise ValueError("Task size must be greater than 0")
+    tasks_dir = Path(tasks_dir)
+    tasks_dir.mkdir(parents=True, exist_ok=True)
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    created_tasks = []
+    total_images = 0
+
+    def flush(task_images):
+        i = len(created_tasks)
+        task_meta = {
+            "task_id": f"task_{timestamp}_{i+1:03d}",
+            "task_name": f"Task {i+1}",
+            "created_time": datetime.now().isoformat(),
+            "total_images": len(task_images),
+            "status": "pending",  # pending, in_progress, completed
+            "progress": {
+                "highQuality": 0,
+                "lowQuality": 0,
+                "skip": 0,
+                "total": len(task_images)
+            }
+        }
+        task_filename = f"task_{timestamp}_{i+1:03d}{BINARY_SUFFIX if binary else JSON_SUFFIX}"
+        write_manifest(tasks_dir / task_filename, task_meta, task_images)
+        created_tasks.append(task_filename)
+
+    task_images = []
+    last_group = None
+    for name in names:
+        group = group_of.get(name, name) if group_of else name
+        if len(task_images) >= task_size and group != last_group:
+            flush(task_images)
+            task_images = []
+        task_images.append(name)
+        total_images += 1
+        last_group = group
+    if task_images:
+        flush(task_images)
+
+    # 生成任务索引文件
+    index_data = {
+        "batch_id": timestamp,
+        "created_time": datetime.now().isoformat(),
+        "total_tasks": len(created_tasks),
+        "total_images": total_images,
+        "task_size": task_size,
+        "shuffled": shuffled,
+        "tasks": created_tasks
+    }
+    if shuffled:
+        index_data["seed"] = seed
+    if group_of:
+        index_data["near_duplicate_images"] = len(group_of)
+
+    index_filename = f"batch_{timestamp}.json"
+    with open(tasks_dir / index_filename, 'w', encoding='utf-8') as f:
+        json.dump(index_data, f, ensure_ascii=False, indent=2)
+
+    return created_tasks, total_images, index_filename
+
+
 class TaskSplitter:
-    def __init__(self, root):
+    def __init__(self, root, project_dir=None):
         self.root = root
         self.root.title("Task splitter")
         self.root.geometry("800x600")
         self.root.configure(bg='#f0f0f0')
         
-        # 设置项目路径
-        self.project_dir = Path(__file__).parent
+        # 设置项目路径（默认为程序所在目录；基准测试等可指定其他目录）
+        self.project_dir = Path(project_dir) if project_dir else Path(__file__).parent
         self.images_dir = self.project_dir / "images"  # 默认图片目录
         self.tasks_dir = self.project_dir / "tasks"
         
@@ -33,6 +218,13 @@ class TaskSplitter:
         self.image_files = []
         self.task_size = tk.IntVar(value=50)  # 默认每个任务50张图片
         self.shuffle_images = tk.BooleanVar(value=True)  # 默认随机打乱
+        self.shuffle_seed = tk.IntVar(value=random.randrange(1000000))  # 打乱种子，预览与生成一致
+        self.preview_page_index = 0
+        self.preview_page_size = 100
+        self.binary_manifest = tk.BooleanVar(value=False)  # 生成二进制任务清单 (.tman)
+        self.group_duplicates = tk.BooleanVar(value=False)  # 近似重复的图片分到同一个任务
+        self.hash_index_path = self.project_dir / "image_hashes.npz"
+        self._duplicate_groups = None  # (索引文件修改时间, 分组)
         
         # 创建界面
         self.create_widgets()
@@ -97,6 +289,21 @@ class TaskSplitter:
                                       variable=self.shuffle_images)
         shuffle_check.grid(row=1, column=0, columnspan=2, pady=(5, 0), sticky=tk.W)
         
+        # 打乱种子
+        ttk.Label(config_frame, text="Shuffle seed:").grid(row=2, column=0, pady=(5, 0), sticky=tk.W)
+        seed_entry = ttk.Entry(config_frame, width=12, textvariable=self.shuffle_seed)
+        seed_entry.grid(row=2, column=1, padx=(10, 0), pady=(5, 0), sticky=tk.W)
+        
+        # 任务文件格式
+        binary_check = ttk.Checkbutton(config_frame, text="Compact binary task files (.tman, lazy loading)", 
+                                     variable=self.binary_manifest)
+        binary_check.grid(row=3, column=0, columnspan=2, pady=(5, 0), sticky=tk.W)
+        
+        # 近似重复分组（需要先运行 image_hash.py build）
+        group_check = ttk.Checkbutton(config_frame, text="Keep near-duplicate images in the same task (image_hashes.npz)", 
+                                    variable=self.group_duplicates)
+        group_check.grid(row=4, column=0, columnspan=2, pady=(5, 0), sticky=tk.W)
+        
         # 任务预览
         preview_frame = ttk.LabelFrame(main_frame, text="Task preview", padding="10")
         preview_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
@@ -111,6 +318,14 @@ class TaskSplitter:
         self.preview_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         preview_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         
+        # 预览翻页
+        page_frame = ttk.Frame(preview_frame)
+        page_frame.grid(row=1, column=0, columnspan=2, pady=(5, 0))
+        ttk.Button(page_frame, text="◀ Prev page", command=lambda: self.show_preview_page(-1)).grid(row=0, column=0, padx=5)
+        self.page_label = ttk.Label(page_frame, text="", font=('Arial', 9))
+        self.page_label.grid(row=0, column=1, padx=5)
+        ttk.Button(page_frame, text="Next page ▶", command=lambda: self.show_preview_page(1)).grid(row=0, column=2, padx=5)
+        
         # 按钮区域
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=4, column=0, columnspan=2, pady=20)
@@ -140,15 +355,8 @@ class TaskSplitter:
             messagebox.showerror("Error", f"Image directory does not exist: {self.images_dir}")
             return
         
-        # 获取所有图片文件
-        image_extensions = {'.jpg', '.jpeg', '.jpe', '.png', '.bmp', '.gif', '.tiff'}
-        self.image_files = []
-        
-        for file_path in self.images_dir.iterdir():
-            if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-                self.image_files.append(file_path)
-        
-        self.image_files.sort()  # 按文件名排序
+        # 获取所有图片文件名（一次scandir）
+        self.image_files = sorted(iter_image_names(self.images_dir))  # 按文件名排序
         self.update_stats_display()
         self.update_status(f"Scan completed, found {len(self.image_files)} images")
     
@@ -179,50 +387,69 @@ class TaskSplitter:
         
         self.stats_label.configure(text=stats_text)
     
+    def duplicate_groups(self):
+        """近似重复分组（未勾选时为None；哈希索引不变时复用上次的结果）"""
+        if not self.group_duplicates.get():
+            return None
+        if not self.hash_index_path.exists():
+            raise FileNotFoundError(f"{self.hash_index_path.name} not found, run: python image_hash.py build")
+        mtime = self.hash_index_path.stat().st_mtime_ns
+        if self._duplicate_groups is None or self._duplicate_groups[0] != mtime:
+            from image_hash import load_duplicate_groups
+            self._duplicate_groups = (mtime, load_duplicate_groups(self.hash_index_path))
+        return self._duplicate_groups[1]
+    
+    def ordered_image_names(self):
+        """按当前设置得到任务分配顺序的文件名（与生成任务时完全一致）"""
+        return ordered_names(self.image_files, self.shuffle_images.get(), self.shuffle_seed.get(),
+                             self.duplicate_groups())
+    
     def preview_tasks(self):
-        """预览任务分割"""
+        """预览任务分割（只显示统计信息和分页的文件列表）"""
         if not self.image_files:
             messagebox.showwarning("Warning", "No image files to split")
             return
         
-        # 清空预览
-        self.preview_text.delete(1.0, tk.END)
-        
-        # 准备图片列表
-        image_list = self.image_files.copy()
-        if self.shuffle_images.get():
-            random.shuffle(image_list)
-        
         # 计算任务数量
         task_size = self.task_size.get()
         if task_size <= 0:
             messagebox.showerror("Error", "Task size must be greater than 0")
             return
         
-        task_count = (len(image_list) + task_size - 1) // task_size
+        self.preview_page_index = 0
+        self.show_preview_page(0)
+        self.update_status("Preview generated")
+    
+    def show_preview_page(self, step):
+        """显示预览的某一页"""
+        if not self.image_files or self.task_size.get() <= 0:
+            return
+        
+        task_size = self.task_size.get()
+        summary = split_summary(len(self.image_files), task_size)
+        page_count = max(1, (len(self.image_files) + self.preview_page_size - 1) // self.preview_page_size)
+        self.preview_page_index = min(max(self.preview_page_index + step, 0), page_count - 1)
         
         # 生成预览
         preview_text = f"Task split preview:\n"
-        preview_text += f"Total image count: {len(image_list)}\n"
+        preview_text += f"Total image count: {summary['total_images']}\n"
         preview_text += f"Image count per task: {task_size}\n"
-        preview_text += f"Task file count: {task_count}\n"
-        preview_text += f"Shuffle: {'Yes' if self.shuffle_images.get() else 'No'}\n"
+        preview_text += f"Task file count: {summary['task_count']}\n"
+        preview_text += f"Last task image count: {summary['last_task_size']}\n"
+        preview_text += f"Shuffle: {'Yes (seed ' + str(self.shuffle_seed.get()) + ')' if self.shuffle_images.get() else 'No'}\n"
         preview_text += "=" * 50 + "\n\n"
         
-        for i in range(task_count):
-            start_idx = i * task_size
-            end_idx = min(start_idx + task_size, len(image_list))
-            task_images = image_list[start_idx:end_idx]
-            
-            preview_text += f"Task {i+1}:\n"
-            preview_text += f"  Image count: {len(task_images)}\n"
-            preview_text += f"  Image list:\n"
-            for j, img_path in enumerate(task_images, 1):
-                preview_text += f"    {j:2d}. {img_path.name}\n"
-            preview_text += "\n"
+        try:
+            names = self.ordered_image_names()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to group near-duplicates: {e}")
+            return
+        rows = preview_page(names, task_size, self.preview_page_index, self.preview_page_size)
+        preview_text += "".join(f"  Task {task_no:3d}  #{index:<6d} {name}\n" for task_no, index, name in rows)
         
+        self.preview_text.delete(1.0, tk.END)
         self.preview_text.insert(1.0, preview_text)
-        self.update_status("Preview generated")
+        self.page_label.configure(text=f"Page {self.preview_page_index + 1} / {page_count}")
     
     def generate_tasks(self):
         """生成任务包"""
@@ -231,79 +458,29 @@ class TaskSplitter:
             return
         
         try:
-            # 准备图片列表
-            image_list = self.image_files.copy()
-            if self.shuffle_images.get():
-                random.shuffle(image_list)
-            
             # 计算任务数量
             task_size = self.task_size.get()
             if task_size <= 0:
                 messagebox.showerror("Error", "Task size must be greater than 0")
                 return
             
-            task_count = (len(image_list) + task_size - 1) // task_size
-            
-            # 生成时间戳
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # 创建任务包
-            created_tasks = []
-            for i in range(task_count):
-                start_idx = i * task_size
-                end_idx = min(start_idx + task_size, len(image_list))
-                task_images = image_list[start_idx:end_idx]
-                
-                # 创建任务数据
-                task_data = {
-                    "task_id": f"task_{timestamp}_{i+1:03d}",
-                    "task_name": f"Task {i+1}",
-                    "created_time": datetime.now().isoformat(),
-                    "total_images": len(task_images),
-                    "images": [img.name for img in task_images],
-                    "status": "pending",  # pending, in_progress, completed
-                    "progress": {
-                        "highQuality": 0,
-                        "lowQuality": 0,
-                        "skip": 0,
-                        "total": len(task_images)
-                    }
-                }
-                
-                # 保存任务文件
-                task_filename = f"task_{timestamp}_{i+1:03d}.json"
-                task_path = self.tasks_dir / task_filename
-                
-                with open(task_path, 'w', encoding='utf-8') as f:
-                    json.dump(task_data, f, ensure_ascii=False, indent=2)
-                
-                created_tasks.append(task_filename)
-            
-            # 生成任务索引文件
-            index_data = {
-                "batch_id": timestamp,
-                "created_time": datetime.now().isoformat(),
-                "total_tasks": task_count,
-                "total_images": len(image_list),
-                "task_size": task_size,
-                "shuffled": self.shuffle_images.get(),
-                "tasks": created_tasks
-            }
-            
-            index_filename = f"batch_{timestamp}.json"
-            index_path = self.tasks_dir / index_filename
-            
-            with open(index_path, 'w', encoding='utf-8') as f:
-                json.dump(index_data, f, ensure_ascii=False, indent=2)
+            # 按顺序逐个写出任务文件和任务索引文件
+            shuffled = self.shuffle_images.get()
+            group_of = self.duplicate_groups()
+            created_tasks, total_images, index_filename = write_tasks(
+                ordered_names(self.image_files, shuffled, self.shuffle_seed.get(), group_of),
+                self.tasks_dir, task_size, shuffled, self.shuffle_seed.get(),
+                binary=self.binary_manifest.get(), group_of=group_of)
+            task_count = len(created_tasks)
             
             messagebox.showinfo("Success", 
                               f"Generated {task_count} task files:\n"
                               f"• Task files: {len(created_tasks)} files\n"
                               f"• Index file: {index_filename}\n"
-                              f"• Total images: {len(image_list)}\n"
+                              f"• Total images: {total_images}\n"
                               f"• Saved to: {self.tasks_dir}")
             
-            self.update_status(f"Generated {task_count} task files, total {len(image_list)} images")
+            self.update_status(f"Generated {task_count} task files, total {total_images} images")
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to generate task files: {e}")
@@ -314,11 +491,12 @@ class TaskSplitter:
             return
         
         try:
-            # 删除所有JSON文件
+            # 删除所有任务文件（JSON和二进制清单）
             deleted_count = 0
-            for file_path in self.tasks_dir.glob("*.json"):
-                file_path.unlink()
-                deleted_count += 1
+            for pattern in ("*" + JSON_SUFFIX, "*" + BINARY_SUFFIX):
+                for file_path in self.tasks_dir.glob(pattern):
+                    file_path.unlink()
+                    deleted_count += 1
             
             messagebox.showinfo("Success", f"Cleaned {deleted_count} task files")
             self.update_status(f"Cleaned {deleted_count} task files")
@@ -330,8 +508,78 @@ class TaskSplitter:
         """更新状态栏"""
         self.status_label.configure(text=message)
 
+def run_cli(argv):
+    """无界面命令行：split 生成任务文件，preview 显示统计和分页列表"""
+    project_dir = Path(__file__).parent
+    parser = argparse.ArgumentParser(description="Split images into labeling tasks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('split', 'preview'):
+        sub = subparsers.add_parser(name)
+        sub.add_argument('--images-dir', default=str(project_dir / "images"))
+        sub.add_argument('--task-size', type=int, default=50)
+        sub.add_argument('--no-shuffle', action='store_true', help="Keep filename order")
+        sub.add_argument('--seed', type=int, default=None, help="Shuffle seed (random if omitted)")
+        sub.add_argument('--group-duplicates', action='store_true',
+                         help="Keep near-duplicate images in the same task (needs a hash index)")
+        sub.add_argument('--hash-index', default=str(project_dir / "image_hashes.npz"),
+                         help="Index written by: python image_hash.py build")
+        sub.add_argument('--radius', type=int, default=None, help="Max Hamming distance for near-duplicates")
+        if name == 'split':
+            sub.add_argument('--tasks-dir', default=str(project_dir / "tasks"))
+            sub.add_argument('--format', choices=('json', 'binary'), default='json',
+                             help="Task file format: json (default) or compact binary .tman")
+        else:
+            sub.add_argument('--page', type=int, default=0)
+            sub.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    if args.task_size <= 0:
+        parser.error("Task size must be greater than 0")
+    if not os.path.isdir(args.images_dir):
+        parser.error(f"Image directory does not exist: {args.images_dir}")
+
+    shuffle = not args.no_shuffle
+    seed = args.seed if args.seed is not None else random.randrange(1000000)
+    group_of = None
+    if args.group_duplicates:
+        from image_hash import load_duplicate_groups, DEFAULT_RADIUS
+        if not os.path.exists(args.hash_index):
+            parser.error(f"Hash index does not exist: {args.hash_index} (run: python image_hash.py build)")
+        group_of = load_duplicate_groups(args.hash_index, radius=args.radius if args.radius is not None
+                                         else DEFAULT_RADIUS)
+        print(f"Near-duplicate images: {len(group_of)} in {len(set(group_of.values()))} groups")
+    names = ordered_names(iter_image_names(args.images_dir), shuffle, seed, group_of)
+
+    if args.command == 'split':
+        created_tasks, total_images, index_filename = write_tasks(
+            names, args.tasks_dir, args.task_size, shuffle, seed, binary=args.format == 'binary',
+            group_of=group_of)
+        print(f"Generated {len(created_tasks)} task files, total {total_images} images")
+        print(f"Index file: {index_filename} (saved to {args.tasks_dir})")
+        if shuffle:
+            print(f"Shuffle seed: {seed}")
+    else:
+        total_images = sum(1 for _ in iter_image_names(args.images_dir))
+        summary = split_summary(total_images, args.task_size)
+        print(f"Total image count: {summary['total_images']}")
+        print(f"Image count per task: {summary['task_size']}")
+        print(f"Task file count: {summary['task_count']}")
+        print(f"Last task image count: {summary['last_task_size']}")
+        print(f"Shuffle: {'Yes (seed ' + str(seed) + ')' if shuffle else 'No'}")
+        print("=" * 50)
+        for task_no, index, name in preview_page(names, args.task_size, args.page, args.page_size):
+            print(f"  Task {task_no:3d}  #{index:<6d} {name}")
+
+
 def main():
     """主函数"""
+    if len(sys.argv) > 1:
+        run_cli(sys.argv[1:])
+        return
+    
+    if tk is None:
+        sys.exit("tkinter is not available; use the command line: python task_splitter.py split --help")
+    
     root = tk.Tk()
     
     # 设置样式
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""测试公共设置：把项目根目录和 benchmarks（合成数据）加入导入路径，提供小型项目目录"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import task_splitter
+from synthetic import make_corpus
+
+
+@pytest.fixture
+def project(tmp_path):
+    """含12张小图片和一个任务文件的项目目录，返回 (项目目录, 任务文件名)"""
+    make_corpus(tmp_path / "images", 12, 64, 48, distinct=2)
+    task_splitter.run_cli(['split', '--images-dir', str(tmp_path / "images"), '--tasks-dir', str(tmp_path / "tasks"),
+                           '--task-size', '12', '--no-shuffle'])
+    task_file = next((tmp_path / "tasks").glob("task_*.json")).name
+    return tmp_path, task_file
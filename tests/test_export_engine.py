@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""导出引擎：默认复制方式、中断后继续导出时处理期间重新标注的文件"""
+
+import json
+import os
+
+from export_engine import ExportEngine, MANIFEST_NAME
+
+
+def _sources(tmp_path, names):
+    src_dir = tmp_path / "src"
+    src_dir.mkdir()
+    for name in names:
+        (src_dir / name).write_bytes(name.encode())
+    return src_dir
+
+
+def test_default_strategy_copies(tmp_path):
+    src_dir = _sources(tmp_path, ["a.jpg"])
+    engine = ExportEngine(tmp_path / "out")
+    assert engine.strategy == 'copy'
+    result = engine.run([(src_dir / "a.jpg", "highQuality/a.jpg")])
+    assert result.done == 1
+    dst = tmp_path / "out" / "highQuality" / "a.jpg"
+    assert dst.read_bytes() == b"a.jpg"
+    assert not os.path.samefile(dst, src_dir / "a.jpg")
+
+
+def test_resume_moves_relabeled_and_removes_dropped(tmp_path):
+    src_dir = _sources(tmp_path, ["a.jpg", "b.jpg", "c.jpg"])
+    out = tmp_path / "out"
+    ExportEngine(out).run([(src_dir / "a.jpg", "highQuality/a.jpg"),
+                           (src_dir / "b.jpg", "lowQuality/b.jpg")])
+
+    # 中断后 a 被改标为 lowQuality，b 的标注被撤销（不再导出），c 是新标注的
+    result = ExportEngine(out).run([(src_dir / "a.jpg", "lowQuality/a.jpg"),
+                                    (src_dir / "c.jpg", "highQuality/c.jpg")])
+    assert (result.done, result.moved, result.removed, result.resumed) == (1, 1, 1, 0)
+    assert sorted(str(p.relative_to(out)) for p in out.rglob("*.jpg")) == ["highQuality/c.jpg", "lowQuality/a.jpg"]
+    assert (out / "lowQuality" / "a.jpg").read_bytes() == b"a.jpg"
+    assert set(ExportEngine(out).completed_entries()) == {"lowQuality/a.jpg", "highQuality/c.jpg"}
+
+    # b 又被标回来：按新文件重新导出
+    result = ExportEngine(out).run([(src_dir / "a.jpg", "lowQuality/a.jpg"),
+                                    (src_dir / "b.jpg", "lowQuality/b.jpg"),
+                                    (src_dir / "c.jpg", "highQuality/c.jpg")])
+    assert (result.done, result.moved, result.removed, result.resumed) == (1, 0, 0, 2)
+    assert (out / "lowQuality" / "b.jpg").exists()
+
+
+def test_old_manifest_without_source_removes_stale(tmp_path):
+    src_dir = _sources(tmp_path, ["a.jpg"])
+    out = tmp_path / "out"
+    (out / "highQuality").mkdir(parents=True)
+    (out / "highQuality" / "a.jpg").write_bytes(b"a.jpg")
+    (out / MANIFEST_NAME).write_text(json.dumps({'dst': "highQuality/a.jpg"}) + "\n", encoding='utf-8')
+
+    result = ExportEngine(out).run([(src_dir / "a.jpg", "lowQuality/a.jpg")])
+    assert (result.done, result.moved, result.removed) == (1, 0, 1)
+    assert not (out / "highQuality" / "a.jpg").exists()
+    assert (out / "lowQuality" / "a.jpg").exists()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""网格模式：按键针对显示的一页，显示还没跟上时排队（用 virtual_tk 无界面驱动 ImageLabeler）"""
+
+import pytest
+
+pytest.importorskip("PIL")
+
+import task_splitter
+import image_labeler
+from virtual_tk import install, VirtualRoot, VirtualEvent
+
+install(task_splitter, image_labeler)
+
+
+@pytest.fixture
+def grid_app(project):
+    project_dir, _ = project
+    root = VirtualRoot()
+    app = image_labeler.ImageLabeler(root, project_dir=project_dir, grid_size=(1, 3))
+    root.run_until(lambda: app.current_task is not None and app.current_image_path is not None)
+    press(app, 'g')
+    root.run_until(lambda: app.display_current())
+    # 每次标注时记下当时显示的一页
+    app.labeled = []
+    app.session.on('labels_changed', lambda event, data: app.labeled.append(
+        ([name for name, _ in data['records']], [path.name for path in app.grid_page_shown])))
+    yield root, app
+    app.on_close()
+
+
+def press(app, char, keysym=None, state=0):
+    app.handle_keypress(VirtualEvent(char, keysym, state))
+    app.handle_key_release(VirtualEvent(char, keysym, state))
+
+
+def settle(root, app):
+    root.run_until(lambda: not app.pending_commands and not app.dirty and app.display_current())
+
+
+def test_queued_page_labels_only_label_displayed_pages(grid_app):
+    root, app = grid_app
+    first_page = [path.name for path in app.grid_page_shown]
+    press(app, 'h')
+    press(app, 'h')  # 第二页还没显示：排队
+    assert len(app.pending_commands) == 1
+    settle(root, app)
+
+    assert len(app.labeled) == 2
+    for names, shown in app.labeled:
+        assert names == shown
+    assert app.labeled[0][0] == first_page
+    assert app.session.stats()['highQuality'] == 6
+
+
+def test_selection_keys_wait_for_the_next_page(grid_app):
+    root, app = grid_app
+    press(app, 'h')
+    # 下一页显示前按下的选择键针对下一页，不会改动还显示着的这一页
+    press(app, ' ', 'space')
+    press(app, '', 'Right')
+    press(app, 'L', state=0x1)  # Shift+L 只标注选中的格子
+    press(app, 'h')
+    settle(root, app)
+
+    assert len(app.labeled) == 3
+    second_page = app.labeled[1][1]
+    assert [names for names, _ in app.labeled[1:]] == [[second_page[1]], [second_page[2]]]
+    for names, shown in app.labeled:
+        assert set(names) <= set(shown)
+    assert second_page[0] not in app.session.label_state
+    assert app.session.label_state.get(second_page[1]) == 'lowQuality'
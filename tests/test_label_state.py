@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""标注状态的增量计数：check=True 时每次修改都完整重算校验"""
+
+import pytest
+
+from label_state import LabelState
+from label_session import LabelSession
+
+
+def test_counts_follow_label_relabel_and_remove():
+    state = LabelState(check=True)
+    assert state.set('a.jpg', 'highQuality') is None
+    assert state.set('b.jpg', 'skip') is None
+    assert state.set('a.jpg', 'lowQuality') == 'highQuality'
+    assert state.remove('b.jpg') == 'skip'
+    assert state.remove('missing.jpg') is None
+    assert (state.count('highQuality'), state.count('lowQuality'), state.count('skip')) == (0, 1, 0)
+    assert state.total == 1 and 'a.jpg' in state and 'b.jpg' not in state
+
+    state.reset({'x.jpg': 'skip', 'y.jpg': 'skip'})
+    assert state.count('skip') == 2 and state.count('lowQuality') == 0
+
+
+def test_verify_detects_counters_out_of_sync():
+    state = LabelState({'a.jpg': 'highQuality'}, check=True)
+    state.counts['highQuality'] += 1
+    with pytest.raises(RuntimeError):
+        state.verify()
+
+
+def test_session_label_undo_redo_and_bulk_label_keep_counts_consistent(project):
+    project_dir, task_file = project
+    session = LabelSession(project_dir, check_state=True)
+    try:
+        session.load_task(task_file)
+        names = [path.name for path in session.image_files]
+
+        # 逐张标注
+        for label in ('highQuality', 'lowQuality', 'skip', 'highQuality'):
+            session.label(label, advance=True)
+        assert session.stats() == {'highQuality': 2, 'lowQuality': 1, 'skip': 1, 'total': 4}
+
+        # 重新标注已标注的图片
+        session.go_to(0)
+        session.label('skip')
+        assert session.label_state.get(names[0]) == 'skip'
+        assert session.stats() == {'highQuality': 1, 'lowQuality': 1, 'skip': 2, 'total': 4}
+
+        # 撤销重新标注，再撤销一次原标注
+        session.undo()
+        assert session.label_state.get(names[0]) == 'highQuality'
+        session.undo()
+        assert names[3] not in session.label_state
+        session.redo()
+        assert session.label_state.get(names[3]) == 'highQuality'
+
+        # 批量标注（含已标注的图片）作为一次操作撤销
+        before = session.stats()
+        session.label_many(names[2:8], 'lowQuality')
+        assert session.stats() == {'highQuality': 1, 'lowQuality': 7, 'skip': 0, 'total': 8}
+        session.undo()
+        assert session.stats() == before
+
+        expected = dict(session.labeled_files)
+    finally:
+        session.close()
+
+    # 重新加载进度后的计数与内存中的一致
+    reloaded = LabelSession(project_dir, check_state=True)
+    try:
+        reloaded.load_task(task_file)
+        assert reloaded.labeled_files == expected
+    finally:
+        reloaded.close()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""日志式任务进度：日志重放、不完整的最后一行、压缩"""
+
+import json
+
+from progress_store import ProgressStore, read_progress, read_journal
+
+
+def make_store(tmp_path, **kwargs):
+    store = ProgressStore(tmp_path / "task_progress_t.json", task_id='t', **kwargs)
+    assert store.load() == {}
+    return store
+
+
+def test_journal_replay_applies_labels_relabels_and_undo(tmp_path):
+    store = make_store(tmp_path)
+    store.record('a.jpg', 'highQuality')
+    store.record('b.jpg', 'skip')
+    store.record('a.jpg', 'lowQuality')
+    store.record('b.jpg', None)
+    store.flush()
+
+    assert not store.snapshot_path.exists()
+    assert ProgressStore(store.snapshot_path).load() == {'a.jpg': 'lowQuality'}
+    assert read_progress(store.snapshot_path) == {'a.jpg': 'lowQuality'}
+
+
+def test_unflushed_records_are_not_on_disk(tmp_path):
+    store = make_store(tmp_path, flush_every=100, flush_interval=3600)
+    store.record('a.jpg', 'skip')
+    assert read_progress(store.snapshot_path) == {}
+    store.record_many([('b.jpg', 'highQuality'), ('c.jpg', 'lowQuality')])
+    assert read_progress(store.snapshot_path) == {'a.jpg': 'skip', 'b.jpg': 'highQuality', 'c.jpg': 'lowQuality'}
+
+
+def test_torn_last_line_is_skipped_read_only_and_truncated_by_owner(tmp_path):
+    store = make_store(tmp_path)
+    store.record_many([('a.jpg', 'highQuality')])
+    with open(store.journal_path, 'ab') as f:
+        f.write(b'{"f": "b.jpg", "l": "sk')
+    size = store.journal_path.stat().st_size
+
+    # 其他读取者：跳过半行，不修改文件（写入者可能仍在追加）
+    assert read_progress(store.snapshot_path) == {'a.jpg': 'highQuality'}
+    records, complete_size, torn = read_journal(store.journal_path)
+    assert torn and len(records) == 1 and complete_size < size
+    assert store.journal_path.stat().st_size == size
+
+    # 持有者：截掉半行，之后追加的记录可以正常读回
+    owner = ProgressStore(store.snapshot_path, task_id='t')
+    assert owner.load() == {'a.jpg': 'highQuality'}
+    assert store.journal_path.stat().st_size == complete_size
+    owner.record_many([('c.jpg', 'skip')])
+    assert read_progress(store.snapshot_path) == {'a.jpg': 'highQuality', 'c.jpg': 'skip'}
+
+
+def test_corrupt_middle_line_does_not_hide_later_records(tmp_path):
+    store = make_store(tmp_path)
+    store.record_many([('a.jpg', 'highQuality')])
+    with open(store.journal_path, 'ab') as f:
+        f.write(b'not json\n')
+    store.record_many([('b.jpg', 'skip')])
+    assert read_progress(store.snapshot_path) == {'a.jpg': 'highQuality', 'b.jpg': 'skip'}
+
+
+def test_compaction_writes_snapshot_and_clears_journal(tmp_path):
+    store = make_store(tmp_path, compact_every=3)
+    labeled_files = {}
+    for name, label in (('a.jpg', 'highQuality'), ('b.jpg', 'lowQuality'), ('c.jpg', 'skip')):
+        labeled_files[name] = label
+        store.record_many([(name, label)])
+    assert store.needs_compaction()
+
+    store.compact(labeled_files)
+    assert not store.journal_path.exists()
+    assert not store.needs_compaction()
+    with open(store.snapshot_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    assert data['task_id'] == 't' and data['labeled_files'] == labeled_files
+    assert not list(tmp_path.glob("*.tmp"))
+
+    # 压缩后继续追加：快照 + 新日志
+    store.record_many([('a.jpg', None)])
+    assert ProgressStore(store.snapshot_path).load() == {'b.jpg': 'lowQuality', 'c.jpg': 'skip'}
+
+
+def test_close_compacts_only_when_something_changed(tmp_path):
+    store = make_store(tmp_path)
+    store.close({})
+    assert not store.snapshot_path.exists()
+    store.record('a.jpg', 'skip')
+    store.close({'a.jpg': 'skip'})
+    assert not store.journal_path.exists()
+    assert read_progress(store.snapshot_path) == {'a.jpg': 'skip'}
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""任务租约：获取、过期接管、强制接管、正在创建的租约"""
+
+import os
+import json
+import time
+
+import pytest
+
+from task_lease import TaskLease, LeaseHeldError
+
+
+def write_lease(path, **fields):
+    holder = {'annotator': 'other', 'host': 'elsewhere', 'pid': 1, 'token': 'x',
+              'acquired': time.time(), 'expires': time.time() + 600}
+    holder.update(fields)
+    path.write_text(json.dumps(holder), encoding='utf-8')
+
+
+def test_acquire_renew_and_release(tmp_path):
+    path = tmp_path / "task.lease"
+    lease = TaskLease(path, annotator='me').acquire()
+    assert lease.held and lease.read()['annotator'] == 'me'
+
+    with pytest.raises(LeaseHeldError):
+        TaskLease(path, annotator='other').acquire()
+
+    lease.renew()
+    lease.release()
+    assert not path.exists()
+    assert TaskLease(path, annotator='other').acquire().held
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    path = tmp_path / "task.lease"
+    write_lease(path, expires=time.time() - 1)
+    lease = TaskLease(path, annotator='me').acquire()
+    assert lease.read()['token'] == lease.token
+
+
+def test_live_lease_needs_force(tmp_path):
+    path = tmp_path / "task.lease"
+    write_lease(path)
+    with pytest.raises(LeaseHeldError) as error:
+        TaskLease(path, annotator='me').acquire()
+    assert error.value.holder['annotator'] == 'other'
+
+    lease = TaskLease(path, annotator='me').acquire(force=True)
+    assert lease.read()['token'] == lease.token
+
+
+def test_taken_over_lease_cannot_be_renewed_or_released(tmp_path):
+    path = tmp_path / "task.lease"
+    first = TaskLease(path, annotator='first').acquire()
+    second = TaskLease(path, annotator='second').acquire(force=True)
+
+    with pytest.raises(LeaseHeldError):
+        first.renew()
+    first.release()
+    assert second.read()['token'] == second.token
+
+
+def test_lease_being_created_is_held(tmp_path):
+    # 其他实例刚以 O_EXCL 创建、还没写入内容的租约
+    path = tmp_path / "task.lease"
+    path.write_text('', encoding='utf-8')
+    with pytest.raises(LeaseHeldError):
+        TaskLease(path, annotator='me').acquire()
+
+    # 很久没有写完的（创建者已崩溃）可以接管
+    old = time.time() - 3600
+    os.utime(path, (old, old))
+    assert TaskLease(path, annotator='me').acquire().held
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""工作队列模式：只确认已写盘且仍是已标注状态的图片"""
+
+import pytest
+
+import work_queue
+from label_session import LabelSession
+
+
+@pytest.fixture
+def queue_session(project):
+    project_dir, _ = project
+    db = str(project_dir / "queue.db")
+    work_queue.main(['init', '--db', db, '--images-dir', str(project_dir / "images")])
+    session = LabelSession(project_dir, queue_spec=db, annotator='tester', check_state=True)
+    session.start_queue()
+    session.fetch_queue_chunk()
+    yield session, work_queue.WorkQueue(db)
+    session.close()
+
+
+def done(queue):
+    return queue.stats()['done']
+
+
+def test_undone_images_are_not_acked(queue_session):
+    session, queue = queue_session
+    session.label('highQuality', advance=True)
+    session.label('lowQuality', advance=True)
+    session.undo()
+    session.flush()
+    assert done(queue) == 1
+
+
+def test_acks_wait_for_a_successful_journal_write(queue_session):
+    session, queue = queue_session
+    store = session.progress_store
+    flush = store.flush
+
+    def failing_flush():
+        raise OSError("disk full")
+    store.flush = failing_flush
+    session.label('skip', advance=True)
+    session.flush()
+    assert done(queue) == 0
+
+    store.flush = flush
+    session.flush()
+    assert done(queue) == 1
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+撤销/重做历史
+只记录 (文件名, 之前的标签, 新标签, 队列位置)，撤销时直接回到原位置，不访问文件系统
+"""
+
+from collections import deque, namedtuple
+
+# 一次标注操作；previous为None表示之前未标注
+# propagated: 同一操作中一并标注的近似重复图片 ((文件名, 之前的标签), ...)，撤销/重做时一起处理
+LabelAction = namedtuple('LabelAction', ['filename', 'previous', 'label', 'index', 'propagated'],
+                         defaults=((),))
+
+
+class UndoHistory:
+    """多级撤销/重做
+
+    每条记录只是一个小元组，文件名字符串与 labeled_files 中的键共享，
+    因此深度可以设得很大。
+    """
+
+    def __init__(self, max_depth=1000):
+        self._undo = deque(maxlen=max_depth)
+        self._redo = []
+
+    @property
+    def max_depth(self):
+        return self._undo.maxlen
+
+    def record(self, filename, previous, label, index, propagated=()):
+        """记录一次新操作（会清空重做栈）"""
+        self._undo.append(LabelAction(filename, previous, label, index, tuple(propagated)))
+        self._redo.clear()
+
+    def undo(self):
+        """取出最近一次操作用于撤销，没有时返回None"""
+        if not self._undo:
+            return None
+        action = self._undo.pop()
+        self._redo.append(action)
+        return action
+
+    def redo(self):
+        """取出最近一次撤销的操作用于重做，没有时返回None"""
+        if not self._redo:
+            return None
+        action = self._redo.pop()
+        self._undo.append(action)
+        return action
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def clear(self):
+        """清空历史（切换任务或重建图片队列时调用）"""
+        self._undo.clear()
+        self._redo.clear()
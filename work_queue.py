@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+动态工作队列
+代替固定切分的任务文件：标注者按需领取一小块图片（带租约），标注后确认，
+租约过期未确认的图片自动回到队列，速度快的标注者自然领得多
+
+队列保存在SQLite数据库中（WAL模式）；多台机器共享时可用内置的本地HTTP服务代替直接访问数据库:
+    python work_queue.py init --db queue.db --images-dir images [--seed 42]
+    python work_queue.py init --db queue.db --task tasks/task_xxx.json ...
+    python work_queue.py status --db queue.db
+    python work_queue.py serve --db queue.db [--host 0.0.0.0] [--port 8765]
+
+标注端:
+    python image_labeler.py --queue queue.db            （同一台机器/本地磁盘）
+    python image_labeler.py --queue http://host:8765    （通过HTTP服务）
+"""
+
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+import urllib.request
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from task_manifest import open_manifest
+
+# 图片状态
+PENDING, LEASED, DONE = 0, 1, 2
+
+DEFAULT_CHUNK_SIZE = 50
+DEFAULT_LEASE_TTL = 600  # 秒
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    status INTEGER NOT NULL DEFAULT 0,
+    lease_id TEXT,
+    client TEXT,
+    expires REAL,
+    done_at REAL
+);
+CREATE INDEX IF NOT EXISTS items_status ON items(status, id);
+CREATE INDEX IF NOT EXISTS items_lease ON items(lease_id);
+CREATE TABLE IF NOT EXISTS leases (
+    lease_id TEXT PRIMARY KEY,
+    client TEXT NOT NULL,
+    issued REAL NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leases_client ON leases(client);
+"""
+
+
+class WorkQueue:
+    """SQLite工作队列（线程安全；多个进程可同时打开同一数据库）"""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._conn.close()
+
+    def _transaction(self, work):
+        """在写事务中执行 work(cursor)（BEGIN IMMEDIATE，多个进程之间串行）"""
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(cursor)
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+            return result
+
+    def add_images(self, names, batch_size=10000):
+        """加入图片（已存在的忽略），按批提交，返回新加入的数量"""
+        added = 0
+        batch = []
+
+        def insert(cursor):
+            before = self._conn.total_changes
+            cursor.executemany("INSERT OR IGNORE INTO items (name) VALUES (?)", ((name,) for name in batch))
+            return self._conn.total_changes - before
+
+        for name in names:
+            batch.append(name)
+            if len(batch) >= batch_size:
+                added += self._transaction(insert)
+                batch = []
+        if batch:
+            added += self._transaction(insert)
+        return added
+
+    @staticmethod
+    def _reclaim(cursor, now):
+        cursor.execute("UPDATE items SET status = ?, lease_id = NULL, client = NULL, expires = NULL "
+                       "WHERE status = ? AND expires < ?", (PENDING, LEASED, now))
+        return cursor.rowcount
+
+    def reclaim(self):
+        """把过期租约中未确认的图片放回队列，返回数量"""
+        return self._transaction(lambda cursor: self._reclaim(cursor, time.time()))
+
+    def lease(self, client, count=DEFAULT_CHUNK_SIZE, ttl=DEFAULT_LEASE_TTL):
+        """领取最多count张图片，返回 {lease_id, names, expires}（队列空时names为空列表）"""
+        def work(cursor):
+            now = time.time()
+            self._reclaim(cursor, now)
+            rows = cursor.execute("SELECT id, name FROM items WHERE status = ? ORDER BY id LIMIT ?",
+                                  (PENDING, count)).fetchall()
+            if not rows:
+                return {'lease_id': None, 'names': [], 'expires': None}
+            lease_id = uuid.uuid4().hex
+            expires = now + ttl
+            cursor.executemany("UPDATE items SET status = ?, lease_id = ?, client = ?, expires = ? WHERE id = ?",
+                               ((LEASED, lease_id, client, expires, item_id) for item_id, _ in rows))
+            cursor.execute("INSERT INTO leases (lease_id, client, issued, expires) VALUES (?, ?, ?, ?)",
+                           (lease_id, client, now, expires))
+            return {'lease_id': lease_id, 'names': [name for _, name in rows], 'expires': expires}
+
+        return self._transaction(work)
+
+    def ack(self, lease_id, names, client=None):
+        """确认图片已标注，返回新确认的数量
+
+        租约过期后迟到的确认仍然有效：图片已经标注过，不必再发给别人。
+        """
+        def work(cursor):
+            now = time.time()
+            owner = client
+            if owner is None:
+                row = cursor.execute("SELECT client FROM leases WHERE lease_id = ?", (lease_id,)).fetchone()
+                owner = row[0] if row else None
+            before = self._conn.total_changes
+            cursor.executemany("UPDATE items SET status = ?, done_at = ?, client = ?, expires = NULL "
+                               "WHERE name = ? AND status != ?",
+                               ((DONE, now, owner, name, DONE) for name in names))
+            return self._conn.total_changes - before
+
+        return self._transaction(work)
+
+    def renew(self, lease_id, ttl=DEFAULT_LEASE_TTL):
+        """延长租约，返回租约中仍未确认的图片数（0表示租约已失效或已完成）"""
+        def work(cursor):
+            expires = time.time() + ttl
+            cursor.execute("UPDATE leases SET expires = ? WHERE lease_id = ?", (expires, lease_id))
+            cursor.execute("UPDATE items SET expires = ? WHERE lease_id = ? AND status = ?",
+                           (expires, lease_id, LEASED))
+            return cursor.rowcount
+
+        return self._transaction(work)
+
+    def release(self, lease_id):
+        """归还租约中未确认的图片，返回数量"""
+        def work(cursor):
+            cursor.execute("UPDATE items SET status = ?, lease_id = NULL, client = NULL, expires = NULL "
+                           "WHERE lease_id = ? AND status = ?", (PENDING, lease_id, LEASED))
+            returned = cursor.rowcount
+            cursor.execute("UPDATE leases SET expires = ? WHERE lease_id = ?", (time.time(), lease_id))
+            return returned
+
+        return self._transaction(work)
+
+    def stats(self):
+        """队列进度和每个标注者的速度（张/小时，按首次领取到最后一次确认计算）"""
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+            done_rows = self._conn.execute("SELECT client, COUNT(*), MAX(done_at) FROM items "
+                                           "WHERE status = ? GROUP BY client", (DONE,)).fetchall()
+            first_lease = dict(self._conn.execute("SELECT client, MIN(issued) FROM leases GROUP BY client").fetchall())
+
+        clients = {}
+        for client, done, last_done in done_rows:
+            started = first_lease.get(client, last_done)
+            hours = max(last_done - started, 60) / 3600
+            clients[client or 'unknown'] = {'done': done, 'images_per_hour': round(done / hours, 1)}
+        return {
+            'pending': counts.get(PENDING, 0),
+            'leased': counts.get(LEASED, 0),
+            'done': counts.get(DONE, 0),
+            'clients': clients,
+        }
+
+
+class LocalQueueClient:
+    """直接访问本地SQLite队列的客户端"""
+
+    def __init__(self, db_path, client):
+        self.queue = WorkQueue(db_path)
+        self.client = client
+        self.name = Path(db_path).stem
+
+    def lease(self, count=DEFAULT_CHUNK_SIZE, ttl=DEFAULT_LEASE_TTL):
+        return self.queue.lease(self.client, count, ttl)
+
+    def ack(self, lease_id, names):
+        return self.queue.ack(lease_id, names, self.client)
+
+    def renew(self, lease_id, ttl=DEFAULT_LEASE_TTL):
+        return self.queue.renew(lease_id, ttl)
+
+    def release(self, lease_id):
+        return self.queue.release(lease_id)
+
+    def stats(self):
+        return self.queue.stats()
+
+    def close(self):
+        self.queue.close()
+
+
+class HttpQueueClient:
+    """通过 work_queue.py serve 访问队列的客户端"""
+
+    def __init__(self, url, client, timeout=30):
+        self.url = url.rstrip('/')
+        self.client = client
+        self.timeout = timeout
+        self.name = self.url.split('//', 1)[-1].replace(':', '_').replace('/', '_')
+
+    def _call(self, path, payload=None):
+        data = None if payload is None else json.dumps(payload).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=data,
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def lease(self, count=DEFAULT_CHUNK_SIZE, ttl=DEFAULT_LEASE_TTL):
+        return self._call('/lease', {'client': self.client, 'count': count, 'ttl': ttl})
+
+    def ack(self, lease_id, names):
+        return self._call('/ack', {'client': self.client, 'lease_id': lease_id, 'names': list(names)})['acked']
+
+    def renew(self, lease_id, ttl=DEFAULT_LEASE_TTL):
+        return self._call('/renew', {'lease_id': lease_id, 'ttl': ttl})['remaining']
+
+    def release(self, lease_id):
+        return self._call('/release', {'lease_id': lease_id})['returned']
+
+    def stats(self):
+        return self._call('/stats')
+
+    def close(self):
+        pass
+
+
+def open_queue(spec, client):
+    """按地址打开队列客户端：http(s):// 开头用HTTP，否则视为SQLite数据库路径"""
+    if spec.startswith(('http://', 'https://')):
+        return HttpQueueClient(spec, client)
+    return LocalQueueClient(spec, client)
+
+
+class QueueSession:
+    """标注端持有的租约和待确认的图片（与界面无关）
+
+    add_lease / mark_labeled / take_acks / restore_acks 只操作内存，在界面线程调用；
+    ack / renew / release 访问队列，可放到后台线程执行。
+    """
+
+    def __init__(self, client, chunk_size=DEFAULT_CHUNK_SIZE, ttl=DEFAULT_LEASE_TTL):
+        self.client = client
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+        self.exhausted = False  # 队列中已没有待领取的图片
+        self._leases = {}  # lease_id -> 尚未确认的文件名集合
+        self._lease_of = {}  # 文件名 -> lease_id
+        self._names = []  # 领取到的全部文件名（按领取顺序）
+        self._pending_acks = {}  # lease_id -> 待确认的文件名列表
+        self._lock = threading.Lock()
+
+    def fetch(self):
+        """领取下一块图片（访问队列），返回 lease 结果"""
+        return self.client.lease(self.chunk_size, self.ttl)
+
+    def add_lease(self, result):
+        """登记领取到的一块图片，返回其中的文件名"""
+        names = result['names']
+        if not names:
+            self.exhausted = True
+            return []
+        with self._lock:
+            self._leases[result['lease_id']] = set(names)
+            for name in names:
+                self._lease_of[name] = result['lease_id']
+            self._names.extend(names)
+        return names
+
+    def names(self):
+        """领取到的全部文件名"""
+        return list(self._names)
+
+    def mark_labeled(self, name):
+        """记录一张图片已标注（等待下次确认）"""
+        lease_id = self._lease_of.get(name)
+        if lease_id is not None:
+            self._pending_acks.setdefault(lease_id, []).append(name)
+
+    def take_acks(self):
+        """取出待确认的图片 {lease_id: [文件名]}"""
+        pending, self._pending_acks = self._pending_acks, {}
+        return pending
+
+    def restore_acks(self, pending):
+        """把没能确认的图片放回待确认列表（下次再确认）"""
+        for lease_id, names in pending.items():
+            self._pending_acks.setdefault(lease_id, []).extend(names)
+
+    def ack(self, pending):
+        """向队列确认已标注的图片，全部确认的租约不再续期"""
+        for lease_id, names in pending.items():
+            self.client.ack(lease_id, names)
+            with self._lock:
+                remaining = self._leases.get(lease_id)
+                if remaining is not None:
+                    remaining.difference_update(names)
+                    if not remaining:
+                        del self._leases[lease_id]
+
+    def renew(self):
+        """续期所有未完成的租约"""
+        with self._lock:
+            lease_ids = list(self._leases)
+        for lease_id in lease_ids:
+            self.client.renew(lease_id, self.ttl)
+
+    def release(self):
+        """归还所有未完成租约中未标注的图片"""
+        with self._lock:
+            lease_ids = list(self._leases)
+            self._leases.clear()
+        for lease_id in lease_ids:
+            self.client.release(lease_id)
+
+
+def make_handler(queue):
+    """HTTP服务的请求处理类（JSON进出）"""
+
+    class QueueRequestHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._reply(200, queue.stats())
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if self.path == '/lease':
+                    result = queue.lease(payload['client'], int(payload.get('count', DEFAULT_CHUNK_SIZE)),
+                                         float(payload.get('ttl', DEFAULT_LEASE_TTL)))
+                elif self.path == '/ack':
+                    result = {'acked': queue.ack(payload['lease_id'], payload['names'], payload.get('client'))}
+                elif self.path == '/renew':
+                    result = {'remaining': queue.renew(payload['lease_id'],
+                                                       float(payload.get('ttl', DEFAULT_LEASE_TTL)))}
+                elif self.path == '/release':
+                    result = {'returned': queue.release(payload['lease_id'])}
+                else:
+                    self._reply(404, {'error': 'not found'})
+                    return
+            except (KeyError, ValueError) as e:
+                self._reply(400, {'error': str(e)})
+                return
+            self._reply(200, result)
+
+        def log_message(self, format, *args):
+            pass
+
+    return QueueRequestHandler
+
+
+def format_stats(stats):
+    """队列状态文本"""
+    total = stats['pending'] + stats['leased'] + stats['done']
+    percent = stats['done'] / total * 100 if total else 0.0
+    lines = [f"Queue: {stats['done']}/{total} done ({percent:.1f}%), "
+             f"{stats['leased']} leased, {stats['pending']} pending"]
+    for client, info in sorted(stats['clients'].items(), key=lambda item: -item[1]['done']):
+        lines.append(f"  {client:30s} {info['done']:8d} done  {info['images_per_hour']:8.1f} images/hour")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="Work queue for labeling")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    init_parser = subparsers.add_parser('init', help="Create a queue or add images to it")
+    init_parser.add_argument('--db', required=True)
+    source = init_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--images-dir', help="Add every image in this directory")
+    source.add_argument('--task', nargs='+', help="Add the images of these task files")
+    init_parser.add_argument('--seed', default=None, help="Shuffle directory images with this seed")
+
+    status_parser = subparsers.add_parser('status', help="Show progress and per-annotator speed")
+    status_parser.add_argument('--db', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help="Serve the queue over HTTP")
+    serve_parser.add_argument('--db', required=True)
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+
+    args = parser.parse_args(argv)
+    queue = WorkQueue(args.db)
+
+    if args.command == 'init':
+        if args.images_dir:
+            from task_splitter import iter_image_names, ordered_names
+            names = ordered_names(iter_image_names(args.images_dir), args.seed is not None, args.seed)
+            added = queue.add_images(names)
+        else:
+            added = 0
+            for task_file in args.task:
+                manifest = open_manifest(task_file)
+                try:
+                    added += queue.add_images(manifest)
+                finally:
+                    manifest.close()
+        print(f"Added {added} images to {args.db}")
+        print(format_stats(queue.stats()))
+    elif args.command == 'status':
+        print(format_stats(queue.stats()))
+    elif args.command == 'serve':
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(queue))
+        print(f"Serving {args.db} on http://{args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())